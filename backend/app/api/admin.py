@@ -5,7 +5,7 @@ from datetime import datetime
 
 from app.core.database import get_db
 from app.api.deps import get_current_active_user
-from app.models.models import User, UserRole, Alert
+from app.models.models import User, UserRole, Alert, NotificationJob, NotificationDeadLetter
 from app.schemas.alert_schemas import AlertCreate
 from app.services.alert_service import AlertService
 
@@ -129,4 +129,107 @@ async def get_sync_status(
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get sync status: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/notifications/delivery")
+async def get_delivery_stats(
+    admin_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Get notification delivery worker and job queue statistics (admin only)."""
+    from app.services.message_renderer import message_renderer
+    from app.services.notification_dedup import notification_dedup
+    from app.services.notification_delivery import delivery_pool
+    from app.services.notification_queue import notification_queue
+    from app.services.provider_rate_limiter import provider_rate_limiter
+    
+    pool_stats = delivery_pool.stats()
+    queue_stats = notification_queue.stats(db)
+    
+    return {
+        **pool_stats,
+        "queue": queue_stats,
+        "rate_limits": await provider_rate_limiter.stats(),
+        "estimated_drain_seconds": await provider_rate_limiter.drain_estimates(
+            queue_stats["pending_by_channel"],
+            pool_stats["batch_size"]
+        ),
+        "render_cache": message_renderer.stats(),
+        "dedup": notification_dedup.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@router.get("/notifications/jobs/{job_id}")
+async def get_delivery_job(
+    job_id: str,
+    admin_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Get the status of a notification delivery job (admin only)."""
+    from app.services.notification_delivery import delivery_pool
+    
+    job = db.query(NotificationJob).filter(NotificationJob.id == job_id).first()
+    if job:
+        return {
+            "job_id": job.id,
+            "channel": job.channel,
+            "notification_id": job.notification_id,
+            "status": job.status,
+            "provider_id": job.provider_id,
+            "error": job.last_error,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "next_attempt_at": job.next_attempt_at.isoformat() if job.next_attempt_at else None,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None
+        }
+    
+    # Verification sends skip the queue and are only tracked in memory
+    pool_job = delivery_pool.get_job(job_id)
+    if not pool_job:
+        raise HTTPException(status_code=404, detail="Delivery job not found")
+    
+    return pool_job.to_dict()
+
+@router.get("/notifications/dead-letters")
+async def get_dead_letters(
+    limit: int = 100,
+    admin_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """List notification jobs that ran out of delivery attempts (admin only)."""
+    dead_letters = db.query(NotificationDeadLetter).filter(
+        NotificationDeadLetter.requeued_at.is_(None)
+    ).order_by(NotificationDeadLetter.failed_at.desc()).limit(limit).all()
+    
+    return {
+        "dead_letters": [
+            {
+                "id": dead_letter.id,
+                "job_id": dead_letter.job_id,
+                "user_id": dead_letter.user_id,
+                "alert_id": dead_letter.alert_id,
+                "channel": dead_letter.channel,
+                "attempts": dead_letter.attempts,
+                "last_error": dead_letter.last_error,
+                "failed_at": dead_letter.failed_at.isoformat() if dead_letter.failed_at else None
+            }
+            for dead_letter in dead_letters
+        ],
+        "count": len(dead_letters)
+    }
+
+@router.post("/notifications/dead-letters/{dead_letter_id}/requeue")
+async def requeue_dead_letter(
+    dead_letter_id: str,
+    admin_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Retry a dead-lettered notification job from scratch (admin only)."""
+    from app.services.notification_queue import notification_queue
+    
+    job = notification_queue.requeue(db, dead_letter_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Dead letter not found or already requeued")
+    
+    return {"job_id": job.id, "status": job.status}
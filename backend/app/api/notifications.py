@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 import logging
+import uuid
 
 from app.core.database import get_db
 from app.core.auth import get_current_user, check_resource_limit, require_feature
 from app.models.models import User, NotificationChannel, AlertSeverity
+from app.services import push_devices
 from app.services.notification_service import NotificationService
 from pydantic import BaseModel, EmailStr
 
@@ -18,16 +20,22 @@ class NotificationChannelCreate(BaseModel):
     destination: str
     severity_threshold: AlertSeverity = AlertSeverity.MINOR
     categories: List[str] = []
+    digest_minutes: Optional[int] = None  # Repeat window per event; None uses the channel default, 0 sends every alert
 
 class NotificationChannelUpdate(BaseModel):
     is_active: bool = None
     severity_threshold: AlertSeverity = None
     categories: List[str] = None
     is_primary: bool = None
+    digest_minutes: int = None
 
 class VerifyChannelRequest(BaseModel):
     code: str
 
+class PushDeviceRegister(BaseModel):
+    token: str
+    platform: str = "fcm"  # fcm (Android and web) or apns
+
 @router.get("/channels")
 async def get_notification_channels(
     current_user: User = Depends(get_current_user),
@@ -47,6 +55,7 @@ async def get_notification_channels(
         "is_active": channel.is_active,
         "severity_threshold": channel.severity_threshold.value if channel.severity_threshold else None,
         "categories": channel.categories or [],
+        "digest_minutes": channel.digest_minutes,
         "last_used": channel.last_used.isoformat() if channel.last_used else None
     } for channel in channels]
 
@@ -83,6 +92,7 @@ async def create_notification_channel(
         destination=channel_data.destination,
         severity_threshold=channel_data.severity_threshold,
         categories=channel_data.categories,
+        digest_minutes=channel_data.digest_minutes,
         is_verified=False,
         is_active=False  # Inactive until verified
     )
@@ -138,6 +148,8 @@ async def update_notification_channel(
         channel.severity_threshold = update_data.severity_threshold
     if update_data.categories is not None:
         channel.categories = update_data.categories
+    if update_data.digest_minutes is not None:
+        channel.digest_minutes = update_data.digest_minutes
     if update_data.is_primary is not None:
         # Only one primary channel per type
         if update_data.is_primary:
@@ -261,6 +273,49 @@ async def delete_notification_channel(
     
     return {"status": "success", "message": "Channel deleted"}
 
+@router.get("/devices")
+async def get_push_devices(
+    current_user: User = Depends(get_current_user)
+) -> List[Dict]:
+    """Get user's registered push devices"""
+    return [{
+        "token": device["token"],
+        "platform": device["platform"],
+        "registered_at": device.get("registered_at")
+    } for device in push_devices.devices(current_user)]
+
+@router.post("/devices")
+async def register_push_device(
+    device: PushDeviceRegister,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """Register a device for push notifications; available on every tier"""
+    if device.platform not in push_devices.PUSH_PLATFORMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported push platform. Use one of: {', '.join(push_devices.PUSH_PLATFORMS)}"
+        )
+    
+    entry = push_devices.register(current_user, device.token, device.platform)
+    db.commit()
+    
+    return {"status": "success", "device": entry}
+
+@router.delete("/devices/{token}")
+async def unregister_push_device(
+    token: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """Stop push notifications to a device"""
+    if not push_devices.unregister(current_user, token):
+        raise HTTPException(status_code=404, detail="Device not found")
+    
+    db.commit()
+    
+    return {"status": "success", "message": "Device removed"}
+
 @router.get("/test")
 async def send_test_notification(
     channel_id: str,
@@ -285,7 +340,7 @@ async def send_test_notification(
     # Create a test alert
     from app.models.models import Alert, AlertCategory
     test_alert = Alert(
-        id="test",
+        id=f"test-{uuid.uuid4()}",  # Fresh id so repeated tests are not deduplicated
         title="Test Emergency Alert",
         description="This is a test alert to verify your notification settings are working correctly.",
         severity=AlertSeverity.MODERATE,
@@ -300,9 +355,9 @@ async def send_test_notification(
     
     try:
         if channel.channel_type == "email":
-            await notification_service._send_email_notification(db, current_user, test_alert, channel)
+            await notification_service._queue_delivery(notification_service._email_job(current_user, test_alert, channel))
         elif channel.channel_type == "sms":
-            await notification_service._send_sms_notification(db, current_user, test_alert, channel)
+            await notification_service._queue_delivery(notification_service._sms_job(current_user, test_alert, channel))
         else:
             raise HTTPException(
                 status_code=400,
@@ -60,7 +60,23 @@ class Settings(BaseSettings):
     
     # Performance
     MAX_WEBSOCKET_CONNECTIONS: int = 10000
+    WEBSOCKET_MAX_CONNECTIONS_PER_USER: int = 10  # Oldest socket is closed beyond this
+    WEBSOCKET_LOCATION_BUCKET_DEGREES: float = 0.1  # ~7 mile grid for location subscriptions
+    WEBSOCKET_SEND_QUEUE_SIZE: int = 100  # Outbound messages buffered per connection
+    WEBSOCKET_SEND_TIMEOUT_SECONDS: float = 5.0
+    WEBSOCKET_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # drop_oldest or evict
+    WEBSOCKET_BACKPLANE: str = "memory"  # memory (single worker) or redis
+    WEBSOCKET_BACKPLANE_CELL_DEGREES: float = 1.0  # Geo channel grid, ~69 miles
+    WEBSOCKET_REPLAY_BUFFER_SIZE: int = 1000  # Broadcasts kept for resume after reconnect
+    WEBSOCKET_ADMIN_STATS_INTERVAL_SECONDS: float = 1.0  # Admin dashboard stats tick
+    WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS: float = 30.0  # Idle time before the server pings
+    WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS: float = 10.0  # Wait for any reply before closing
     ALERT_CACHE_TTL_SECONDS: int = 300
+    USER_INDEX_REFRESH_SECONDS: int = 300  # Full reload of in-memory targeting indexes, catches changes made outside the ORM
+    ALERT_LATENCY_SLO_SECONDS: dict = {"extreme": 120, "severe": 300, "moderate": 600, "minor": 900}  # Source origin to delivery
+    ALERT_LATENCY_SLO_TARGET: float = 0.95  # Share of deliveries that must meet their SLO
+    ALERT_LATENCY_WINDOW_HOURS: int = 24  # Deliveries summarized on the analytics dashboard
+    ALERT_LATENCY_SAMPLE_LIMIT: int = 100000  # Most recent deliveries read for dashboard percentiles
     
     # Hawaii-specific settings
     HAWAII_BOUNDS: dict = {
@@ -97,10 +113,63 @@ class Settings(BaseSettings):
     TWILIO_ACCOUNT_SID: str = ""
     TWILIO_AUTH_TOKEN: str = ""
     TWILIO_PHONE_NUMBER: str = ""
+    TWILIO_API_URL: str = "https://api.twilio.com"
+    TWILIO_NOTIFY_SERVICE_SID: str = ""  # Enables bulk SMS through Twilio Notify
+    TWILIO_NOTIFY_API_URL: str = "https://notify.twilio.com"
     
     # SendGrid Email Settings
     SENDGRID_API_KEY: str = ""
     SENDGRID_FROM_EMAIL: str = "alerts@hawaii-emergency.com"
+    SENDGRID_API_URL: str = "https://api.sendgrid.com"
+    
+    # Push Notification Settings
+    FCM_PROJECT_ID: str = ""
+    FCM_CLIENT_EMAIL: str = ""  # Service account that signs OAuth token requests
+    FCM_PRIVATE_KEY: str = ""  # Service account PEM key
+    FCM_API_URL: str = "https://fcm.googleapis.com"
+    FCM_TOKEN_URL: str = "https://oauth2.googleapis.com/token"
+    APNS_KEY_ID: str = ""
+    APNS_TEAM_ID: str = ""
+    APNS_PRIVATE_KEY: str = ""  # .p8 signing key contents
+    APNS_TOPIC: str = ""  # iOS app bundle id
+    APNS_API_URL: str = "https://api.push.apple.com"
+    
+    # Notification Delivery
+    NOTIFICATION_EMAIL_CONCURRENCY: int = 20  # Concurrent provider requests per channel
+    NOTIFICATION_SMS_CONCURRENCY: int = 10
+    NOTIFICATION_VOICE_CONCURRENCY: int = 5
+    NOTIFICATION_PUSH_CONCURRENCY: int = 10
+    NOTIFICATION_QUEUE_SIZE: int = 10000  # Batches buffered per channel before submit waits
+    NOTIFICATION_HTTP_TIMEOUT_SECONDS: float = 10.0
+    NOTIFICATION_EMAIL_BATCH_SIZE: int = 1000  # Recipients per SendGrid request
+    NOTIFICATION_SMS_BATCH_SIZE: int = 1000  # Recipients per Twilio Notify request
+    NOTIFICATION_PUSH_BATCH_SIZE: int = 500  # Device tokens per push batch
+    NOTIFICATION_PUSH_STREAMS: int = 100  # Concurrent requests per push batch, multiplexed over HTTP/2
+    NOTIFICATION_QUEUE_CONSUMER: bool = True  # Consume the job queue inside API processes
+    NOTIFICATION_QUEUE_BATCH_SIZE: int = 5000  # Most jobs claimed per channel and poll
+    NOTIFICATION_QUEUE_POLL_SECONDS: float = 1.0
+    NOTIFICATION_QUEUE_LEASE_SECONDS: int = 120  # Claimed jobs are reclaimed after this
+    NOTIFICATION_WORKER_METRICS_PORT: int = 0  # Prometheus port of standalone queue workers, 0 disables
+    NOTIFICATION_MAX_ATTEMPTS: int = 5
+    NOTIFICATION_RETRY_BASE_SECONDS: float = 5.0  # Doubles with every failed attempt
+    NOTIFICATION_RETRY_MAX_SECONDS: float = 900.0
+    NOTIFICATION_RENDER_CACHE_SIZE: int = 1024  # Rendered (alert, language, channel) variants kept
+    NOTIFICATION_SENDGRID_REQUESTS_PER_SECOND: float = 10.0  # Each request carries up to a batch of emails
+    NOTIFICATION_TWILIO_SMS_PER_SECOND: float = 100.0  # Messages per second per sender number or Notify service
+    NOTIFICATION_TWILIO_CALLS_PER_SECOND: float = 1.0  # Calls per second per caller number
+    NOTIFICATION_PUSH_PER_SECOND: float = 2000.0  # Device tokens per second per push service
+    NOTIFICATION_RATE_BURST_SECONDS: float = 1.0  # Bucket capacity in seconds of the rate
+    NOTIFICATION_RATE_RECOVERY_SECONDS: float = 30.0  # Time for a throttled bucket to recover its full rate
+    NOTIFICATION_RATE_LIMIT_DEFAULT_RETRY_SECONDS: float = 5.0  # Pause after a 429 without Retry-After
+    NOTIFICATION_RATE_LIMIT_RETRIES: int = 3  # 429s retried in place before the job goes back to the queue
+    NOTIFICATION_RATE_LIMIT_SHARED: bool = True  # Share buckets across workers through Redis
+    NOTIFICATION_CRITICAL_CATEGORIES: list = ["tsunami"]  # Always delivered in the critical lane
+    NOTIFICATION_LANE_RESERVED_WORKERS: dict = {"critical": 2, "high": 1}  # Per channel, serve only that lane and above
+    NOTIFICATION_LANE_MIN_SHARE: float = 0.1  # Share of each claim given to the longest-waiting jobs of any lane
+    NOTIFICATION_DEDUP_WINDOW_MINUTES: dict = {"sms": 60, "voice": 60, "email": 30, "push": 15}  # One send per event group, unless it escalates
+    NOTIFICATION_DEDUP_MAX_WINDOW_MINUTES: int = 1440  # Cap on per-channel digest windows
+    NOTIFICATION_DEDUP_BLOOM_CAPACITY: int = 1000000  # Recent sends tracked per Bloom filter generation
+    NOTIFICATION_DEDUP_BLOOM_ERROR_RATE: float = 0.01
     
     class Config:
         case_sensitive = True
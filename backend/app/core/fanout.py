@@ -0,0 +1,206 @@
+"""
+WebSocket fan-out backplane
+Carries broadcasts between uvicorn workers and containers so each process
+delivers them to its own sockets. The in-process backend serves
+single-worker deployments; the Redis backend uses pub/sub channels per
+county and geo cell, subscribed only while the worker has local
+connections on them. Both number broadcasts and keep a bounded replay log
+for clients resuming after a reconnect
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+ALL_CHANNEL = "ws:alerts:all"
+SEQUENCE_KEY = "ws:alerts:seq"
+REPLAY_KEY = "ws:alerts:replay"
+
+# Envelopes a worker remembers, so an alert published to several channels
+# it listens on is only delivered once
+RECENT_ENVELOPES = 4096
+
+DeliverCallback = Callable[[Dict], Awaitable[int]]
+
+
+def county_channel(county: str) -> str:
+    return f"ws:county:{county}"
+
+
+def geo_channel(cell_lat: int, cell_lon: int) -> str:
+    return f"ws:geo:{cell_lat}:{cell_lon}"
+
+
+class InProcessBackplane:
+    """Single-process fan-out: published envelopes are delivered directly"""
+
+    name = "memory"
+
+    def __init__(self, deliver: DeliverCallback, replay_size: int = 1000):
+        self._deliver = deliver
+        self._sequence = 0
+        self._replay: Deque[Dict] = deque(maxlen=replay_size)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, channel: str):
+        pass
+
+    def unsubscribe(self, channel: str):
+        pass
+
+    async def sequence(self, envelope: Dict) -> int:
+        """Number an envelope and append it to the replay log."""
+        self._sequence += 1
+        envelope["message"]["seq"] = self._sequence
+        self._replay.append(envelope)
+        return self._sequence
+
+    async def latest_sequence(self) -> int:
+        return self._sequence
+
+    async def replay_since(self, seq: int) -> Optional[List[Dict]]:
+        """Envelopes after seq, or None when some of them are no longer kept."""
+        if seq >= self._sequence:
+            return [] if seq == self._sequence else None
+        if not self._replay or seq < self._replay[0]["message"]["seq"] - 1:
+            return None
+        return [env for env in self._replay if env["message"]["seq"] > seq]
+
+    async def publish(self, channels: List[str], envelope: Dict) -> int:
+        """Deliver locally; returns the number of local recipients."""
+        return await self._deliver(envelope)
+
+
+class RedisBackplane:
+    """Cross-worker fan-out over Redis pub/sub"""
+
+    name = "redis"
+
+    def __init__(self, url: str, deliver: DeliverCallback, replay_size: int = 1000):
+        self.url = url
+        self._deliver = deliver
+        self.replay_size = replay_size
+        self._redis: Optional[aioredis.Redis] = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._commands: Deque = deque()
+        self._recent_ids: Deque[str] = deque()
+        self._recent_set: Set[str] = set()
+
+    async def start(self):
+        self._redis = aioredis.from_url(self.url, decode_responses=True)
+        await self._redis.ping()
+
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(ALL_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("Redis WebSocket backplane started")
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+
+        if self._pubsub:
+            await self._pubsub.close()
+        if self._redis:
+            await self._redis.close()
+
+    def subscribe(self, channel: str):
+        # Applied by the listener task, which owns the pub/sub connection
+        self._commands.append(("subscribe", channel))
+
+    def unsubscribe(self, channel: str):
+        self._commands.append(("unsubscribe", channel))
+
+    async def sequence(self, envelope: Dict) -> int:
+        """Number an envelope from the shared counter and append it to the replay log."""
+        from app.core.websocket import encode_frame
+
+        seq = await self._redis.incr(SEQUENCE_KEY)
+        envelope["message"]["seq"] = seq
+
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(REPLAY_KEY, {encode_frame(envelope): seq})
+        pipe.zremrangebyrank(REPLAY_KEY, 0, -(self.replay_size + 1))
+        await pipe.execute()
+        return seq
+
+    async def latest_sequence(self) -> int:
+        return int(await self._redis.get(SEQUENCE_KEY) or 0)
+
+    async def replay_since(self, seq: int) -> Optional[List[Dict]]:
+        """Envelopes after seq, or None when some of them are no longer kept."""
+        latest = await self.latest_sequence()
+        if seq >= latest:
+            return [] if seq == latest else None
+
+        oldest = await self._redis.zrange(REPLAY_KEY, 0, 0, withscores=True)
+        if not oldest or seq < int(oldest[0][1]) - 1:
+            return None
+
+        entries = await self._redis.zrangebyscore(REPLAY_KEY, f"({seq}", "+inf")
+        return [json.loads(entry) for entry in entries]
+
+    async def publish(self, channels: List[str], envelope: Dict) -> int:
+        """Publish to every channel; returns the number of worker subscriptions reached."""
+        from app.core.websocket import encode_frame
+
+        data = encode_frame(envelope)
+        pipe = self._redis.pipeline(transaction=False)
+        for channel in channels:
+            pipe.publish(channel, data)
+        results = await pipe.execute()
+        return sum(results)
+
+    async def _listen(self):
+        while True:
+            try:
+                while self._commands:
+                    action, channel = self._commands.popleft()
+                    await getattr(self._pubsub, action)(channel)
+
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=0.1
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis backplane error: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if not message:
+                continue
+
+            try:
+                envelope = json.loads(message["data"])
+                if self._seen(envelope["id"]):
+                    continue
+                await self._deliver(envelope)
+            except Exception as e:
+                logger.error(f"Error delivering backplane message: {e}")
+
+    def _seen(self, envelope_id: str) -> bool:
+        if envelope_id in self._recent_set:
+            return True
+
+        self._recent_ids.append(envelope_id)
+        self._recent_set.add(envelope_id)
+        if len(self._recent_ids) > RECENT_ENVELOPES:
+            self._recent_set.discard(self._recent_ids.popleft())
+        return False
@@ -0,0 +1,34 @@
+import logging
+from typing import Optional
+
+import redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis_client: Optional[redis.Redis] = None
+_redis_checked = False
+
+
+def get_redis_client() -> Optional[redis.Redis]:
+    """
+    Get the shared Redis client, connecting on first use.
+    Returns None when Redis is not available so callers can fall back to local state.
+    """
+    global _redis_client, _redis_checked
+
+    if _redis_checked:
+        return _redis_client
+
+    _redis_checked = True
+    try:
+        client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        client.ping()
+        _redis_client = client
+        logger.info("Redis connection established")
+    except Exception as e:
+        logger.warning(f"Redis not available: {e}")
+        _redis_client = None
+
+    return _redis_client
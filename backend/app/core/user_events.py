@@ -0,0 +1,193 @@
+"""
+User change events
+Collects committed inserts, updates and deletes of User rows so in-memory
+targeting indexes can stay current without re-reading the users table.
+Changes are also published on Redis, so indexes in other API workers and
+queue workers apply them too
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.core.redis_client import get_redis_client
+from app.models.models import AlertSeverity, SubscriptionTier, User
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "pending_user_changes"
+
+CHANGES_CHANNEL = "users:changes"
+
+# Tags published changes so a process skips its own
+_ORIGIN = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class UserChange:
+    user_id: str
+    deleted: bool = False
+    is_active: bool = True
+    subscribed_counties: List[str] = field(default_factory=list)
+    home_latitude: Optional[float] = None
+    home_longitude: Optional[float] = None
+    alert_radius_miles: Optional[float] = None
+    severity_threshold: Optional[AlertSeverity] = None
+    quiet_hours_start: Optional[int] = None
+    quiet_hours_end: Optional[int] = None
+    subscription_tier: Optional[SubscriptionTier] = None
+    preferred_language: Optional[str] = None
+
+    def to_message(self) -> Dict:
+        data = asdict(self)
+        data["severity_threshold"] = self.severity_threshold.value if self.severity_threshold else None
+        data["subscription_tier"] = self.subscription_tier.value if self.subscription_tier else None
+        return data
+
+    @classmethod
+    def from_message(cls, data: Dict) -> "UserChange":
+        data = dict(data)
+        if data.get("severity_threshold"):
+            data["severity_threshold"] = AlertSeverity(data["severity_threshold"])
+        if data.get("subscription_tier"):
+            data["subscription_tier"] = SubscriptionTier(data["subscription_tier"])
+        return cls(**data)
+
+
+_listeners: List[Callable[[UserChange], None]] = []
+_subscriber: Optional[threading.Thread] = None
+_subscriber_lock = threading.Lock()
+
+
+def on_user_change(callback: Callable[[UserChange], None]) -> Callable[[UserChange], None]:
+    """Register a callback invoked once per committed User change, local or remote."""
+    _listeners.append(callback)
+    return callback
+
+
+def subscribe_remote_changes() -> bool:
+    """
+    Start applying changes committed by other processes. Idempotent;
+    False when Redis is not available and only local changes are seen.
+    """
+    global _subscriber
+
+    with _subscriber_lock:
+        if _subscriber:
+            return True
+        client = get_redis_client()
+        if not client:
+            return False
+
+        _subscriber = threading.Thread(target=_listen, args=(client,), name="user-changes", daemon=True)
+        _subscriber.start()
+        return True
+
+
+def _listen(client):
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANGES_CHANNEL)
+            for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _apply_remote(message["data"])
+        except Exception as e:
+            # Changes missed meanwhile are picked up by the indexes' periodic rebuild
+            logger.error(f"User change subscription error: {e}")
+            time.sleep(1)
+
+
+def _apply_remote(data: str):
+    try:
+        message = json.loads(data)
+        if message.get("origin") == _ORIGIN:
+            return
+        changes = [UserChange.from_message(change) for change in message["changes"]]
+    except Exception as e:
+        logger.error(f"Invalid user change message: {e}")
+        return
+    _notify(changes)
+
+
+def _notify(changes: Iterable[UserChange]):
+    for change in changes:
+        for callback in _listeners:
+            try:
+                callback(change)
+            except Exception as e:
+                logger.error(f"User change listener failed for {change.user_id}: {e}")
+
+
+def _publish(changes: List[UserChange]):
+    client = get_redis_client()
+    if not client:
+        return
+    try:
+        client.publish(CHANGES_CHANNEL, json.dumps({
+            "origin": _ORIGIN,
+            "changes": [change.to_message() for change in changes]
+        }))
+    except Exception as e:
+        logger.error(f"Failed to publish {len(changes)} user changes: {e}")
+
+
+def _record(target: User, deleted: bool = False):
+    session = object_session(target)
+    if session is None:
+        return
+
+    # Capture values at flush time, the instance is expired once the commit finishes
+    pending: Dict[str, UserChange] = session.info.setdefault(_PENDING_KEY, {})
+    pending[target.id] = UserChange(
+        user_id=target.id,
+        deleted=deleted,
+        is_active=bool(target.is_active) if target.is_active is not None else True,
+        subscribed_counties=list(target.subscribed_counties or []),
+        home_latitude=target.home_latitude,
+        home_longitude=target.home_longitude,
+        alert_radius_miles=target.alert_radius_miles,
+        severity_threshold=target.severity_threshold,
+        quiet_hours_start=target.quiet_hours_start,
+        quiet_hours_end=target.quiet_hours_end,
+        subscription_tier=target.subscription_tier,
+        preferred_language=target.preferred_language
+    )
+
+
+@event.listens_for(User, "after_insert")
+def _user_inserted(mapper, connection, target):
+    _record(target)
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    _record(target)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _record(target, deleted=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_user_changes(session):
+    pending: Optional[Dict[str, UserChange]] = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+
+    changes = list(pending.values())
+    _notify(changes)
+    _publish(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -1,42 +1,305 @@
-from typing import Dict, Set, List, Optional
-from fastapi import WebSocket
+from typing import Callable, Dict, Set, List, Optional, Tuple, Iterable, Union
+from fastapi import WebSocket, WebSocketDisconnect
 import json
+import math
+import time
 from datetime import datetime
 import asyncio
+import uuid
 from dataclasses import dataclass, field
 
+from app.core.config import settings
+from app.services.alert_latency import alert_latency
+from app.services.county_index import county_index
+from app.services.user_snapshot import user_snapshot
+from app.core.fanout import (
+    ALL_CHANNEL,
+    InProcessBackplane,
+    RedisBackplane,
+    county_channel,
+    geo_channel
+)
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Binary subprotocol is not offered without msgpack
+    msgpack = None
+
+MILES_PER_DEGREE = 69.0
+
+# Resolution of the heartbeat timer wheel
+HEARTBEAT_TICK_SECONDS = 1.0
+
+# Subprotocols a client may request at /ws/alerts/{user_id}
+SUBPROTOCOL_MSGPACK = "msgpack"
+SUBPROTOCOL_JSON = "json"
+
+# Alert fields kept in summary payloads, clients fetch the rest on demand
+SUMMARY_FIELDS = ("id", "severity", "title", "category", "source", "expires_at")
+
+def encode_frame(message: Dict, encoding: str = SUBPROTOCOL_JSON) -> Union[str, bytes]:
+    """Encode a message once into the frame sent to every recipient."""
+    if encoding == SUBPROTOCOL_MSGPACK:
+        return msgpack.packb(message, default=str, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(message, default=str)
+
+def decode_frame(frame: Union[str, bytes]) -> Dict:
+    """Decode an incoming client frame, binary frames being msgpack."""
+    if isinstance(frame, bytes):
+        return msgpack.unpackb(frame, raw=False)
+    return json.loads(frame)
+
+def summarize_alert(alert_data: Dict) -> Dict:
+    """Compact alert digest: identity, severity and a coarse geometry."""
+    summary = {key: alert_data[key] for key in SUMMARY_FIELDS if key in alert_data}
+    
+    if alert_data.get('latitude') is not None and alert_data.get('longitude') is not None:
+        summary['point'] = [
+            round(alert_data['latitude'], 3),
+            round(alert_data['longitude'], 3),
+            alert_data.get('radius_miles')
+        ]
+    
+    polygon = alert_data.get('polygon')
+    if polygon:
+        try:
+            from shapely.geometry import shape
+            summary['bbox'] = [round(v, 3) for v in shape(polygon).bounds]
+        except Exception:
+            pass
+    
+    if 'id' in alert_data:
+        summary['detail_url'] = f"{settings.API_V1_STR}/alerts/{alert_data['id']}"
+    
+    return summary
+
+class FrameSet:
+    """Encoded variants of one broadcast, built on first use and shared by every recipient"""
+    
+    def __init__(self, message: Dict):
+        self.message = message
+        self._frames: Dict[Tuple[str, bool], Union[str, bytes]] = {}
+    
+    def get(self, encoding: str, summary: bool) -> Union[str, bytes]:
+        key = (encoding, summary)
+        frame = self._frames.get(key)
+        if frame is None:
+            message = self.message
+            if summary and message.get('type') == 'alert':
+                message = {**message, 'data': summarize_alert(message['data']), 'summary': True}
+            frame = self._frames[key] = encode_frame(message, encoding)
+        return frame
+    
+    def for_connection(self, connection: "ConnectionInfo") -> Union[str, bytes]:
+        return self.get(connection.encoding, connection.summary)
+
+def location_bucket(latitude: float, longitude: float) -> Tuple[int, int]:
+    """Grid bucket for a coordinate, used to group nearby connections."""
+    size = settings.WEBSOCKET_LOCATION_BUCKET_DEGREES
+    return (math.floor(latitude / size), math.floor(longitude / size))
+
+def geo_cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    """Backplane channel cell for a coordinate, coarser than location buckets."""
+    size = settings.WEBSOCKET_BACKPLANE_CELL_DEGREES
+    return (math.floor(latitude / size), math.floor(longitude / size))
+
+def _bounding_cells(latitude: float, longitude: float, radius_miles: float, size: float) -> Tuple[int, int, int, int]:
+    """Grid cell range covering the bounding box of a radius around a point."""
+    lat_span = radius_miles / MILES_PER_DEGREE
+    lon_span = radius_miles / (MILES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    
+    return (
+        math.floor((latitude - lat_span) / size),
+        math.floor((latitude + lat_span) / size),
+        math.floor((longitude - lon_span) / size),
+        math.floor((longitude + lon_span) / size)
+    )
+
 @dataclass
 class ConnectionInfo:
     websocket: WebSocket
     user_id: str
+    connection_id: str = field(default_factory=lambda: uuid.uuid4().hex)
     connected_at: datetime = field(default_factory=datetime.utcnow)
     location: Optional[Dict[str, float]] = None
+    location_bucket: Optional[Tuple[int, int]] = None
+    geo_channel: Optional[str] = None
+    
+    # Negotiated subprotocol and payload mode
+    encoding: str = SUBPROTOCOL_JSON
+    summary: bool = False
+    tier: str = "unknown"
     subscribed_counties: Set[str] = field(default_factory=set)
+    
+    # Pre-encoded outbound frames with an optional on-write callback, drained by a dedicated writer task
+    send_queue: asyncio.Queue = field(
+        default_factory=lambda: asyncio.Queue(maxsize=settings.WEBSOCKET_SEND_QUEUE_SIZE)
+    )
+    writer_task: Optional[asyncio.Task] = None
+    messages_sent: int = 0
+    dropped_messages: int = 0
+    
+    # Heartbeat state, last_activity is refreshed by any client message
+    last_activity: float = field(default_factory=time.monotonic)
+    ping_sent_at: Optional[float] = None
+    wheel_slot: Optional[int] = None
 
 class ConnectionManager:
     def __init__(self):
-        # Active connections
-        self.active_connections: Dict[str, ConnectionInfo] = {}
+        # Active connections, a user may hold several (phone, tablet, dashboard tabs)
+        self.active_connections: Dict[str, ConnectionInfo] = {}  # connection_id -> info
+        self.user_connections: Dict[str, Set[str]] = {}  # user_id -> connection_ids
         self.admin_connections: Dict[str, WebSocket] = {}
         
         # Location-based subscriptions
-        self.location_subscriptions: Dict[str, Set[str]] = {}  # user_id -> location_key
+        self.location_subscriptions: Dict[Tuple[int, int], Set[str]] = {}  # bucket -> connection_ids
+        
+        # County subscriptions
+        self.county_subscriptions: Dict[str, Set[str]] = {}  # county -> connection_ids
         
         # Statistics
         self.total_connections = 0
         self.peak_connections = 0
         self.messages_sent = 0
+        self.messages_dropped = 0
+        self.messages_queued = 0
+        self.slow_consumers_evicted = 0
+        self.idle_connections_reaped = 0
         
-    async def connect(self, user_id: str, websocket: WebSocket):
-        await websocket.accept()
+        # Heartbeat timer wheel: each slot holds connections due for a check on that tick
+        self._wheel_size = math.ceil(
+            max(settings.WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS, settings.WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS)
+            / HEARTBEAT_TICK_SECONDS
+        ) + 1
+        self._wheel: List[Set[str]] = [set() for _ in range(self._wheel_size)]
+        self._wheel_position = 0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        
+        # Counters kept current on connect/disconnect/subscribe, so stats never walk connections
+        self.county_counts: Dict[str, int] = {}
+        self.tier_counts: Dict[str, int] = {}
+        self.protocol_counts: Dict[str, int] = {}
+        
+        # Admin dashboards get coalesced deltas once per tick
+        self._admin_stats_task: Optional[asyncio.Task] = None
+        self._last_admin_stats: Dict = {}
+        self._connects_since_tick = 0
+        self._disconnects_since_tick = 0
+        
+        # Fan-out backplane, replaced by start() when configured for Redis
+        self.backplane = InProcessBackplane(self._deliver, settings.WEBSOCKET_REPLAY_BUFFER_SIZE)
+        self._channel_refs: Dict[str, int] = {}
+        
+    async def start(self):
+        """Start the configured fan-out backplane."""
+        if settings.WEBSOCKET_BACKPLANE == "redis":
+            backplane = RedisBackplane(
+                settings.REDIS_URL, self._deliver, settings.WEBSOCKET_REPLAY_BUFFER_SIZE
+            )
+            try:
+                await backplane.start()
+                self.backplane = backplane
+            except Exception as e:
+                print(f"Redis backplane unavailable, using in-process fan-out: {e}")
+                await backplane.stop()
+        
+        # Channels for connections made before the backplane started
+        for channel in self._channel_refs:
+            self.backplane.subscribe(channel)
+        
+        self._admin_stats_task = asyncio.create_task(self._admin_stats_loop())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+    
+    async def stop(self):
+        for task in (self._admin_stats_task, self._heartbeat_task):
+            if task:
+                task.cancel()
+        await self.backplane.stop()
+    
+    @staticmethod
+    def _count(counter: Dict[str, int], key: str, delta: int):
+        value = counter.get(key, 0) + delta
+        if value > 0:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+    
+    @staticmethod
+    def _protocol_label(connection: "ConnectionInfo") -> str:
+        return connection.encoding + ("+summary" if connection.summary else "")
+    
+    def _retain_channel(self, channel: str):
+        """Subscribe the worker to a channel while a local connection needs it."""
+        refs = self._channel_refs.get(channel, 0)
+        if refs == 0:
+            self.backplane.subscribe(channel)
+        self._channel_refs[channel] = refs + 1
+    
+    def _release_channel(self, channel: Optional[str]):
+        if channel is None or channel not in self._channel_refs:
+            return
+        
+        self._channel_refs[channel] -= 1
+        if self._channel_refs[channel] == 0:
+            del self._channel_refs[channel]
+            self.backplane.unsubscribe(channel)
+        
+    @staticmethod
+    def _negotiate_encoding(websocket: WebSocket) -> Optional[str]:
+        """Pick the subprotocol to accept from those the client offered."""
+        offered = websocket.scope.get("subprotocols") or []
+        if SUBPROTOCOL_MSGPACK in offered and msgpack is not None:
+            return SUBPROTOCOL_MSGPACK
+        if SUBPROTOCOL_JSON in offered:
+            return SUBPROTOCOL_JSON
+        return None
+    
+    async def connect(self, user_id: str, websocket: WebSocket) -> str:
+        """Accept a socket for a user and return its connection id."""
+        subprotocol = self._negotiate_encoding(websocket)
+        await websocket.accept(subprotocol=subprotocol)
         
         connection = ConnectionInfo(
             websocket=websocket,
-            user_id=user_id
+            user_id=user_id,
+            encoding=subprotocol or SUBPROTOCOL_JSON,
+            summary=websocket.query_params.get("payload") == "summary"
         )
+        tier = user_snapshot.tier_of(user_id)
+        if tier is not None:
+            connection.tier = tier.value
+        connection_id = connection.connection_id
+        connection.writer_task = asyncio.create_task(self._writer(connection))
         
-        self.active_connections[user_id] = connection
+        self.active_connections[connection_id] = connection
+        user_connections = self.user_connections.setdefault(user_id, set())
+        user_connections.add(connection_id)
         self.total_connections += 1
+        self._connects_since_tick += 1
+        self._count(self.tier_counts, connection.tier, 1)
+        self._count(self.protocol_counts, self._protocol_label(connection), 1)
+        
+        # Close the user's oldest sockets beyond the per-user limit
+        if len(user_connections) > settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER:
+            oldest = sorted(
+                (self.active_connections[cid] for cid in user_connections if cid != connection_id),
+                key=lambda c: c.connected_at
+            )
+            for stale in oldest[:len(user_connections) - settings.WEBSOCKET_MAX_CONNECTIONS_PER_USER]:
+                self.disconnect(stale.connection_id)
+                asyncio.create_task(self._close_quietly(stale.websocket, code=1008))
+        
+        self._schedule_heartbeat(connection, settings.WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS)
+        
+        # Start from the counties saved on the user's profile
+        self._add_counties(connection, county_index.counties_for_user(user_id))
         
         # Update peak connections
         current_count = len(self.active_connections)
@@ -44,31 +307,50 @@ class ConnectionManager:
             self.peak_connections = current_count
             
         # Send welcome message
-        await self.send_personal_message(
-            user_id,
+        await self.send_to_connection(
+            connection_id,
             {
                 "type": "connection",
                 "status": "connected",
                 "timestamp": datetime.utcnow().isoformat(),
-                "user_id": user_id
+                "user_id": user_id,
+                "connection_id": connection_id,
+                "subscribed_counties": sorted(connection.subscribed_counties),
+                "latest_seq": await self.backplane.latest_sequence()
             }
         )
         
-        # Notify admins
-        await self._notify_admins_connection_change("connect", user_id)
+        return connection_id
         
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            
-            # Clean up location subscriptions
-            if user_id in self.location_subscriptions:
-                del self.location_subscriptions[user_id]
-                
-            # Notify admins
-            asyncio.create_task(
-                self._notify_admins_connection_change("disconnect", user_id)
-            )
+    def disconnect(self, connection_id: str):
+        """Drop one connection, leaving the user's other sockets alone."""
+        connection = self.active_connections.pop(connection_id, None)
+        if connection is None:
+            return
+        
+        user_connections = self.user_connections.get(connection.user_id)
+        if user_connections is not None:
+            user_connections.discard(connection_id)
+            if not user_connections:
+                del self.user_connections[connection.user_id]
+        
+        # Stop the writer, unless it is the writer disconnecting itself
+        if connection.writer_task and connection.writer_task is not asyncio.current_task():
+            connection.writer_task.cancel()
+        self.messages_queued -= connection.send_queue.qsize()
+        
+        if connection.wheel_slot is not None:
+            self._wheel[connection.wheel_slot].discard(connection_id)
+        
+        # Clean up location subscriptions
+        self._remove_from_bucket(connection_id, connection.location_bucket)
+        self._release_channel(connection.geo_channel)
+        
+        self._remove_counties(connection, set(connection.subscribed_counties))
+        
+        self._disconnects_since_tick += 1
+        self._count(self.tier_counts, connection.tier, -1)
+        self._count(self.protocol_counts, self._protocol_label(connection), -1)
     
     async def connect_admin(self, admin_id: str, websocket: WebSocket):
         await websocket.accept()
@@ -84,20 +366,27 @@ class ConnectionManager:
         if admin_id in self.admin_connections:
             del self.admin_connections[admin_id]
     
-    async def subscribe_to_location(self, user_id: str, location: Dict[str, float]):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].location = location
+    async def subscribe_to_location(self, connection_id: str, location: Dict[str, float]):
+        if connection_id in self.active_connections:
+            connection = self.active_connections[connection_id]
+            connection.location = location
             
-            # Create location key for grouping nearby users
-            location_key = f"{round(location['latitude'], 2)}_{round(location['longitude'], 2)}"
+            # Move the connection to the bucket for its new location
+            bucket = location_bucket(location['latitude'], location['longitude'])
+            if bucket != connection.location_bucket:
+                self._remove_from_bucket(connection_id, connection.location_bucket)
+                self.location_subscriptions.setdefault(bucket, set()).add(connection_id)
+                connection.location_bucket = bucket
             
-            if user_id not in self.location_subscriptions:
-                self.location_subscriptions[user_id] = set()
-                
-            self.location_subscriptions[user_id].add(location_key)
+            # Keep this worker subscribed to the backplane cell it is in
+            channel = geo_channel(*geo_cell(location['latitude'], location['longitude']))
+            if channel != connection.geo_channel:
+                self._release_channel(connection.geo_channel)
+                self._retain_channel(channel)
+                connection.geo_channel = channel
             
-            await self.send_personal_message(
-                user_id,
+            await self.send_to_connection(
+                connection_id,
                 {
                     "type": "subscription",
                     "status": "subscribed",
@@ -106,127 +395,424 @@ class ConnectionManager:
                 }
             )
     
+    async def subscribe_counties(self, connection_id: str, counties: Iterable[str]):
+        connection = self.active_connections.get(connection_id)
+        if not connection:
+            return
+        
+        requested = set(counties or [])
+        valid = requested & set(settings.HAWAII_COUNTIES)
+        self._add_counties(connection, valid)
+        
+        await self.send_to_connection(connection_id, {
+            "type": "county_subscription",
+            "status": "subscribed",
+            "subscribed_counties": sorted(connection.subscribed_counties),
+            "rejected": sorted(requested - valid),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    async def unsubscribe_counties(self, connection_id: str, counties: Iterable[str]):
+        connection = self.active_connections.get(connection_id)
+        if not connection:
+            return
+        
+        self._remove_counties(connection, set(counties or []))
+        
+        await self.send_to_connection(connection_id, {
+            "type": "county_subscription",
+            "status": "unsubscribed",
+            "subscribed_counties": sorted(connection.subscribed_counties),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    def _add_counties(self, connection: ConnectionInfo, counties: Set[str]):
+        for county in counties - connection.subscribed_counties:
+            connection.subscribed_counties.add(county)
+            self.county_subscriptions.setdefault(county, set()).add(connection.connection_id)
+            self._count(self.county_counts, county, 1)
+            self._retain_channel(county_channel(county))
+    
+    def _remove_counties(self, connection: ConnectionInfo, counties: Set[str]):
+        for county in counties & connection.subscribed_counties:
+            connection.subscribed_counties.discard(county)
+            connections = self.county_subscriptions.get(county)
+            if connections is not None:
+                connections.discard(connection.connection_id)
+                if not connections:
+                    del self.county_subscriptions[county]
+            self._count(self.county_counts, county, -1)
+            self._release_channel(county_channel(county))
+    
     async def send_personal_message(self, user_id: str, message: Dict):
-        if user_id in self.active_connections:
-            connection = self.active_connections[user_id]
+        """Send a message to every socket the user has open."""
+        frames = FrameSet(message)
+        for connection_id in list(self.user_connections.get(user_id, ())):
+            connection = self.active_connections.get(connection_id)
+            if connection:
+                self._enqueue(connection, frames.get(connection.encoding, False))
+    
+    async def send_to_connection(self, connection_id: str, message: Dict):
+        connection = self.active_connections.get(connection_id)
+        if connection:
+            self._enqueue(connection, encode_frame(message, connection.encoding))
+    
+    async def receive(self, websocket: WebSocket, connection_id: Optional[str] = None) -> Dict:
+        """Receive and decode the next client message in either encoding."""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        
+        # Any client frame proves the connection is alive
+        connection = self.active_connections.get(connection_id)
+        if connection:
+            connection.last_activity = time.monotonic()
+            connection.ping_sent_at = None
+        
+        if message.get("bytes") is not None:
+            return decode_frame(message["bytes"])
+        return decode_frame(message["text"])
+    
+    def _enqueue(
+        self,
+        connection: ConnectionInfo,
+        frame: Union[str, bytes],
+        on_write: Optional[Callable[[], None]] = None
+    ) -> bool:
+        """
+        Queue an encoded frame for a connection without waiting on the
+        socket. on_write runs once the frame is written.
+        """
+        item = (frame, on_write)
+        try:
+            connection.send_queue.put_nowait(item)
+            self.messages_queued += 1
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        if settings.WEBSOCKET_SLOW_CONSUMER_POLICY == "evict":
+            print(f"Evicting slow consumer {connection.user_id}/{connection.connection_id}: send queue full")
+            self._evict(connection)
+            return False
+        
+        # Drop the oldest queued message to make room for the newest
+        try:
+            connection.send_queue.get_nowait()
+            self.messages_queued -= 1
+        except asyncio.QueueEmpty:
+            pass
+        connection.dropped_messages += 1
+        self.messages_dropped += 1
+        connection.send_queue.put_nowait(item)
+        self.messages_queued += 1
+        return True
+    
+    async def _writer(self, connection: ConnectionInfo):
+        """Drain a connection's send queue, one socket write at a time."""
+        while True:
+            frame, on_write = await connection.send_queue.get()
+            self.messages_queued -= 1
+            if isinstance(frame, bytes):
+                send = connection.websocket.send_bytes(frame)
+            else:
+                send = connection.websocket.send_text(frame)
             try:
-                await connection.websocket.send_json(message)
+                await asyncio.wait_for(
+                    send,
+                    timeout=settings.WEBSOCKET_SEND_TIMEOUT_SECONDS
+                )
                 self.messages_sent += 1
+                connection.messages_sent += 1
+                if on_write:
+                    on_write()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                print(f"Evicting slow consumer {connection.user_id}/{connection.connection_id}: send timed out")
+                self._evict(connection)
+                return
+            except Exception as e:
+                print(f"Error sending message to {connection.user_id}: {e}")
+                self.disconnect(connection.connection_id)
+                return
+    
+    def _schedule_heartbeat(self, connection: ConnectionInfo, delay: float):
+        ticks = min(max(1, math.ceil(delay / HEARTBEAT_TICK_SECONDS)), self._wheel_size - 1)
+        slot = (self._wheel_position + ticks) % self._wheel_size
+        self._wheel[slot].add(connection.connection_id)
+        connection.wheel_slot = slot
+    
+    async def _heartbeat_loop(self):
+        """Advance the timer wheel once per tick."""
+        while True:
+            await asyncio.sleep(HEARTBEAT_TICK_SECONDS)
+            try:
+                self._heartbeat_tick()
             except Exception as e:
-                print(f"Error sending message to {user_id}: {e}")
-                self.disconnect(user_id)
+                print(f"Heartbeat error: {e}")
+    
+    def _heartbeat_tick(self):
+        """Ping connections idle for an interval and reap those that never answered."""
+        self._wheel_position = (self._wheel_position + 1) % self._wheel_size
+        due = self._wheel[self._wheel_position]
+        self._wheel[self._wheel_position] = set()
+        
+        now = time.monotonic()
+        interval = settings.WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS
+        timeout = settings.WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS
+        
+        for connection_id in due:
+            connection = self.active_connections.get(connection_id)
+            if not connection:
+                continue
+            
+            idle = now - connection.last_activity
+            if idle < interval:
+                # Heard from since it was scheduled, check again later
+                self._schedule_heartbeat(connection, interval - idle)
+            elif connection.ping_sent_at is None:
+                connection.ping_sent_at = now
+                self._enqueue(connection, encode_frame(
+                    {"type": "ping", "timestamp": datetime.utcnow().isoformat()},
+                    connection.encoding
+                ))
+                self._schedule_heartbeat(connection, timeout)
+            elif now - connection.ping_sent_at >= timeout:
+                self._reap(connection)
+            else:
+                self._schedule_heartbeat(connection, timeout - (now - connection.ping_sent_at))
+    
+    def _reap(self, connection: ConnectionInfo):
+        """Close a connection that stopped answering pings."""
+        print(f"Closing idle connection {connection.user_id}/{connection.connection_id}")
+        self.idle_connections_reaped += 1
+        self.disconnect(connection.connection_id)
+        asyncio.create_task(self._close_quietly(connection.websocket, code=1001))
+    
+    def _evict(self, connection: ConnectionInfo):
+        """Drop a connection that cannot keep up and close its socket."""
+        if connection.connection_id not in self.active_connections:
+            return
+        
+        self.slow_consumers_evicted += 1
+        self.disconnect(connection.connection_id)
+        asyncio.create_task(self._close_quietly(connection.websocket, code=1013))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int = 1000):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
     
     async def broadcast_alert(self, alert_data: Dict, target_location: Optional[Dict] = None):
         """Broadcast alert to relevant users based on location."""
-        message = {
-            "type": "alert",
-            "data": alert_data,
-            "timestamp": datetime.utcnow().isoformat()
+        envelope = {
+            "id": uuid.uuid4().hex,
+            "message": {
+                "type": "alert",
+                "data": alert_data,
+                "timestamp": datetime.utcnow().isoformat()
+            },
+            "target_location": target_location,
+            "latency": alert_latency.context(alert_data)
         }
         
-        # Send to all active connections if no target location
+        seq = await self.backplane.sequence(envelope)
+        
+        # Every worker delivers to its own connections
         if not target_location:
-            disconnected_users = []
-            
-            for user_id, connection in self.active_connections.items():
-                try:
-                    await connection.websocket.send_json(message)
-                    self.messages_sent += 1
-                except Exception as e:
-                    print(f"Error broadcasting to {user_id}: {e}")
-                    disconnected_users.append(user_id)
-            
-            # Clean up disconnected users
-            for user_id in disconnected_users:
-                self.disconnect(user_id)
+            channels = [ALL_CHANNEL]
         else:
-            # Send to users in specific location
-            await self._broadcast_to_location(message, target_location)
+            channels = self._geo_channels(target_location)
+        await self.backplane.publish(channels, envelope)
         
         # Notify admins
         await self._notify_admins_alert_broadcast(alert_data)
+        
+        return seq
     
     async def broadcast_to_county(self, alert_data: Dict, county: str):
-        """Broadcast alert to users subscribed to a specific county."""
-        message = {
-            "type": "alert",
-            "data": alert_data,
+        """
+        Broadcast alert to users subscribed to a specific county.
+        Returns the local recipient count, or the number of workers reached
+        when fanned out over Redis.
+        """
+        envelope = {
+            "id": uuid.uuid4().hex,
+            "message": {
+                "type": "alert",
+                "data": alert_data,
+                "county": county,
+                "timestamp": datetime.utcnow().isoformat()
+            },
             "county": county,
-            "timestamp": datetime.utcnow().isoformat()
+            "latency": alert_latency.context(alert_data)
         }
         
-        disconnected_users = []
+        await self.backplane.sequence(envelope)
+        return await self.backplane.publish([county_channel(county)], envelope)
+    
+    async def resume(self, connection_id: str, since: int):
+        """
+        Replay broadcasts after sequence number `since` that this connection
+        would have received, or ask the client to resync over REST when they
+        are no longer buffered. Clients drop frames whose seq they have seen.
+        """
+        connection = self.active_connections.get(connection_id)
+        if not connection:
+            return
+        
+        envelopes = await self.backplane.replay_since(since)
+        latest = await self.backplane.latest_sequence()
+        
+        if envelopes is None:
+            await self.send_to_connection(connection_id, {
+                "type": "resync",
+                "since": since,
+                "latest_seq": latest,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            return
+        
+        replayed = 0
+        for envelope in envelopes:
+            if self._envelope_targets(connection, envelope):
+                self._enqueue(connection, FrameSet(envelope["message"]).for_connection(connection))
+                replayed += 1
+        
+        await self.send_to_connection(connection_id, {
+            "type": "resume",
+            "status": "ok",
+            "since": since,
+            "replayed": replayed,
+            "latest_seq": latest,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    def _envelope_targets(self, connection: ConnectionInfo, envelope: Dict) -> bool:
+        """Whether a broadcast envelope is addressed to a connection."""
+        if envelope.get("county"):
+            return envelope["county"] in connection.subscribed_counties
+        if envelope.get("target_location"):
+            return self._within_target(connection, envelope["target_location"])
+        return True
+    
+    @staticmethod
+    def _within_target(connection: ConnectionInfo, target_location: Dict) -> bool:
+        from geopy.distance import distance
+        
+        if not connection.location:
+            return False
+        
+        target_coords = (target_location['latitude'], target_location['longitude'])
+        user_coords = (connection.location['latitude'], connection.location['longitude'])
+        return distance(target_coords, user_coords).miles <= target_location.get('radius_miles', 25)
+    
+    async def _deliver(self, envelope: Dict) -> int:
+        """Deliver a backplane envelope to this worker's connections."""
+        # Encoded once per protocol variant, shared by every recipient
+        frames = FrameSet(envelope["message"])
+        
+        # Alert frames observe their source-to-socket latency once written
+        on_write = alert_latency.frame_observer(envelope.get("latency"))
+        
+        if envelope.get("county"):
+            return self._deliver_to_county(frames, envelope["county"], on_write)
+        if envelope.get("target_location"):
+            return await self._broadcast_to_location(frames, envelope["target_location"], on_write)
+        
+        sent_count = 0
+        for connection in list(self.active_connections.values()):
+            if self._enqueue(connection, frames.for_connection(connection), on_write):
+                sent_count += 1
+        return sent_count
+    
+    def _deliver_to_county(
+        self,
+        frames: FrameSet,
+        county: str,
+        on_write: Optional[Callable[[], None]] = None
+    ) -> int:
         sent_count = 0
         
-        for user_id, connection in self.active_connections.items():
-            if county in connection.subscribed_counties:
-                try:
-                    await connection.websocket.send_json(message)
-                    self.messages_sent += 1
-                    sent_count += 1
-                except Exception as e:
-                    print(f"Error broadcasting to {user_id}: {e}")
-                    disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            self.disconnect(user_id)
+        for connection_id in list(self.county_subscriptions.get(county, ())):
+            connection = self.active_connections.get(connection_id)
+            if connection and self._enqueue(connection, frames.for_connection(connection), on_write):
+                sent_count += 1
             
         return sent_count
     
-    async def _broadcast_to_location(self, message: Dict, target_location: Dict):
-        """Broadcast to users near a specific location."""
-        from geopy.distance import distance
+    def _geo_channels(self, target_location: Dict) -> List[str]:
+        """Backplane cell channels overlapping an alert's radius."""
+        lat_lo, lat_hi, lon_lo, lon_hi = _bounding_cells(
+            target_location['latitude'],
+            target_location['longitude'],
+            target_location.get('radius_miles', 25),
+            settings.WEBSOCKET_BACKPLANE_CELL_DEGREES
+        )
         
-        target_coords = (target_location['latitude'], target_location['longitude'])
-        radius_miles = target_location.get('radius_miles', 25)
+        return [
+            geo_channel(cell_lat, cell_lon)
+            for cell_lat in range(lat_lo, lat_hi + 1)
+            for cell_lon in range(lon_lo, lon_hi + 1)
+        ]
+    
+    def _remove_from_bucket(self, connection_id: str, bucket: Optional[Tuple[int, int]]):
+        if bucket is None:
+            return
         
-        disconnected_users = []
+        connections = self.location_subscriptions.get(bucket)
+        if connections is not None:
+            connections.discard(connection_id)
+            if not connections:
+                del self.location_subscriptions[bucket]
+    
+    def _candidate_buckets(self, latitude: float, longitude: float, radius_miles: float) -> Iterable[Set[str]]:
+        """Occupied buckets overlapping the bounding box of a radius around a point."""
+        lat_lo, lat_hi, lon_lo, lon_hi = _bounding_cells(
+            latitude, longitude, radius_miles, settings.WEBSOCKET_LOCATION_BUCKET_DEGREES
+        )
         
-        for user_id, connection in self.active_connections.items():
-            if connection.location:
-                user_coords = (
-                    connection.location['latitude'],
-                    connection.location['longitude']
-                )
-                
-                # Calculate distance
-                dist = distance(target_coords, user_coords).miles
-                
-                if dist <= radius_miles:
-                    try:
-                        await connection.websocket.send_json(message)
-                        self.messages_sent += 1
-                    except Exception as e:
-                        print(f"Error broadcasting to {user_id}: {e}")
-                        disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            self.disconnect(user_id)
-    
-    async def _notify_admins_connection_change(self, event_type: str, user_id: str):
-        """Notify admin dashboards of connection changes."""
-        message = {
-            "type": "connection_event",
-            "event": event_type,
-            "user_id": user_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "active_connections": len(self.active_connections)
-        }
+        cells = (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1)
         
-        disconnected_admins = []
+        if cells > len(self.location_subscriptions):
+            # Wide radius - cheaper to walk the occupied buckets
+            for (bucket_lat, bucket_lon), connections in self.location_subscriptions.items():
+                if lat_lo <= bucket_lat <= lat_hi and lon_lo <= bucket_lon <= lon_hi:
+                    yield connections
+        else:
+            for bucket_lat in range(lat_lo, lat_hi + 1):
+                for bucket_lon in range(lon_lo, lon_hi + 1):
+                    connections = self.location_subscriptions.get((bucket_lat, bucket_lon))
+                    if connections:
+                        yield connections
+    
+    async def _broadcast_to_location(
+        self,
+        frames: FrameSet,
+        target_location: Dict,
+        on_write: Optional[Callable[[], None]] = None
+    ) -> int:
+        """Broadcast to users near a specific location."""
+        radius_miles = target_location.get('radius_miles', 25)
         
-        for admin_id, websocket in self.admin_connections.items():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                print(f"Error notifying admin {admin_id}: {e}")
-                disconnected_admins.append(admin_id)
+        # Exact distance check only for connections in nearby buckets
+        recipients = []
+        for connections in self._candidate_buckets(
+            target_location['latitude'], target_location['longitude'], radius_miles
+        ):
+            for connection_id in connections:
+                connection = self.active_connections.get(connection_id)
+                if connection and self._within_target(connection, target_location):
+                    recipients.append(connection)
         
-        # Clean up disconnected admins
-        for admin_id in disconnected_admins:
-            self.disconnect_admin(admin_id)
+        sent_count = 0
+        for connection in recipients:
+            if self._enqueue(connection, frames.for_connection(connection), on_write):
+                sent_count += 1
+        return sent_count
     
     async def _notify_admins_alert_broadcast(self, alert_data: Dict):
         """Notify admin dashboards of alert broadcasts."""
@@ -244,22 +830,91 @@ class ConnectionManager:
                 print(f"Error notifying admin {admin_id}: {e}")
     
     async def get_connection_stats(self) -> Dict:
-        """Get current connection statistics."""
-        counties_stats = {}
-        
-        for connection in self.active_connections.values():
-            for county in connection.subscribed_counties:
-                counties_stats[county] = counties_stats.get(county, 0) + 1
-        
+        """Get current connection statistics from the maintained counters."""
+        stats = self._stats_snapshot()
+        stats["timestamp"] = datetime.utcnow().isoformat()
+        return stats
+    
+    def _stats_snapshot(self) -> Dict:
         return {
             "active_connections": len(self.active_connections),
+            "active_users": len(self.user_connections),
             "admin_connections": len(self.admin_connections),
             "total_connections": self.total_connections,
             "peak_connections": self.peak_connections,
             "messages_sent": self.messages_sent,
-            "connections_by_county": counties_stats,
+            "messages_queued": self.messages_queued,
+            "messages_dropped": self.messages_dropped,
+            "slow_consumers_evicted": self.slow_consumers_evicted,
+            "idle_connections_reaped": self.idle_connections_reaped,
+            "connections_by_county": dict(self.county_counts),
+            "connections_by_tier": dict(self.tier_counts),
+            "connections_by_protocol": dict(self.protocol_counts),
+            "connections_by_bucket": {
+                f"{lat}:{lon}": len(connections)
+                for (lat, lon), connections in self.location_subscriptions.items()
+            },
+            "location_buckets": len(self.location_subscriptions),
+            "backplane": self.backplane.name,
+            "backplane_channels": len(self._channel_refs)
+        }
+    
+    @staticmethod
+    def _stats_delta(previous: Dict, current: Dict) -> Dict:
+        """Changed stats; nested counters report changed keys, 0 for removed ones."""
+        delta = {}
+        for key, value in current.items():
+            old = previous.get(key)
+            if isinstance(value, dict):
+                old = old or {}
+                changes = {k: v for k, v in value.items() if old.get(k) != v}
+                changes.update({k: 0 for k in old if k not in value})
+                if changes:
+                    delta[key] = changes
+            elif value != old:
+                delta[key] = value
+        return delta
+    
+    async def _admin_stats_loop(self):
+        """Push coalesced stats deltas to admin dashboards on a fixed tick."""
+        while True:
+            await asyncio.sleep(settings.WEBSOCKET_ADMIN_STATS_INTERVAL_SECONDS)
+            try:
+                await self._send_admin_stats_delta()
+            except Exception as e:
+                print(f"Error sending admin stats: {e}")
+    
+    async def _send_admin_stats_delta(self):
+        current = self._stats_snapshot()
+        delta = self._stats_delta(self._last_admin_stats, current)
+        self._last_admin_stats = current
+        
+        connects, disconnects = self._connects_since_tick, self._disconnects_since_tick
+        self._connects_since_tick = self._disconnects_since_tick = 0
+        
+        if not self.admin_connections or not (delta or connects or disconnects):
+            return
+        
+        message = {
+            "type": "stats_delta",
+            "changes": delta,
+            "connects": connects,
+            "disconnects": disconnects,
             "timestamp": datetime.utcnow().isoformat()
         }
+        
+        disconnected_admins = []
+        
+        for admin_id, websocket in list(self.admin_connections.items()):
+            try:
+                await websocket.send_json(message)
+            except Exception as e:
+                print(f"Error notifying admin {admin_id}: {e}")
+                disconnected_admins.append(admin_id)
+        
+        # Clean up disconnected admins
+        for admin_id in disconnected_admins:
+            self.disconnect_admin(admin_id)
 
 # Global connection manager instance
-connection_manager = ConnectionManager()
\ No newline at end of file
+connection_manager = ConnectionManager()
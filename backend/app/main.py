@@ -1,5 +1,6 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from contextlib import asynccontextmanager
 from typing import Dict, List, Set
 import asyncio
@@ -42,11 +43,38 @@ async def lifespan(app: FastAPI):
     await app.state.alert_processor.start()
     logger.info("Alert processor started with live data sync enabled")
     
+    # Warm the targeting indexes, also used to label and pre-subscribe sockets
+    try:
+        from app.core.database import SessionLocal
+        from app.services.county_index import county_index
+        from app.services.user_snapshot import user_snapshot
+        db = SessionLocal()
+        try:
+            await asyncio.to_thread(user_snapshot.ensure_loaded, db)
+            await asyncio.to_thread(county_index.ensure_loaded, db)
+        finally:
+            db.close()
+    except Exception as e:
+        logger.error(f"Targeting index warm-up error: {e}")
+    
+    await connection_manager.start()
+    logger.info(f"WebSocket fan-out using {connection_manager.backplane.name} backplane")
+    
+    # Drain the notification job queue here unless dedicated workers do it
+    from app.services.notification_queue import notification_queue
+    if settings.NOTIFICATION_QUEUE_CONSUMER:
+        await notification_queue.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down...")
     await app.state.alert_processor.stop()
+    await connection_manager.stop()
+    
+    await notification_queue.stop()
+    from app.services.notification_delivery import delivery_pool
+    await delivery_pool.stop()
 
 app = FastAPI(
     title="Hawaii Emergency Network Hub API",
@@ -100,6 +128,11 @@ async def root():
         "version": "1.0.0"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this process, including alert latency histograms"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/v1/alerts")
 async def get_alerts_simple(skip: int = 0, limit: int = 20):
     """Simple alerts endpoint that always works"""
@@ -205,26 +238,54 @@ async def database_test():
 
 @app.websocket("/ws/alerts/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await connection_manager.connect(user_id, websocket)
+    connection_id = await connection_manager.connect(user_id, websocket)
     try:
         while True:
             # Keep connection alive and handle incoming messages
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            message = await connection_manager.receive(websocket, connection_id)
             
             if message.get("type") == "ping":
-                await websocket.send_json({"type": "pong", "timestamp": datetime.utcnow().isoformat()})
+                await connection_manager.send_to_connection(
+                    connection_id,
+                    {"type": "pong", "timestamp": datetime.utcnow().isoformat()}
+                )
+            elif message.get("type") == "pong":
+                # Reply to a server heartbeat, receive() already recorded the activity
+                pass
             elif message.get("type") == "subscribe":
                 # Handle location-based subscriptions
                 location = message.get("location")
                 if location:
-                    await connection_manager.subscribe_to_location(user_id, location)
+                    await connection_manager.subscribe_to_location(connection_id, location)
+            elif message.get("type") == "subscribe_counties":
+                await connection_manager.subscribe_counties(connection_id, message.get("counties", []))
+            elif message.get("type") == "unsubscribe_counties":
+                await connection_manager.unsubscribe_counties(connection_id, message.get("counties", []))
+            elif message.get("type") == "resume":
+                # Replay alerts missed while disconnected
+                try:
+                    since = int(message.get("since", 0))
+                except (TypeError, ValueError):
+                    since = -1
+                if since < 0:
+                    await connection_manager.send_to_connection(connection_id, {
+                        "type": "resume",
+                        "status": "error",
+                        "error": "since must be a non-negative sequence number",
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+                    continue
+                
+                location = message.get("location")
+                if location:
+                    await connection_manager.subscribe_to_location(connection_id, location)
+                await connection_manager.resume(connection_id, since)
                     
     except WebSocketDisconnect:
-        connection_manager.disconnect(user_id)
+        connection_manager.disconnect(connection_id)
     except Exception as e:
         print(f"WebSocket error for user {user_id}: {e}")
-        connection_manager.disconnect(user_id)
+        connection_manager.disconnect(connection_id)
 
 @app.websocket("/ws/admin/{admin_id}")
 async def admin_websocket_endpoint(websocket: WebSocket, admin_id: str):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, JSON, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, JSON, Text, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -83,6 +83,7 @@ class Alert(Base):
     
     # Additional metadata
     alert_metadata = Column(JSON)  # Additional data from source
+    lifecycle = Column(JSON)  # Epoch seconds of origin and each pipeline stage, see alert_latency
     images = Column(JSON)  # List of image URLs
     
     # Status
@@ -127,7 +128,7 @@ class User(Base):
     last_active = Column(DateTime(timezone=True))
     
     # Device tokens for push notifications
-    device_tokens = Column(JSON)  # List of FCM/APNS tokens
+    device_tokens = Column(JSON)  # FCM/APNs devices as {"token", "platform", "registered_at"}
     
     # Subscription information
     subscription_tier = Column(SQLEnum(SubscriptionTier), default=SubscriptionTier.FREE)
@@ -166,7 +167,7 @@ class Notification(Base):
     
     # Delivery information
     channel = Column(String)  # push, email, sms
-    sent_at = Column(DateTime(timezone=True))
+    sent_at = Column(DateTime(timezone=True), index=True)
     delivered_at = Column(DateTime(timezone=True))
     read_at = Column(DateTime(timezone=True))
     
@@ -345,6 +346,7 @@ class NotificationChannel(Base):
     is_active = Column(Boolean, default=True)
     severity_threshold = Column(SQLEnum(AlertSeverity))
     categories = Column(JSON)  # List of AlertCategory values
+    digest_minutes = Column(Integer)  # One send per event group in this window; None uses the default, 0 sends all
     
     # Verification
     verification_code = Column(String)
@@ -358,6 +360,85 @@ class NotificationChannel(Base):
     # Relationships
     user = relationship("User", back_populates="notification_channels")
 
+class NotificationMessage(Base):
+    __tablename__ = "notification_messages"
+    
+    key = Column(String, primary_key=True)  # alert:version:language:channel, see MessageRenderer.message_key
+    alert_id = Column(String, ForeignKey("alerts.id"), nullable=True, index=True)
+    channel = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)  # Rendered once, read by every job of the variant
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+class NotificationJob(Base):
+    __tablename__ = "notification_jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    idempotency_key = Column(String, unique=True, index=True, nullable=False)  # user:alert:channel[:device]
+    user_id = Column(String, ForeignKey("users.id"))
+    alert_id = Column(String, ForeignKey("alerts.id"), nullable=True)
+    notification_id = Column(String, ForeignKey("notifications.id"), nullable=True)
+    channel_id = Column(String, ForeignKey("notification_channels.id"), nullable=True)
+    
+    # Delivery
+    channel = Column(String, nullable=False)  # email, sms, voice, push
+    destination = Column(String, nullable=False)
+    payload = Column(JSON(none_as_null=True), nullable=True)  # Only for jobs without a shared message
+    message_key = Column(String, ForeignKey("notification_messages.key"), nullable=True)  # Rendered variant, shared by jobs sent as one provider batch
+    provider_id = Column(String)
+    
+    # Scheduling
+    priority = Column(Integer, default=2, index=True)  # Delivery lane, 0 (critical) to 3 (low)
+    status = Column(String, default="queued", index=True)  # queued, sending, retry, sent, dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    next_attempt_at = Column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+    locked_by = Column(String)  # Consumer holding the lease
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(String)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        # Due-job lookup of the queue consumers, by lane
+        Index("ix_notification_jobs_claim", "channel", "status", "priority", "next_attempt_at"),
+    )
+
+class NotificationDedup(Base):
+    __tablename__ = "notification_dedup"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    event_group = Column(String, nullable=False)  # Real-world event shared by related alerts
+    channel = Column(String, nullable=False)
+    
+    # Last send for the group
+    alert_id = Column(String, ForeignKey("alerts.id"))
+    severity = Column(SQLEnum(AlertSeverity))
+    last_sent_at = Column(DateTime(timezone=True), nullable=False)
+    suppressed = Column(Integer, default=0)  # Repeats skipped since last_sent_at
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "event_group", "channel", name="uq_notification_dedup_key"),
+    )
+
+class NotificationDeadLetter(Base):
+    __tablename__ = "notification_dead_letters"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_id = Column(String, ForeignKey("notification_jobs.id"), index=True)
+    idempotency_key = Column(String, nullable=False)
+    user_id = Column(String, ForeignKey("users.id"))
+    alert_id = Column(String, ForeignKey("alerts.id"), nullable=True)
+    channel = Column(String, nullable=False)
+    destination = Column(String, nullable=False)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String)
+    failed_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    requeued_at = Column(DateTime(timezone=True))
+
 class ApiUsage(Base):
     __tablename__ = "api_usage"
     
@@ -0,0 +1,232 @@
+"""
+Alert latency tracking
+Follows every alert from its origin at the source (USGS origin time, NWS
+effective time) through fetch, parse, upsert, audience match, render and
+enqueue, and each notification through provider send and ack or socket
+frame write. Alert-level stage times travel with the alert in
+Alert.lifecycle; every observation also lands in Prometheus histograms per
+stage, source, channel and severity, bucketed on the delivery SLOs
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import Alert
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in order; an alert's lifecycle maps each to epoch seconds
+ALERT_STAGES = ("fetch", "parse", "upsert", "match", "render", "enqueue")
+DELIVERY_STAGES = ("send", "ack")
+
+# External id prefixes of each source's alerts
+SOURCE_PREFIXES = (
+    ("nws_", "nws"),
+    ("usgs_eq_", "usgs"),
+    ("volcano_", "volcano"),
+    ("ocean_", "ocean"),
+    ("current_", "ocean"),
+    ("crime_", "crime")
+)
+
+# Alerts whose origin and labels are kept for delivery observations
+MAX_TRACKED_ALERTS = 4096
+
+LATENCY_BUCKETS = sorted({
+    1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0, 1800.0, 3600.0, 7200.0,
+    *(float(seconds) for seconds in settings.ALERT_LATENCY_SLO_SECONDS.values())
+})
+
+STAGE_LATENCY = Histogram(
+    "alert_stage_latency_seconds",
+    "Seconds from an alert's origin at its source until it reached each pipeline stage",
+    ["stage", "source", "severity"],
+    buckets=LATENCY_BUCKETS
+)
+
+DELIVERY_LATENCY = Histogram(
+    "alert_delivery_latency_seconds",
+    "Seconds from an alert's origin at its source until a notification was sent or acknowledged",
+    ["stage", "source", "channel", "severity"],
+    buckets=LATENCY_BUCKETS
+)
+
+SLO_BREACHES = Counter(
+    "alert_latency_slo_breaches_total",
+    "Notifications acknowledged later than their severity's latency SLO",
+    ["source", "channel", "severity"]
+)
+
+
+def source_key(external_id: Optional[str]) -> str:
+    """Short label of the system an alert came from; alerts created here have no external id."""
+    if not external_id:
+        return "manual"
+    for prefix, key in SOURCE_PREFIXES:
+        if external_id.startswith(prefix):
+            return key
+    return "other"
+
+
+def slo_seconds(severity: str) -> Optional[float]:
+    seconds = settings.ALERT_LATENCY_SLO_SECONDS.get(severity)
+    return float(seconds) if seconds is not None else None
+
+
+def epoch(value) -> Optional[float]:
+    """Epoch seconds of a datetime or ISO string; naive times are UTC."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def alert_origin(alert: Alert) -> Optional[float]:
+    lifecycle = alert.lifecycle or {}
+    if lifecycle.get("origin") is not None:
+        return lifecycle["origin"]
+    return epoch(alert.effective_time)
+
+
+class AlertLatencyTracker:
+    """Records pipeline stage times of alerts and latency of their deliveries"""
+
+    def __init__(self, max_alerts: int = MAX_TRACKED_ALERTS):
+        self.max_alerts = max_alerts
+        self._lock = threading.Lock()
+        # alert id -> (origin, source, severity)
+        self._alerts: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+
+    def ingested(self, alerts: Iterable[Alert], fetched_at: float, parsed_at: float):
+        """Stamp newly stored alerts with their fetch, parse and upsert times; the caller commits."""
+        upserted_at = time.time()
+        for alert in alerts:
+            self._stamp(alert, {"fetch": fetched_at, "parse": parsed_at, "upsert": upserted_at})
+
+    def stamp(self, alert: Alert, stage: str, at: Optional[float] = None):
+        """Stamp one stage on an alert in memory; save() persists it."""
+        self._stamp(alert, {stage: at if at is not None else time.time()})
+
+    def save(self, alert: Alert):
+        """Persist an alert's lifecycle. Uses its own session; blocking."""
+        db = SessionLocal()
+        try:
+            db.query(Alert).filter(Alert.id == alert.id).update(
+                {Alert.lifecycle: alert.lifecycle},
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to save lifecycle of alert {alert.id}: {e}")
+        finally:
+            db.close()
+
+    def observe_deliveries(
+        self,
+        db: Session,
+        deliveries: List[Tuple[str, str, Optional[float], float]]
+    ):
+        """
+        Observe finished sends given as (alert_id, channel, sent_at, acked_at)
+        epoch seconds; sent_at is when the provider request started.
+        """
+        labels = self._labels(db, {alert_id for alert_id, _, _, _ in deliveries})
+        for alert_id, channel, sent_at, acked_at in deliveries:
+            if alert_id not in labels:
+                continue
+            origin, source, severity = labels[alert_id]
+            if sent_at is not None:
+                DELIVERY_LATENCY.labels("send", source, channel, severity).observe(max(0.0, sent_at - origin))
+            self._observe_ack(source, channel, severity, acked_at - origin)
+
+    def context(self, alert_data: Dict) -> Optional[Dict]:
+        """Origin and labels of a serialized alert, carried by socket broadcasts."""
+        origin = alert_data.get("origin") or epoch(alert_data.get("effective_time"))
+        if origin is None:
+            return None
+        severity = getattr(alert_data.get("severity"), "value", alert_data.get("severity"))
+        return {
+            "origin": origin,
+            "source": source_key(alert_data.get("external_id")),
+            "severity": str(severity).lower() if severity else "unknown"
+        }
+
+    def frame_observer(self, context: Optional[Dict]) -> Optional[Callable[[], None]]:
+        """Callback observing the ack latency of a socket frame once it is written."""
+        if not context:
+            return None
+        source, severity, origin = context["source"], context["severity"], context["origin"]
+        return lambda: self._observe_ack(source, "websocket", severity, time.time() - origin)
+
+    def _observe_ack(self, source: str, channel: str, severity: str, seconds: float):
+        seconds = max(0.0, seconds)
+        DELIVERY_LATENCY.labels("ack", source, channel, severity).observe(seconds)
+        slo = slo_seconds(severity)
+        if slo is not None and seconds > slo:
+            SLO_BREACHES.labels(source, channel, severity).inc()
+
+    def _stamp(self, alert: Alert, stages: Dict[str, float]):
+        # JSON columns only notice reassignment, not in-place edits
+        lifecycle = dict(alert.lifecycle or {})
+        origin = lifecycle.get("origin")
+        if origin is None:
+            origin = epoch(alert.effective_time) or min(stages.values())
+            lifecycle["origin"] = origin
+        lifecycle.update({stage: round(at, 3) for stage, at in stages.items()})
+        alert.lifecycle = lifecycle
+
+        source, severity = self._alert_labels(alert)
+        for stage, at in stages.items():
+            STAGE_LATENCY.labels(stage, source, severity).observe(max(0.0, at - origin))
+        if alert.id:
+            self._remember(alert.id, (origin, source, severity))
+
+    @staticmethod
+    def _alert_labels(alert: Alert) -> Tuple[str, str]:
+        severity = alert.severity.value if alert.severity else "unknown"
+        return source_key(alert.external_id), severity
+
+    def _labels(self, db: Session, alert_ids: Iterable[str]) -> Dict[str, Tuple[float, str, str]]:
+        labels: Dict[str, Tuple[float, str, str]] = {}
+        missing = []
+        with self._lock:
+            for alert_id in alert_ids:
+                if alert_id in self._alerts:
+                    labels[alert_id] = self._alerts[alert_id]
+                elif alert_id:
+                    missing.append(alert_id)
+
+        if missing:
+            for alert in db.query(Alert).filter(Alert.id.in_(missing)):
+                origin = alert_origin(alert)
+                if origin is None:
+                    continue
+                labels[alert.id] = (origin, *self._alert_labels(alert))
+                self._remember(alert.id, labels[alert.id])
+        return labels
+
+    def _remember(self, alert_id: str, labels: Tuple[float, str, str]):
+        with self._lock:
+            self._alerts[alert_id] = labels
+            self._alerts.move_to_end(alert_id)
+            while len(self._alerts) > self.max_alerts:
+                self._alerts.popitem(last=False)
+
+
+# Create singleton instance
+alert_latency = AlertLatencyTracker()
@@ -1,9 +1,15 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from app.models.models import Alert, User, AlertSeverity
+import numpy as np
+
+from app.core.config import settings
+from app.models.models import Alert, User, AlertSeverity, Notification
+from app.services.alert_latency import ALERT_STAGES, alert_origin, epoch, slo_seconds, source_key
+
+ALERT_LOOKUP_CHUNK_SIZE = 500
 
 class AnalyticsService:
     def __init__(self, db: Session):
@@ -26,12 +32,121 @@ class AnalyticsService:
         return self.db.query(Alert).filter(Alert.created_at >= since).count()
     
     def get_response_metrics(self) -> Dict:
-        """Get response time metrics."""
-        # In production, this would calculate real metrics
+        """
+        Get source-to-delivery latency of recently sent notifications,
+        measured from each alert's origin at its source.
+        """
+        since = datetime.utcnow() - timedelta(hours=settings.ALERT_LATENCY_WINDOW_HOURS)
+        sent = self.db.query(
+            Notification.alert_id,
+            Notification.channel,
+            Notification.sent_at
+        ).filter(
+            Notification.status == "sent",
+            Notification.sent_at >= since
+        ).order_by(Notification.sent_at.desc()).limit(settings.ALERT_LATENCY_SAMPLE_LIMIT).all()
+        
+        alerts = self._load_alerts({alert_id for alert_id, _, _ in sent if alert_id})
+        
+        # One row per delivery: seconds, channel, source, severity
+        samples = []
+        for alert_id, channel, sent_at in sent:
+            alert = alerts.get(alert_id)
+            origin = alert_origin(alert) if alert else None
+            if origin is None or sent_at is None:
+                continue
+            samples.append((
+                max(0.0, epoch(sent_at) - origin),
+                channel or "unknown",
+                source_key(alert.external_id),
+                alert.severity.value if alert.severity else "unknown"
+            ))
+        
+        seconds = np.array([sample[0] for sample in samples], dtype=float)
+        
+        def minutes(value: Optional[float]) -> Optional[float]:
+            return round(value / 60, 2) if value is not None else None
+        
+        overall = self._latency_summary(seconds)
+        return {
+            "average_response_minutes": minutes(float(seconds.mean()) if len(seconds) else None),
+            "median_response_minutes": minutes(overall["p50_seconds"]),
+            "95th_percentile_minutes": minutes(overall["p95_seconds"]),
+            "window_hours": settings.ALERT_LATENCY_WINDOW_HOURS,
+            "samples": len(samples),
+            "by_channel": self._latency_breakdown(samples, 1),
+            "by_source": self._latency_breakdown(samples, 2),
+            "by_severity": self._latency_breakdown(samples, 3),
+            "stages": self._stage_latency(alerts.values()),
+            "slo": self._slo_compliance(samples)
+        }
+    
+    def _load_alerts(self, alert_ids) -> Dict[str, Alert]:
+        alert_ids = list(alert_ids)
+        alerts = {}
+        for i in range(0, len(alert_ids), ALERT_LOOKUP_CHUNK_SIZE):
+            for alert in self.db.query(Alert).filter(Alert.id.in_(alert_ids[i:i + ALERT_LOOKUP_CHUNK_SIZE])):
+                alerts[alert.id] = alert
+        return alerts
+    
+    @staticmethod
+    def _latency_summary(seconds: np.ndarray) -> Dict:
+        if not len(seconds):
+            return {"samples": 0, "p50_seconds": None, "p95_seconds": None, "p99_seconds": None}
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        return {
+            "samples": int(len(seconds)),
+            "p50_seconds": round(float(p50), 1),
+            "p95_seconds": round(float(p95), 1),
+            "p99_seconds": round(float(p99), 1)
+        }
+    
+    def _latency_breakdown(self, samples: List, label: int) -> Dict[str, Dict]:
+        groups: Dict[str, List[float]] = {}
+        for sample in samples:
+            groups.setdefault(sample[label], []).append(sample[0])
+        return {key: self._latency_summary(np.array(values)) for key, values in groups.items()}
+    
+    @staticmethod
+    def _stage_latency(alerts) -> Dict[str, Optional[float]]:
+        """Median seconds from origin to each pipeline stage of the delivered alerts."""
+        by_stage: Dict[str, List[float]] = {stage: [] for stage in ALERT_STAGES}
+        for alert in alerts:
+            lifecycle = alert.lifecycle or {}
+            origin = lifecycle.get("origin")
+            if origin is None:
+                continue
+            for stage in ALERT_STAGES:
+                if lifecycle.get(stage) is not None:
+                    by_stage[stage].append(max(0.0, lifecycle[stage] - origin))
+        return {
+            stage: round(float(np.median(values)), 1) if values else None
+            for stage, values in by_stage.items()
+        }
+    
+    @staticmethod
+    def _slo_compliance(samples: List) -> Dict:
+        """
+        Share of deliveries within their severity's SLO, against the target
+        share. met is None when there were no deliveries to judge.
+        """
+        severities = {}
+        for seconds, _, _, severity in samples:
+            target = slo_seconds(severity)
+            if target is None:
+                continue
+            counts = severities.setdefault(severity, {"target_seconds": target, "samples": 0, "within": 0})
+            counts["samples"] += 1
+            counts["within"] += seconds <= target
+        
+        for counts in severities.values():
+            counts["compliance"] = round(counts["within"] / counts["samples"], 4)
+            counts["met"] = counts["compliance"] >= settings.ALERT_LATENCY_SLO_TARGET
+        
         return {
-            "average_response_minutes": 1.2,
-            "median_response_minutes": 0.8,
-            "95th_percentile_minutes": 2.5
+            "target_compliance": settings.ALERT_LATENCY_SLO_TARGET,
+            "met": all(counts["met"] for counts in severities.values()) if severities else None,
+            "by_severity": severities
         }
     
     def get_alerts_by_severity(self) -> Dict[str, int]:
@@ -0,0 +1,210 @@
+"""
+Batch audience matching
+Resolves the audiences of several alerts in one pass over the columnar
+user snapshot instead of one full user scan per alert
+"""
+import logging
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from sqlalchemy.orm import Session
+
+from app.models.models import Alert, AlertZone, User
+from app.services.county_index import county_index
+from app.services.geo_service import GeoService
+from app.services.user_snapshot import SEVERITY_CODES, user_snapshot
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_MILES = 3959.0
+
+# Upper bound on alert x user distance matrix cells evaluated at once
+MAX_MATRIX_CELLS = 2_000_000
+
+
+def haversine_matrix(
+    alert_lat: np.ndarray,
+    alert_lon: np.ndarray,
+    user_lat: np.ndarray,
+    user_lon: np.ndarray
+) -> np.ndarray:
+    """
+    Great circle distances in miles between every alert and every user.
+    Inputs are in radians; returns an (alerts, users) matrix.
+    """
+    lat1 = alert_lat[:, None]
+    lon1 = alert_lon[:, None]
+    dlat = user_lat[None, :] - lat1
+    dlon = user_lon[None, :] - lon1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(user_lat[None, :]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+class AudienceMatcher:
+    """Match a batch of alerts against all users in a single pass"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def match_alerts(self, alerts: List[Alert], dedupe_events: bool = True) -> List[List[User]]:
+        """
+        Return the audience of each alert, aligned with the input list.
+        With dedupe_events, a user hit by several alerts of the same event
+        only appears in the audience of the most severe one.
+        """
+        if not alerts:
+            return []
+
+        matched: List[Set[str]] = [set() for _ in alerts]
+
+        self._match_radius(alerts, matched)
+        self._match_polygons(alerts, matched)
+        self._match_zones(alerts, matched)
+        self._match_counties(alerts, matched)
+
+        if dedupe_events and len(alerts) > 1:
+            self._dedupe_event_groups(alerts, matched)
+
+        all_ids: Set[str] = set().union(*matched)
+        users = {
+            user.id: user
+            for user in GeoService._fetch_active_users(self.db, User, all_ids)
+        }
+
+        return [[users[user_id] for user_id in ids if user_id in users] for ids in matched]
+
+    def _match_radius(self, alerts: List[Alert], matched: List[Set[str]]):
+        # Alerts with a polygon are matched against the polygon itself
+        point_alerts = [
+            i for i, alert in enumerate(alerts)
+            if alert.latitude and alert.longitude and not alert.polygon
+        ]
+        if not point_alerts:
+            return
+
+        user_snapshot.ensure_loaded(self.db)
+        user_ids, user_lat, user_lon, user_radius = user_snapshot.location_columns()
+        if len(user_ids) == 0:
+            return
+
+        alert_lat = np.radians(np.array([alerts[i].latitude for i in point_alerts], dtype=np.float64))
+        alert_lon = np.radians(np.array([alerts[i].longitude for i in point_alerts], dtype=np.float64))
+        alert_radius = np.array([alerts[i].radius_miles or 0.0 for i in point_alerts], dtype=np.float64)
+
+        rows_per_chunk = max(1, MAX_MATRIX_CELLS // len(user_ids))
+
+        for start in range(0, len(point_alerts), rows_per_chunk):
+            end = start + rows_per_chunk
+            distances = haversine_matrix(alert_lat[start:end], alert_lon[start:end], user_lat, user_lon)
+
+            # User is in range when within alert radius + their preference radius
+            in_range = distances <= (alert_radius[start:end, None] + user_radius[None, :])
+
+            for row, alert_index in enumerate(point_alerts[start:end]):
+                matched[alert_index].update(user_ids[in_range[row]])
+
+    def _match_polygons(self, alerts: List[Alert], matched: List[Set[str]]):
+        polygon_alerts = [i for i, alert in enumerate(alerts) if alert.polygon]
+        if not polygon_alerts:
+            return
+
+        user_snapshot.ensure_loaded(self.db)
+        user_ids, user_lat, user_lon, user_radius = user_snapshot.location_columns()
+        if len(user_ids) == 0:
+            return
+
+        user_lat = np.degrees(user_lat)
+        user_lon = np.degrees(user_lon)
+        max_radius = float(user_radius.max())
+
+        for i in polygon_alerts:
+            try:
+                polygon = shape(alerts[i].polygon)
+            except Exception as e:
+                logger.error(f"Invalid polygon on alert {alerts[i].id}: {e}")
+                continue
+
+            min_lon, min_lat, max_lon, max_lat = polygon.bounds
+            kx, ky = GeoService.local_miles_scale((min_lat + max_lat) / 2)
+
+            # Bounding box pre-filter, padded by the largest user radius
+            candidates = np.nonzero(
+                (user_lat >= min_lat - max_radius / ky) &
+                (user_lat <= max_lat + max_radius / ky) &
+                (user_lon >= min_lon - max_radius / kx) &
+                (user_lon <= max_lon + max_radius / kx)
+            )[0]
+            if len(candidates) == 0:
+                continue
+
+            shapely.prepare(polygon)
+            hit = shapely.contains_xy(polygon, user_lon[candidates], user_lat[candidates])
+
+            # Users outside the polygon still match when its boundary is within their radius
+            outside = ~hit
+            if outside.any():
+                polygon_miles = shapely.transform(polygon, lambda coords: coords * [kx, ky])
+                points = shapely.points(
+                    user_lon[candidates][outside] * kx,
+                    user_lat[candidates][outside] * ky
+                )
+                hit[outside] = shapely.distance(polygon_miles, points) <= user_radius[candidates][outside]
+
+            matched[i].update(user_ids[candidates[hit]])
+
+    def _match_zones(self, alerts: List[Alert], matched: List[Set[str]]):
+        zones = self.db.query(AlertZone).filter(
+            AlertZone.is_active == True
+        ).all()
+
+        for zone in zones:
+            for i, alert in enumerate(alerts):
+                if zone.user_id in matched[i]:
+                    continue
+
+                if zone.polygon:
+                    hit = GeoService.alert_intersects_polygon(alert, zone.polygon)
+                else:
+                    hit = GeoService.alert_within_radius(
+                        alert,
+                        zone.center_latitude,
+                        zone.center_longitude,
+                        zone.radius_miles
+                    )
+
+                if hit:
+                    matched[i].add(zone.user_id)
+
+    def _match_counties(self, alerts: List[Alert], matched: List[Set[str]]):
+        if not any(alert.affected_counties for alert in alerts):
+            return
+
+        county_index.ensure_loaded(self.db)
+        for i, alert in enumerate(alerts):
+            if alert.affected_counties:
+                matched[i] |= county_index.subscribers_for_counties(alert.affected_counties)
+
+    def _dedupe_event_groups(self, alerts: List[Alert], matched: List[Set[str]]):
+        groups: Dict[Tuple, List[int]] = {}
+        for i, alert in enumerate(alerts):
+            groups.setdefault(self._event_key(alert), []).append(i)
+
+        for indexes in groups.values():
+            if len(indexes) < 2:
+                continue
+
+            # Most severe alert of the event keeps the shared users
+            indexes.sort(key=lambda i: SEVERITY_CODES.get(alerts[i].severity, 1), reverse=True)
+            seen: Set[str] = set()
+            for i in indexes:
+                matched[i] -= seen
+                seen |= matched[i]
+
+    @staticmethod
+    def _event_key(alert: Alert) -> Tuple:
+        # Updates of one NWS warning share an event id; other alerts are their own event
+        metadata = alert.alert_metadata or {}
+        return (alert.source, metadata.get("event_id") or alert.external_id or alert.id)
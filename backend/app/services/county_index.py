@@ -0,0 +1,131 @@
+"""
+County subscription index
+Inverted index from county name to subscribed user ids, kept current from
+User changes committed in this or any other process, and rebuilt
+periodically to catch changes made outside the ORM
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.user_events import UserChange, on_user_change, subscribe_remote_changes
+from app.models.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class CountySubscriptionIndex:
+    """In-memory county -> user id index used for county-based targeting"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._user_counties: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._built_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self, db: Session):
+        """Build the index from the database when first needed, and again once it is due a refresh."""
+        if not self._loaded or time.monotonic() - self._built_at >= settings.USER_INDEX_REFRESH_SECONDS:
+            # Subscribe first so changes committed during the rebuild are not missed
+            subscribe_remote_changes()
+            self.rebuild(db)
+
+    def rebuild(self, db: Session):
+        """Rebuild the whole index from active users with county subscriptions."""
+        rows = db.query(User.id, User.subscribed_counties).filter(
+            User.is_active == True,
+            User.subscribed_counties != None
+        ).all()
+
+        subscribers: Dict[str, Set[str]] = {}
+        user_counties: Dict[str, Set[str]] = {}
+
+        for user_id, counties in rows:
+            counties = set(counties or [])
+            if not counties:
+                continue
+            user_counties[user_id] = counties
+            for county in counties:
+                subscribers.setdefault(county, set()).add(user_id)
+
+        with self._lock:
+            self._subscribers = subscribers
+            self._user_counties = user_counties
+            self._loaded = True
+            self._built_at = time.monotonic()
+
+        logger.info(f"County index built for {len(user_counties)} users across {len(subscribers)} counties")
+
+    def update_user(self, user_id: str, counties: Optional[Iterable[str]], is_active: bool = True):
+        """Apply a single user's current county subscriptions."""
+        new_counties = set(counties or []) if is_active else set()
+
+        with self._lock:
+            old_counties = self._user_counties.get(user_id, set())
+            if old_counties == new_counties:
+                return
+
+            removed = old_counties - new_counties
+            added = new_counties - old_counties
+
+            for county in removed:
+                members = self._subscribers.get(county)
+                if members is not None:
+                    members.discard(user_id)
+                    if not members:
+                        del self._subscribers[county]
+
+            for county in added:
+                self._subscribers.setdefault(county, set()).add(user_id)
+
+            if new_counties:
+                self._user_counties[user_id] = new_counties
+            else:
+                self._user_counties.pop(user_id, None)
+
+    def remove_user(self, user_id: str):
+        self.update_user(user_id, None, is_active=False)
+
+    def subscribers_for_counties(self, counties: Optional[Iterable[str]]) -> Set[str]:
+        """Return ids of users subscribed to any of the given counties."""
+        result: Set[str] = set()
+        with self._lock:
+            for county in counties or []:
+                members = self._subscribers.get(county)
+                if members:
+                    result |= members
+        return result
+
+    def counties_for_user(self, user_id: str) -> Set[str]:
+        """Counties a user is subscribed to, empty until the index is loaded."""
+        with self._lock:
+            return set(self._user_counties.get(user_id, ()))
+
+    def counts_by_county(self) -> Dict[str, int]:
+        with self._lock:
+            return {county: len(members) for county, members in self._subscribers.items()}
+
+
+# Create singleton instance
+county_index = CountySubscriptionIndex()
+
+
+@on_user_change
+def _apply_user_change(change: UserChange):
+    # Until the first rebuild the database is the source of truth
+    if not county_index.loaded:
+        return
+
+    if change.deleted:
+        county_index.remove_user(change.user_id)
+    else:
+        county_index.update_user(change.user_id, change.subscribed_counties, change.is_active)
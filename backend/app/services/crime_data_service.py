@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
 from app.models.models import Alert, AlertCategory, AlertSeverity
+from app.services.hawaii_boundaries import hawaii_boundaries
 
 logger = logging.getLogger(__name__)
 
@@ -164,6 +165,11 @@ class CrimeDataService:
                     severity = sev
                     break
             
+            # Fall back to the boundary index when the feed has no county
+            county = incident.get("county")
+            if not county and incident.get("latitude") and incident.get("longitude"):
+                county = hawaii_boundaries.county_for_point(incident["latitude"], incident["longitude"])
+            
             # Create alert
             alert = Alert(
                 external_id=f"crime_{incident['id']}",
@@ -175,7 +181,7 @@ class CrimeDataService:
                 latitude=incident.get("latitude"),
                 longitude=incident.get("longitude"),
                 radius_miles=0.5,  # Small radius for specific incidents
-                affected_counties=[incident.get("county")] if incident.get("county") else [],
+                affected_counties=[county] if county else [],
                 effective_time=datetime.fromisoformat(incident.get("date", datetime.now(timezone.utc).isoformat())),
                 expires_time=datetime.now(timezone.utc) + timedelta(hours=24),  # Expire after 24 hours
                 source=f"Crime Data - {incident.get('source', 'Unknown')}",
@@ -4,6 +4,7 @@ Fetches weather alerts, warnings, and watches for Hawaii
 """
 import httpx
 import logging
+import time
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import asyncio
@@ -11,9 +12,14 @@ import asyncio
 from app.core.config import settings
 from app.models.models import Alert, AlertSeverity, AlertCategory, User
 from app.core.database import SessionLocal
+from app.services.alert_latency import alert_latency
+from app.services.hawaii_boundaries import hawaii_boundaries
 
 logger = logging.getLogger(__name__)
 
+# VTEC actions that end an event rather than describe the one the alert is about
+VTEC_ENDING_ACTIONS = {"CAN", "EXP", "UPG"}
+
 class NWSAPIClient:
     """Client for fetching alerts from National Weather Service API"""
     
@@ -139,10 +145,21 @@ class NWSAPIClient:
                 
         return (20.7984, -156.3319)
     
-    def _extract_affected_counties(self, properties: Dict[str, Any]) -> List[str]:
-        """Extract affected counties from NWS alert properties"""
+    def _extract_affected_counties(
+        self,
+        properties: Dict[str, Any],
+        geometry: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
+        """Extract affected counties from NWS alert properties and geometry"""
         counties = []
         
+        # Counties the alert polygon actually touches
+        if geometry and geometry.get("coordinates"):
+            try:
+                counties.extend(hawaii_boundaries.counties_for_geometry(geometry))
+            except Exception as e:
+                logger.error(f"Error locating NWS alert geometry: {e}")
+        
         # Check areaDesc field
         if "areaDesc" in properties:
             area_desc = properties["areaDesc"].upper()
@@ -160,6 +177,49 @@ class NWSAPIClient:
         # Remove duplicates
         return list(set(counties)) if counties else ["Hawaii County"]
     
+    def _event_id(self, properties: Dict[str, Any]) -> str:
+        """Identity of the warning an NWS alert belongs to, shared by all of its updates"""
+        # /k.aaa.cccc.pp.s.####.yymmddThhnnZ-yymmddThhnnZ/: office, phenomenon, significance, ETN
+        events = []
+        for code in (properties.get("parameters") or {}).get("VTEC", []):
+            parts = code.strip("/").split(".")
+            if len(parts) >= 6:
+                events.append((parts[1], ".".join(parts[2:6])))
+        if events:
+            current = [event for action, event in events if action not in VTEC_ENDING_ACTIONS]
+            return f"vtec:{(current or [event for _, event in events])[0]}"
+        
+        # Statements without VTEC continue the earliest message they reference
+        references = sorted(properties.get("references") or [], key=lambda ref: ref.get("sent") or "")
+        if references and references[0].get("identifier"):
+            return f"cap:{references[0]['identifier']}"
+        return f"cap:{properties.get('id', '')}"
+    
+    def _inherit_event_ids(self, db, alerts: List[Alert]):
+        """Give statements the event of a stored alert they reference, whose chain may start earlier"""
+        referencing = [alert for alert in alerts if alert.alert_metadata.get("references")]
+        if not referencing:
+            return
+        
+        external_ids = {
+            f"nws_{identifier}"
+            for alert in referencing
+            for identifier in alert.alert_metadata["references"]
+        }
+        event_ids = {
+            external_id: (metadata or {}).get("event_id")
+            for external_id, metadata in db.query(Alert.external_id, Alert.alert_metadata).filter(
+                Alert.external_id.in_(external_ids)
+            )
+        }
+        for alert in referencing:
+            if alert.alert_metadata["event_id"].startswith("vtec:"):
+                continue
+            for identifier in alert.alert_metadata["references"]:
+                if event_ids.get(f"nws_{identifier}"):
+                    alert.alert_metadata["event_id"] = event_ids[f"nws_{identifier}"]
+                    break
+    
     async def convert_to_alerts(self, nws_alerts: List[Dict[str, Any]]) -> List[Alert]:
         """Convert NWS API response to our Alert model"""
         alerts = []
@@ -188,7 +248,8 @@ class NWSAPIClient:
                     latitude=lat,
                     longitude=lon,
                     radius_miles=50,  # Default radius for NWS alerts
-                    affected_counties=self._extract_affected_counties(props),
+                    polygon=geometry if geometry and geometry.get("coordinates") else None,
+                    affected_counties=self._extract_affected_counties(props, geometry),
                     effective_time=datetime.fromisoformat(
                         props.get("effective", datetime.utcnow().isoformat()).replace("Z", "+00:00")
                     ),
@@ -203,7 +264,11 @@ class NWSAPIClient:
                         "certainty": props.get("certainty"),
                         "response": props.get("response"),
                         "instruction": props.get("instruction"),
-                        "parameters": props.get("parameters", {})
+                        "parameters": props.get("parameters", {}),
+                        "event_id": self._event_id(props),
+                        "references": [
+                            ref["identifier"] for ref in props.get("references") or [] if ref.get("identifier")
+                        ]
                     },
                     is_active=True,
                     is_test=False
@@ -224,13 +289,19 @@ class NWSAPIClient:
         try:
             # Fetch alerts from API
             nws_data = await self.fetch_alerts()
+            fetched_at = time.time()
             alerts = await self.convert_to_alerts(nws_data)
+            parsed_at = time.time()
             
             logger.info(f"Fetched {len(alerts)} alerts from NWS")
             
             # Save to database
             db = SessionLocal()
+            new_alerts = []
+            new_alert_ids = []
             try:
+                self._inherit_event_ids(db, alerts)
+                
                 for alert in alerts:
                     # Check if alert already exists
                     existing = db.query(Alert).filter(
@@ -247,40 +318,52 @@ class NWSAPIClient:
                         # Add new alert
                         db.add(alert)
                         db.flush()  # Get ID before commit
-                        
-                        # Send notifications for new alerts
-                        asyncio.create_task(self._send_notifications_for_alert(db, alert))
-                        
+                        new_alerts.append(alert)
+                        new_alert_ids.append(alert.id)
+                
+                alert_latency.ingested(new_alerts, fetched_at, parsed_at)
                 db.commit()
                 logger.info(f"Successfully synced {len(alerts)} NWS alerts")
                 
             finally:
                 db.close()
+            
+            # Match and notify all new alerts from this sync as one batch
+            if new_alert_ids:
+                asyncio.create_task(self._send_notifications_for_alerts(new_alert_ids))
                 
         except Exception as e:
             logger.error(f"Error syncing NWS alerts: {e}")
     
-    async def _send_notifications_for_alert(self, db, alert: Alert):
-        """Send notifications to affected users for new alert"""
+    async def _send_notifications_for_alerts(self, alert_ids: List[str]):
+        """Send notifications to affected users for a batch of new alerts"""
+        from app.services.audience_matcher import AudienceMatcher
+        from app.services.notification_service import NotificationService
+        
+        db = SessionLocal()
         try:
-            from app.services.geo_service import GeoService
-            from app.services.notification_service import NotificationService
+            alerts = db.query(Alert).filter(Alert.id.in_(alert_ids)).all()
             
-            # Find affected users
-            geo_service = GeoService()
-            affected_users = geo_service.get_users_in_alert_area(db, alert, User)
+            # One pass over the users for the whole batch
+            audiences = AudienceMatcher(db).match_alerts(alerts)
+            for alert in alerts:
+                alert_latency.stamp(alert, "match")
+            notification_service = NotificationService()
             
-            if affected_users:
-                logger.info(f"Sending notifications to {len(affected_users)} users for alert {alert.id}")
-                
-                # Send notifications
-                notification_service = NotificationService()
-                await notification_service.send_alert_notifications(db, alert, affected_users)
-            else:
-                logger.info(f"No users affected by alert {alert.id}")
-                
+            for alert, affected_users in zip(alerts, audiences):
+                try:
+                    if affected_users:
+                        logger.info(f"Sending notifications to {len(affected_users)} users for alert {alert.id}")
+                        await notification_service.send_alert_notifications(db, alert, affected_users)
+                    else:
+                        logger.info(f"No users affected by alert {alert.id}")
+                except Exception as e:
+                    logger.error(f"Error sending notifications for alert {alert.id}: {e}")
+                    
         except Exception as e:
-            logger.error(f"Error sending notifications for alert {alert.id}: {e}")
+            logger.error(f"Error matching audiences for {len(alert_ids)} NWS alerts: {e}")
+        finally:
+            db.close()
 
 # Create singleton instance
 nws_client = NWSAPIClient()
\ No newline at end of file
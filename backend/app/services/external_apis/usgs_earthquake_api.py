@@ -4,13 +4,20 @@ Fetches earthquake data for Hawaii region
 """
 import httpx
 import logging
+import time
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import asyncio
 
+from shapely.affinity import scale
+from shapely.geometry import Point
+
 from app.core.config import settings
 from app.models.models import Alert, AlertSeverity, AlertCategory
 from app.core.database import SessionLocal
+from app.services.alert_latency import alert_latency
+from app.services.geo_service import GeoService
+from app.services.hawaii_boundaries import hawaii_boundaries, DEFAULT_SNAP_MILES
 
 logger = logging.getLogger(__name__)
 
@@ -103,38 +110,33 @@ class USGSEarthquakeAPIClient:
         place = properties.get("place", "")
         
         # Determine which island based on coordinates
-        island = "Hawaii"
-        if 20.5 <= lat <= 21.5 and -158.5 <= lon <= -157.5:
-            island = "Oahu"
-        elif 20.5 <= lat <= 21.3 and -157.0 <= lon <= -156.0:
-            island = "Maui"
-        elif 21.8 <= lat <= 22.3 and -160.0 <= lon <= -159.0:
-            island = "Kauai"
-        elif 18.9 <= lat <= 20.3 and -156.1 <= lon <= -154.8:
+        island = hawaii_boundaries.island_for_point(lat, lon)
+        if island == "Hawaii":
             island = "Big Island"
+        elif not island:
+            island = "Hawaii"
             
         if place:
             return f"{place} - {island}"
         else:
             return f"Near {island}"
             
-    def _determine_affected_counties(self, lat: float, lon: float) -> List[str]:
+    def _determine_affected_counties(self, lat: float, lon: float, radius_miles: float = 0) -> List[str]:
         """Determine affected counties based on coordinates"""
-        counties = []
+        # Every county within the felt radius of the epicenter
+        if radius_miles > 0:
+            kx, ky = GeoService.local_miles_scale(lat)
+            felt_area = scale(Point(lon, lat).buffer(1.0), xfact=radius_miles / kx, yfact=radius_miles / ky)
+            counties = hawaii_boundaries.counties_for_geometry(felt_area)
+            if counties:
+                return counties
         
-        # Simple geographic boundaries for Hawaii counties
-        if 18.9 <= lat <= 20.3 and -156.1 <= lon <= -154.8:
-            counties.append("Hawaii County")
-        if 20.5 <= lat <= 21.5 and -158.5 <= lon <= -157.5:
-            counties.append("Honolulu County")
-        if 20.5 <= lat <= 21.3 and -157.0 <= lon <= -156.0:
-            counties.append("Maui County")
-            if 20.7 <= lat <= 21.0:
-                counties.append("Kalawao County")  # Molokai
-        if 21.8 <= lat <= 22.3 and -160.0 <= lon <= -159.0:
-            counties.append("Kauai County")
+        # Small offshore events are attributed to the nearest county
+        county = hawaii_boundaries.county_for_point(
+            lat, lon, max_distance_miles=max(radius_miles, DEFAULT_SNAP_MILES)
+        )
             
-        return counties if counties else ["Hawaii County"]
+        return [county] if county else ["Hawaii County"]
     
     async def convert_to_alerts(self, earthquakes: List[Dict[str, Any]]) -> List[Alert]:
         """Convert USGS earthquake data to our Alert model"""
@@ -179,7 +181,9 @@ class USGSEarthquakeAPIClient:
                     latitude=lat,
                     longitude=lon,
                     radius_miles=self._calculate_radius(magnitude),
-                    affected_counties=self._determine_affected_counties(lat, lon),
+                    affected_counties=self._determine_affected_counties(
+                        lat, lon, self._calculate_radius(magnitude)
+                    ),
                     effective_time=alert_time,
                     expires_time=alert_time + timedelta(hours=expires_hours),
                     source="USGS Earthquake Hazards Program",
@@ -195,6 +199,8 @@ class USGSEarthquakeAPIClient:
                         "tsunami": props.get("tsunami", 0),
                         "event_type": props.get("type", "earthquake")
                     },
+                    # effective_time is server-local; latency is measured from the true origin
+                    lifecycle={"origin": props["time"] / 1000} if props.get("time") else None,
                     is_active=True,
                     is_test=False
                 )
@@ -213,13 +219,22 @@ class USGSEarthquakeAPIClient:
         
         try:
             all_alerts = []
+            fetched_at = {}
+            parsed_at = {}
             
             # Fetch different time ranges
             for time_range in ["hour", "day"]:
                 earthquakes = await self.fetch_earthquakes(time_range)
+                fetched = time.time()
                 alerts = await self.convert_to_alerts(earthquakes)
+                parsed = time.time()
                 all_alerts.extend(alerts)
                 
+                # First sighting of each event counts
+                for alert in alerts:
+                    fetched_at.setdefault(alert.external_id, fetched)
+                    parsed_at.setdefault(alert.external_id, parsed)
+                
             # Remove duplicates based on external_id
             unique_alerts = {alert.external_id: alert for alert in all_alerts}
             alerts = list(unique_alerts.values())
@@ -236,14 +251,17 @@ class USGSEarthquakeAPIClient:
                     ).first()
                     
                     if existing:
-                        # Update existing alert
+                        # Update existing alert, keeping its recorded lifecycle
                         for key, value in alert.__dict__.items():
-                            if not key.startswith('_'):
+                            if not key.startswith('_') and key != 'lifecycle':
                                 setattr(existing, key, value)
                         existing.updated_at = datetime.utcnow()
                     else:
                         # Add new alert
                         db.add(alert)
+                        alert_latency.ingested(
+                            [alert], fetched_at[alert.external_id], parsed_at[alert.external_id]
+                        )
                         
                 db.commit()
                 logger.info(f"Successfully synced {len(alerts)} USGS earthquake alerts")
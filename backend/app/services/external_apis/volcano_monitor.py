@@ -8,10 +8,12 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import asyncio
 import re
+import time
 
 from app.core.config import settings
 from app.models.models import Alert, AlertSeverity, AlertCategory
 from app.core.database import SessionLocal
+from app.services.alert_latency import alert_latency
 
 logger = logging.getLogger(__name__)
 
@@ -223,6 +225,7 @@ class HawaiiVolcanoMonitor:
         
         try:
             alerts = await self.generate_volcano_alerts()
+            generated_at = time.time()
             logger.info(f"Generated {len(alerts)} volcano alerts")
             
             # Save to database
@@ -241,8 +244,9 @@ class HawaiiVolcanoMonitor:
                                 setattr(existing, key, value)
                         existing.updated_at = datetime.utcnow()
                     else:
-                        # Add new alert
+                        # Add new alert; status is fetched and parsed in one pass
                         db.add(alert)
+                        alert_latency.ingested([alert], generated_at, generated_at)
                         
                 db.commit()
                 logger.info(f"Successfully synced {len(alerts)} volcano alerts")
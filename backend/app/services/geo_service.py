@@ -1,13 +1,19 @@
 import math
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from shapely.geometry import Point, Polygon, shape
 from shapely.ops import transform
+import shapely
 import pyproj
 from app.models.models import Alert
 import logging
 
 logger = logging.getLogger(__name__)
 
+MILES_PER_DEGREE = 69.0
+
+# Max ids per IN clause when loading matched users
+USER_FETCH_CHUNK_SIZE = 500
+
 class GeoService:
     """Service for geographic calculations and spatial queries"""
     
@@ -47,6 +53,23 @@ class GeoService:
             logger.error(f"Error checking point in polygon: {e}")
             return False
     
+    @staticmethod
+    def local_miles_scale(latitude: float) -> Tuple[float, float]:
+        """
+        Miles per degree of longitude and latitude around a latitude,
+        for distance tests in a local equirectangular plane
+        """
+        return MILES_PER_DEGREE * math.cos(math.radians(latitude)), MILES_PER_DEGREE
+    
+    @staticmethod
+    def polygon_distance_miles(polygon_geojson: Dict, lat: float, lon: float) -> float:
+        """
+        Distance in miles from a point to a GeoJSON polygon (0 when inside)
+        """
+        kx, ky = GeoService.local_miles_scale(lat)
+        polygon_miles = shapely.transform(shape(polygon_geojson), lambda coords: coords * [kx, ky])
+        return polygon_miles.distance(Point(lon * kx, lat * ky))
+    
     @staticmethod
     def alert_within_radius(
         alert: Alert,
@@ -57,7 +80,15 @@ class GeoService:
         """
         Check if an alert is within a radius of a center point
         """
-        if alert.latitude and alert.longitude:
+        if alert.polygon:
+            # Polygon alert - check if any part of the polygon falls inside the circle
+            try:
+                return GeoService.polygon_distance_miles(alert.polygon, center_lat, center_lon) <= radius_miles
+            except Exception as e:
+                logger.error(f"Error checking polygon distance: {e}")
+                return False
+        
+        elif alert.latitude and alert.longitude:
             # Point alert
             distance = GeoService.haversine_distance(
                 center_lat, center_lon,
@@ -70,20 +101,6 @@ class GeoService:
             else:
                 return distance <= radius_miles
         
-        elif alert.polygon:
-            # Polygon alert - check if any part overlaps with circle
-            # This is a simplified check - just check if polygon center is within extended radius
-            polygon_obj = shape(alert.polygon)
-            centroid = polygon_obj.centroid
-            
-            distance = GeoService.haversine_distance(
-                center_lat, center_lon,
-                centroid.y, centroid.x
-            )
-            
-            # Add some buffer for polygon size
-            return distance <= (radius_miles + 20)
-        
         return False
     
     @staticmethod
@@ -124,110 +141,39 @@ class GeoService:
         """
         Get simplified polygons for Hawaiian islands
         """
-        # Simplified island boundaries (would be more detailed in production)
-        islands = {
-            "Hawaii": [
-                (-155.5, 19.0), (-155.0, 19.0), (-154.8, 19.5),
-                (-154.8, 20.2), (-155.5, 20.2), (-156.0, 19.5),
-                (-155.5, 19.0)
-            ],
-            "Maui": [
-                (-156.7, 20.6), (-156.0, 20.6), (-155.9, 21.0),
-                (-156.3, 21.0), (-156.7, 20.8), (-156.7, 20.6)
-            ],
-            "Oahu": [
-                (-158.3, 21.3), (-157.7, 21.3), (-157.7, 21.7),
-                (-158.3, 21.7), (-158.3, 21.3)
-            ],
-            "Kauai": [
-                (-159.8, 21.9), (-159.3, 21.9), (-159.3, 22.2),
-                (-159.8, 22.2), (-159.8, 21.9)
-            ],
-            "Molokai": [
-                (-157.3, 21.0), (-156.7, 21.0), (-156.7, 21.2),
-                (-157.3, 21.2), (-157.3, 21.0)
-            ],
-            "Lanai": [
-                (-157.0, 20.7), (-156.8, 20.7), (-156.8, 20.9),
-                (-157.0, 20.9), (-157.0, 20.7)
-            ]
-        }
+        from app.services.hawaii_boundaries import hawaii_boundaries
         
-        return {
-            name: Polygon(coords)
-            for name, coords in islands.items()
-        }
+        return hawaii_boundaries.island_polygons()
     
     @staticmethod
     def get_users_in_alert_area(
         db,
         alert: Alert,
         User
-    ) -> List[User]:
+    ) -> List:
         """
         Find all users who should receive this alert based on location
         """
-        from sqlalchemy import or_, and_
+        from app.services.audience_matcher import AudienceMatcher
         
+        return AudienceMatcher(db).match_alerts([alert])[0]
+    
+    @staticmethod
+    def _fetch_active_users(db, User, user_ids: Iterable[str]) -> List:
+        """
+        Load active users by id using chunked IN queries
+        """
+        user_ids = list(user_ids)
         users = []
         
-        if alert.latitude and alert.longitude:
-            # For point/radius alerts, find users within range
-            # This is a simplified query - in production would use PostGIS
-            all_users = db.query(User).filter(
-                User.is_active == True,
-                User.home_latitude != None,
-                User.home_longitude != None
-            ).all()
-            
-            for user in all_users:
-                distance = GeoService.haversine_distance(
-                    alert.latitude, alert.longitude,
-                    user.home_latitude, user.home_longitude
-                )
-                
-                # Check if user is within alert radius + their preference radius
-                total_radius = (alert.radius_miles or 0) + user.alert_radius_miles
-                if distance <= total_radius:
-                    users.append(user)
-        
-        # Also check users with custom alert zones
-        from app.models.models import AlertZone
-        zones = db.query(AlertZone).filter(
-            AlertZone.is_active == True
-        ).all()
-        
-        for zone in zones:
-            if zone.user_id not in [u.id for u in users]:
-                # Check if alert matches zone
-                if zone.polygon:
-                    if GeoService.alert_intersects_polygon(alert, zone.polygon):
-                        user = db.query(User).filter(User.id == zone.user_id).first()
-                        if user and user.is_active:
-                            users.append(user)
-                else:
-                    if GeoService.alert_within_radius(
-                        alert,
-                        zone.center_latitude,
-                        zone.center_longitude,
-                        zone.radius_miles
-                    ):
-                        user = db.query(User).filter(User.id == zone.user_id).first()
-                        if user and user.is_active:
-                            users.append(user)
-        
-        # Check county subscriptions
-        if alert.affected_counties:
-            county_users = db.query(User).filter(
-                User.is_active == True,
-                User.subscribed_counties != None
-            ).all()
-            
-            for user in county_users:
-                if user.id not in [u.id for u in users]:
-                    user_counties = user.subscribed_counties or []
-                    if any(county in user_counties for county in alert.affected_counties):
-                        users.append(user)
+        for i in range(0, len(user_ids), USER_FETCH_CHUNK_SIZE):
+            chunk = user_ids[i:i + USER_FETCH_CHUNK_SIZE]
+            users.extend(
+                db.query(User).filter(
+                    User.id.in_(chunk),
+                    User.is_active == True
+                ).all()
+            )
         
         return users
     
@@ -0,0 +1,115 @@
+"""
+Hawaii island and county boundaries
+Loads the bundled simplified boundary dataset once into prepared geometries
+behind an STRtree for fast point and geometry lookups
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Union
+
+from shapely.geometry import Point, shape
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BOUNDARIES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "hawaii_boundaries.geojson"
+)
+
+# The dataset is simplified, so points just off the modelled coastline
+# (beaches, harbors) are snapped to the nearest island within this distance
+DEFAULT_SNAP_MILES = 3.0
+
+MILES_PER_DEGREE = 69.0
+
+
+class HawaiiBoundaryIndex:
+    """Point-location index over Hawaii island/county polygons"""
+
+    def __init__(self, path: str = BOUNDARIES_PATH):
+        with open(path) as f:
+            data = json.load(f)
+
+        self.geometries: List[BaseGeometry] = []
+        self.islands: List[str] = []
+        self.counties: List[str] = []
+
+        for feature in data["features"]:
+            props = feature["properties"]
+            self.geometries.append(shape(feature["geometry"]))
+            self.islands.append(props["island"])
+            self.counties.append(props["county"])
+
+        self._prepared = [prep(geom) for geom in self.geometries]
+        self._tree = STRtree(self.geometries)
+
+        self._island_polygons: Dict[str, BaseGeometry] = {}
+        for island in dict.fromkeys(self.islands):
+            self._island_polygons[island] = unary_union([
+                geom for geom, name in zip(self.geometries, self.islands) if name == island
+            ])
+
+        logger.info(f"Loaded {len(self.geometries)} Hawaii boundary polygons")
+
+    def _locate(self, lat: float, lon: float, max_distance_miles: float) -> Optional[int]:
+        """Index of the feature containing the point, or the nearest one within range."""
+        point = Point(lon, lat)
+
+        for i in self._tree.query(point):
+            if self._prepared[i].intersects(point):
+                return int(i)
+
+        if max_distance_miles <= 0:
+            return None
+
+        nearest = self._tree.query_nearest(
+            point, max_distance=max_distance_miles / MILES_PER_DEGREE
+        )
+        return int(nearest[0]) if len(nearest) else None
+
+    def county_for_point(
+        self,
+        lat: float,
+        lon: float,
+        max_distance_miles: float = DEFAULT_SNAP_MILES
+    ) -> Optional[str]:
+        """County containing the point, or the nearest county within range."""
+        index = self._locate(lat, lon, max_distance_miles)
+        return self.counties[index] if index is not None else None
+
+    def island_for_point(
+        self,
+        lat: float,
+        lon: float,
+        max_distance_miles: float = DEFAULT_SNAP_MILES
+    ) -> Optional[str]:
+        """Island containing the point, or the nearest island within range."""
+        index = self._locate(lat, lon, max_distance_miles)
+        return self.islands[index] if index is not None else None
+
+    def counties_for_geometry(self, geometry: Union[BaseGeometry, Dict]) -> List[str]:
+        """Counties intersecting a shapely geometry or GeoJSON geometry dict."""
+        if isinstance(geometry, dict):
+            geometry = shape(geometry)
+
+        matched = {
+            self.counties[i]
+            for i in self._tree.query(geometry)
+            if self._prepared[i].intersects(geometry)
+        }
+
+        return [county for county in settings.HAWAII_COUNTIES if county in matched]
+
+    def island_polygons(self) -> Dict[str, BaseGeometry]:
+        """Island name -> boundary geometry."""
+        return dict(self._island_polygons)
+
+
+# Create singleton instance
+hawaii_boundaries = HawaiiBoundaryIndex()
@@ -0,0 +1,181 @@
+"""
+Rendered notification messages
+Builds the email, SMS, voice and push content of an alert once per language and
+channel and keeps it in an LRU keyed by alert version, so every recipient
+of a blast shares the same rendered payload
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.models.models import Alert, AlertSeverity
+
+SEVERITY_COLORS = {
+    AlertSeverity.MINOR: "f39c12",
+    AlertSeverity.MODERATE: "e67e22",
+    AlertSeverity.SEVERE: "e74c3c",
+    AlertSeverity.EXTREME: "c0392b"
+}
+
+# Voice calls are always read in English
+LANGUAGE_INDEPENDENT_CHANNELS = {"voice"}
+
+# Lock screens truncate anything longer
+PUSH_BODY_MAX_LENGTH = 178
+
+
+class MessageRenderer:
+    """LRU of rendered payloads per (alert, version, language, channel)"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, alert: Alert, language: Optional[str], channel: str) -> Dict:
+        """
+        Payload for one variant of an alert. The returned dict is shared by
+        every recipient of that variant and must not be mutated.
+        """
+        key = self._key(alert, language, channel)
+
+        with self._lock:
+            payload = self._cache.get(key)
+            if payload is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return payload
+
+        renderer = getattr(self, f"_render_{channel}", None)
+        if renderer is None:
+            raise ValueError(f"No message template for channel: {channel}")
+        payload = renderer(alert, key[2])
+
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = payload
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return payload
+
+    def message_key(self, alert: Alert, language: Optional[str], channel: str) -> str:
+        """Stable id of a rendered variant; recipients sharing it can be batched."""
+        alert_id, version, language, channel = self._key(alert, language, channel)
+        return f"{alert_id}:{version.isoformat() if version else ''}:{language or ''}:{channel}"
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _key(self, alert: Alert, language: Optional[str], channel: str) -> Tuple:
+        language = None if channel in LANGUAGE_INDEPENDENT_CHANNELS else (language or "en")
+        return (alert.id, self._version(alert), language, channel)
+
+    @staticmethod
+    def _version(alert: Alert) -> Optional[datetime]:
+        # Edits bump updated_at, so stale renders are never served
+        return alert.updated_at or alert.created_at
+
+    @staticmethod
+    def _translated(alert: Alert, language: str, field: str, default: str) -> str:
+        if language != "en" and alert.translations:
+            return alert.translations.get(language, {}).get(field, default)
+        return default
+
+    def _render_email(self, alert: Alert, language: str) -> Dict:
+        subject = f"[{alert.severity.value.upper()}] {alert.title}"
+
+        # Get translated content if available
+        content = self._translated(alert, language, "description", alert.description)
+
+        html_content = f"""
+        <html>
+            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                <div style="background-color: #{SEVERITY_COLORS.get(alert.severity, "333333")}; color: white; padding: 20px; text-align: center;">
+                    <h1 style="margin: 0;">{alert.severity.value.upper()} ALERT</h1>
+                </div>
+                <div style="padding: 20px;">
+                    <h2>{alert.title}</h2>
+                    <p>{content}</p>
+                    <p><strong>Location:</strong> {alert.location_name or 'Hawaii'}</p>
+                    <p><strong>Effective:</strong> {alert.effective_time.strftime('%Y-%m-%d %H:%M HST')}</p>
+                    {f'<p><strong>Expires:</strong> {alert.expires_time.strftime("%Y-%m-%d %H:%M HST")}</p>' if alert.expires_time else ''}
+                    <hr>
+                    <p style="text-align: center; margin-top: 30px;">
+                        <a href="https://hawaii-emergency.com/alerts/{alert.id}"
+                           style="background-color: #0066cc; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">
+                            View Full Alert
+                        </a>
+                    </p>
+                    <p style="font-size: 12px; color: #666; margin-top: 30px;">
+                        You received this alert because you are subscribed to Hawaii Emergency Network Hub.
+                        <a href="https://hawaii-emergency.com/settings/notifications">Manage your notification preferences</a>
+                    </p>
+                </div>
+            </body>
+        </html>
+        """
+
+        return {"subject": subject, "html": html_content}
+
+    def _render_sms(self, alert: Alert, language: str) -> Dict:
+        # SMS content is limited to 160 chars
+        severity = alert.severity.value.upper()
+        location = alert.location_name or "Hawaii"
+        title = self._translated(alert, language, "title", alert.title)
+
+        message_body = f"{severity}: {title}\nLocation: {location}\nReply STOP to unsubscribe"
+        if len(message_body) > 160:
+            message_body = message_body[:157] + "..."
+
+        return {"body": message_body}
+
+    def _render_voice(self, alert: Alert, language: Optional[str]) -> Dict:
+        twiml = f"""
+        <Response>
+            <Say voice="alice" language="en-US">
+                This is an emergency alert from Hawaii Emergency Network.
+                {alert.severity.value} alert: {alert.title}.
+                Location: {alert.location_name or 'Hawaii'}.
+                Please check your email or app for more details.
+                Press 1 to hear this message again.
+            </Say>
+            <Gather numDigits="1" action="/api/v1/voice/repeat/{alert.id}">
+                <Say>Press 1 to repeat this message.</Say>
+            </Gather>
+        </Response>
+        """
+
+        return {"twiml": twiml}
+
+    def _render_push(self, alert: Alert, language: str) -> Dict:
+        title = self._translated(alert, language, "title", alert.title)
+        description = self._translated(alert, language, "description", alert.description) or ""
+
+        body = f"{alert.location_name or 'Hawaii'}: {description}"
+        if len(body) > PUSH_BODY_MAX_LENGTH:
+            body = body[:PUSH_BODY_MAX_LENGTH - 3] + "..."
+
+        return {
+            "title": f"{alert.severity.value.upper()}: {title}",
+            "body": body,
+            # FCM data values must be strings
+            "data": {
+                "alert_id": str(alert.id),
+                "severity": alert.severity.value,
+                "category": alert.category.value if alert.category else "",
+                "url": f"https://hawaii-emergency.com/alerts/{alert.id}"
+            }
+        }
+
+
+# Create singleton instance
+message_renderer = MessageRenderer(settings.NOTIFICATION_RENDER_CACHE_SIZE)
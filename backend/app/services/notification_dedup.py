@@ -0,0 +1,343 @@
+"""
+Cross-alert notification dedup
+Collapses notifications about one real-world event to at most one send per
+(user, event group, channel) and digest window, unless the severity
+escalates. Updates of one NWS warning, re-synced alerts and daily volcano
+alerts share an event group. A Bloom filter of recent sends lets most
+recipients of a new event skip the exact store, the notification_dedup
+table, which stays the source of truth. Its records are written in the
+transaction that queues the jobs, and pruned once older than the longest
+window
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import Alert, AlertCategory, AlertSeverity, NotificationDedup
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {
+    AlertSeverity.MINOR: 1,
+    AlertSeverity.MODERATE: 2,
+    AlertSeverity.SEVERE: 3,
+    AlertSeverity.EXTREME: 4
+}
+
+KEY_LOOKUP_CHUNK_SIZE = 500
+
+# Records older than the longest digest window are deleted this often
+PRUNE_INTERVAL_SECONDS = 600
+
+
+def event_group(alert: Alert) -> str:
+    """Identity of the real-world event an alert is about."""
+    metadata = alert.alert_metadata or {}
+
+    # Volcano alerts get a new external_id every day
+    if metadata.get("volcano_name"):
+        return f"volcano:{metadata['volcano_name'].lower()}"
+
+    # NWS issues a new id on every update of a warning; see NWSAPIClient._event_id
+    if metadata.get("event_id"):
+        return f"nws:{metadata['event_id']}"
+
+    # Ocean conditions are re-alerted per beach on every sync
+    if alert.category == AlertCategory.MARINE and alert.location_name:
+        return f"marine:{alert.location_name.lower()}"
+
+    return f"alert:{alert.external_id or alert.id}"
+
+
+def dedup_key(user_id: str, group: str, channel: str) -> str:
+    return f"{user_id}:{group}:{channel}"
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # PostgreSQL returns aware timestamps, SQLite naive ones
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys, queried in bulk"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, keys: List[str]) -> np.ndarray:
+        # Double hashing: position i is h1 + i * h2
+        digests = np.frombuffer(
+            b"".join(hashlib.blake2b(key.encode(), digest_size=16).digest() for key in keys),
+            dtype=np.uint64
+        ).reshape(-1, 2)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return (digests[:, :1] + steps * digests[:, 1:]) % np.uint64(self.size)
+
+    def add_many(self, keys: List[str]):
+        if not keys:
+            return
+        positions = self._positions(keys).ravel()
+        masks = (np.uint64(1) << (positions & np.uint64(7))).astype(np.uint8)
+        np.bitwise_or.at(self._bits, positions >> np.uint64(3), masks)
+        self.count += len(keys)
+
+    def contains_many(self, keys: List[str]) -> np.ndarray:
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        bits = (self._bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+
+class NotificationDeduplicator:
+    """Per-user suppression of repeat notifications about one event"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filters: List[BloomFilter] = []  # Current generation first
+        self._generation_started = 0.0
+        self._warmed = False
+        self._pruned_at = 0.0
+
+        self.checked = 0
+        self.suppressed = 0
+        self.escalated = 0
+        self.exact_lookups = 0
+
+    @staticmethod
+    def window(channel_type: str, digest_minutes: Optional[int] = None) -> int:
+        """Digest window of a channel in minutes; 0 sends every alert."""
+        if digest_minutes is None:
+            digest_minutes = settings.NOTIFICATION_DEDUP_WINDOW_MINUTES.get(channel_type, 0)
+        return max(0, min(digest_minutes, settings.NOTIFICATION_DEDUP_MAX_WINDOW_MINUTES))
+
+    def filter(self, db: Session, alert: Alert, jobs: List[Dict], windows: List[int]) -> Tuple[List[Dict], List[str]]:
+        """
+        Jobs (enqueue keyword arguments) that should be sent, recorded as the
+        latest send of their event group, and the dedup keys they were
+        recorded under. windows holds each job's digest window in minutes.
+        Must run first in a transaction: records are flushed, not committed,
+        and a conflict rolls the session back. Pass the keys to remember()
+        once the caller commits.
+        """
+        group = event_group(alert)
+        passthrough = []
+        # A user's push devices share a key and are kept or dropped together
+        candidates: Dict[str, Tuple[List[Dict], int]] = {}
+        for job, minutes in zip(jobs, windows):
+            if minutes <= 0:
+                passthrough.append(job)
+            else:
+                key = dedup_key(job["user_id"], group, job["channel"])
+                candidates.setdefault(key, ([], minutes))[0].append(job)
+        if not candidates:
+            return passthrough, []
+
+        self._prune_expired()
+        self._ensure_warm(db)
+
+        # Keys the filter has never seen certainly have no recent send
+        now = datetime.utcnow()
+        keys = list(candidates)
+        maybe_sent = {key for key, seen in zip(keys, self._might_contain(keys)) if seen}
+        try:
+            kept = self._apply(db, alert, group, candidates, maybe_sent, now)
+        except IntegrityError:
+            # Another process recorded some of these keys first; check them all
+            db.rollback()
+            kept = self._apply(db, alert, group, candidates, set(keys), now)
+
+        return passthrough + [job for key in kept for job in candidates[key][0]], kept
+
+    def remember(self, keys: List[str]):
+        """Add committed sends to the Bloom filter."""
+        self._add(keys)
+
+    def release(self, db: Session, user_id: str, alert_id: str, channel: str):
+        """Forget a send that never arrived so the next alert of its group goes out."""
+        db.query(NotificationDedup).filter(
+            NotificationDedup.user_id == user_id,
+            NotificationDedup.alert_id == alert_id,
+            NotificationDedup.channel == channel
+        ).delete(synchronize_session=False)
+
+    def stats(self) -> Dict:
+        return {
+            "checked": self.checked,
+            "suppressed": self.suppressed,
+            "escalated": self.escalated,
+            "exact_lookups": self.exact_lookups,
+            "filter_generations": [
+                {"keys": bloom.count, "bits": bloom.size, "hashes": bloom.hashes}
+                for bloom in self._filters
+            ]
+        }
+
+    def _apply(
+        self,
+        db: Session,
+        alert: Alert,
+        group: str,
+        candidates: Dict[str, Tuple[List[Dict], int]],
+        exact_keys: Set[str],
+        now: datetime
+    ) -> List[str]:
+        existing = self._load(db, group, {candidates[key][0][0]["user_id"] for key in exact_keys})
+
+        rank = SEVERITY_RANK.get(alert.severity, 0)
+        kept: List[str] = []
+        inserts: List[Dict] = []
+        sends: List[Dict] = []
+        repeats: List[Dict] = []
+        escalated = 0
+        for key, (key_jobs, minutes) in candidates.items():
+            job = key_jobs[0]
+            row = existing.get((job["user_id"], job["channel"])) if key in exact_keys else None
+            if row is None:
+                kept.append(key)
+                inserts.append({
+                    "id": str(uuid.uuid4()),
+                    "user_id": job["user_id"],
+                    "event_group": group,
+                    "channel": job["channel"],
+                    "alert_id": alert.id,
+                    "severity": alert.severity,
+                    "last_sent_at": now,
+                    "suppressed": 0
+                })
+                continue
+
+            escalates = rank > SEVERITY_RANK.get(row.severity, 0)
+            if escalates or now - _naive_utc(row.last_sent_at) >= timedelta(minutes=minutes):
+                escalated += escalates
+                kept.append(key)
+                sends.append({
+                    "id": row.id,
+                    "alert_id": alert.id,
+                    "severity": alert.severity,
+                    "last_sent_at": now,
+                    "suppressed": 0
+                })
+            else:
+                repeats.append({"id": row.id, "suppressed": (row.suppressed or 0) + 1})
+
+        # Bulk statements, one per kind of change
+        if inserts:
+            db.execute(insert(NotificationDedup), inserts)
+        if sends:
+            db.execute(update(NotificationDedup), sends)
+        if repeats:
+            db.execute(update(NotificationDedup), repeats)
+        db.flush()
+
+        self.checked += len(candidates)
+        self.suppressed += len(repeats)
+        self.escalated += escalated
+        if repeats:
+            logger.info(f"Suppressed {len(repeats)} repeat notifications for event group {group}")
+        return kept
+
+    def _load(self, db: Session, group: str, user_ids: Iterable[str]) -> Dict[Tuple[str, str], NotificationDedup]:
+        user_ids = list(user_ids)
+        rows: Dict[Tuple[str, str], NotificationDedup] = {}
+        for i in range(0, len(user_ids), KEY_LOOKUP_CHUNK_SIZE):
+            self.exact_lookups += 1
+            for row in db.query(NotificationDedup).filter(
+                NotificationDedup.event_group == group,
+                NotificationDedup.user_id.in_(user_ids[i:i + KEY_LOOKUP_CHUNK_SIZE])
+            ):
+                rows[(row.user_id, row.channel)] = row
+        return rows
+
+    def _prune_expired(self):
+        # Kept records then all fall inside the Bloom filter's generations
+        if time.monotonic() - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+
+        cutoff = datetime.utcnow() - timedelta(minutes=settings.NOTIFICATION_DEDUP_MAX_WINDOW_MINUTES)
+        db = SessionLocal()
+        try:
+            pruned = db.query(NotificationDedup).filter(
+                NotificationDedup.last_sent_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            if pruned:
+                logger.info(f"Pruned {pruned} expired notification dedup records")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to prune notification dedup records: {e}")
+        finally:
+            db.close()
+
+    def _ensure_warm(self, db: Session):
+        # Sends recorded before this process started, or by other processes
+        if self._warmed:
+            return
+        with self._lock:
+            if self._warmed:
+                return
+            self._rotate()
+            since = datetime.utcnow() - timedelta(minutes=settings.NOTIFICATION_DEDUP_MAX_WINDOW_MINUTES)
+            query = db.query(
+                NotificationDedup.user_id,
+                NotificationDedup.event_group,
+                NotificationDedup.channel
+            ).filter(NotificationDedup.last_sent_at >= since).yield_per(10000)
+
+            keys = []
+            for user_id, group, channel in query:
+                keys.append(dedup_key(user_id, group, channel))
+                if len(keys) >= 10000:
+                    self._filters[0].add_many(keys)
+                    keys = []
+            self._filters[0].add_many(keys)
+            self._warmed = True
+
+    def _rotate(self):
+        # A key stays in the current or previous generation for at least one
+        # full window. Rotating early when full only costs exact lookups.
+        generation = settings.NOTIFICATION_DEDUP_MAX_WINDOW_MINUTES * 60
+        if (
+            self._filters
+            and time.monotonic() - self._generation_started < generation
+            and self._filters[0].count < settings.NOTIFICATION_DEDUP_BLOOM_CAPACITY
+        ):
+            return
+        fresh = BloomFilter(settings.NOTIFICATION_DEDUP_BLOOM_CAPACITY, settings.NOTIFICATION_DEDUP_BLOOM_ERROR_RATE)
+        self._filters = [fresh] + self._filters[:1]
+        self._generation_started = time.monotonic()
+
+    def _might_contain(self, keys: List[str]) -> np.ndarray:
+        with self._lock:
+            self._rotate()
+            seen = np.zeros(len(keys), dtype=bool)
+            for bloom in self._filters:
+                seen |= bloom.contains_many(keys)
+            return seen
+
+    def _add(self, keys: List[str]):
+        with self._lock:
+            self._rotate()
+            self._filters[0].add_many(keys)
+
+
+# Create singleton instance
+notification_dedup = NotificationDeduplicator()
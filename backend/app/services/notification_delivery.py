@@ -0,0 +1,845 @@
+"""
+Notification delivery workers
+Sends email, SMS, voice and push through the SendGrid, Twilio, FCM and APNs
+HTTP APIs with async HTTP, one bounded worker pool per channel, so provider
+latency never blocks the event loop. Recipients sharing a message go out as
+one provider batch request where the provider supports it, paced by the
+provider rate limiter, and push batches fan out over multiplexed HTTP/2
+streams. Batches wait in severity lanes, so an EXTREME or tsunami alert
+overtakes any backlog of lesser alerts
+"""
+import abc
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+
+import httpx
+from jose import jwt
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # Push falls back to HTTP/1.1, which APNs does not serve
+    h2 = None
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import AlertCategory, AlertSeverity, Notification, NotificationChannel
+from app.services.provider_rate_limiter import provider_rate_limiter
+from app.services.push_devices import parse_destination
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for status lookups
+MAX_TRACKED_JOBS = 10000
+
+# Provider limits on recipients per request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+TWILIO_NOTIFY_MAX_BINDINGS = 10000
+FCM_MAX_MULTICAST_TOKENS = 500
+
+# Statuses that blame a recipient rather than the request; other 4xx fail every recipient alike
+RECIPIENT_REJECTED_STATUS_CODES = {400, 422}
+
+# Push services reject tokens minted more often than this; both accept an hour
+PUSH_AUTH_TOKEN_SECONDS = 3000
+
+# Delivery lanes, most urgent first; a job's priority is its lane's index
+LANES = ("critical", "high", "normal", "low")
+CRITICAL_LANE = 0
+LOWEST_LANE = len(LANES) - 1
+
+SEVERITY_LANES = {
+    AlertSeverity.EXTREME: 0,
+    AlertSeverity.SEVERE: 1,
+    AlertSeverity.MODERATE: 2,
+    AlertSeverity.MINOR: 3
+}
+
+
+def lane_for(severity: AlertSeverity, category: Optional[AlertCategory] = None) -> int:
+    """Priority of an alert's notifications, 0 (critical) to 3 (low)."""
+    if category is not None and category.value in settings.NOTIFICATION_CRITICAL_CATEGORIES:
+        return CRITICAL_LANE
+    return SEVERITY_LANES.get(severity, LOWEST_LANE)
+
+
+class DeliveryError(Exception):
+    """Provider rejected or failed a delivery"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after  # Seconds the provider asked us to wait
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Retry-After header of a response, given as seconds or an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def provider_error(provider: str, response: httpx.Response) -> DeliveryError:
+    return DeliveryError(
+        f"{provider} returned {response.status_code}",
+        response.status_code,
+        retry_after_seconds(response)
+    )
+
+
+class LanePreempted(Exception):
+    """A waiting batch gave its worker up to a more urgent lane"""
+
+
+@dataclass
+class DeliveryJob:
+    channel: str  # email, sms, voice, push
+    destination: str  # push: platform:device_token
+    payload: Dict  # email: subject/html, sms: body, voice: twiml, push: title/body/data
+    notification_id: Optional[str] = None
+    channel_id: Optional[str] = None
+    batch_key: Optional[str] = None  # Jobs with the same key share a payload
+    priority: int = 2  # Delivery lane index, 0 is most urgent
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued, sending, sent, failed
+    provider_id: Optional[str] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None  # Provider HTTP status of the last failure
+    invalid_destination: bool = False  # Provider says the address will never work, e.g. an expired device token
+    attempts: int = 0
+    request_started_at: Optional[float] = None  # Epoch seconds the last provider request began
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    completed_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "channel": self.channel,
+            "notification_id": self.notification_id,
+            "status": self.status,
+            "lane": LANES[self.priority],
+            "provider_id": self.provider_id,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat(),
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+class SendGridProvider:
+    """SendGrid v3 mail API"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    @staticmethod
+    def configured() -> bool:
+        return bool(settings.SENDGRID_API_KEY)
+
+    async def send_email(self, job: DeliveryJob) -> Optional[str]:
+        response = await self.client.post(
+            f"{settings.SENDGRID_API_URL}/v3/mail/send",
+            headers={"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"},
+            json={
+                "personalizations": [{"to": [{"email": job.destination}]}],
+                "from": {"email": settings.SENDGRID_FROM_EMAIL, "name": "Hawaii Emergency Network"},
+                "subject": job.payload["subject"],
+                "content": [{"type": "text/html", "value": job.payload["html"]}]
+            }
+        )
+        if response.status_code != 202:
+            raise provider_error("SendGrid", response)
+        return response.headers.get("X-Message-Id")
+
+    async def send_email_batch(self, jobs: List[DeliveryJob]) -> Optional[str]:
+        """One request for jobs sharing a payload, one personalization per recipient."""
+        payload = jobs[0].payload
+        response = await self.client.post(
+            f"{settings.SENDGRID_API_URL}/v3/mail/send",
+            headers={"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"},
+            json={
+                "personalizations": [
+                    # custom_args let event webhooks map back to the job
+                    {"to": [{"email": job.destination}], "custom_args": {"job_id": job.job_id}}
+                    for job in jobs
+                ],
+                "from": {"email": settings.SENDGRID_FROM_EMAIL, "name": "Hawaii Emergency Network"},
+                "subject": payload["subject"],
+                "content": [{"type": "text/html", "value": payload["html"]}]
+            }
+        )
+        if response.status_code != 202:
+            raise provider_error("SendGrid", response)
+        return response.headers.get("X-Message-Id")
+
+
+class TwilioProvider:
+    """Twilio REST API for SMS and voice calls"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    @staticmethod
+    def configured() -> bool:
+        return bool(settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN)
+
+    @classmethod
+    def notify_configured(cls) -> bool:
+        return cls.configured() and bool(settings.TWILIO_NOTIFY_SERVICE_SID)
+
+    def _url(self, resource: str) -> str:
+        return f"{settings.TWILIO_API_URL}/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/{resource}.json"
+
+    async def _create(self, resource: str, data: Dict) -> Optional[str]:
+        response = await self.client.post(
+            self._url(resource),
+            auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            data=data
+        )
+        if response.status_code not in (200, 201):
+            raise provider_error("Twilio", response)
+
+        body = response.json()
+        if body.get("error_code"):
+            raise DeliveryError(body.get("error_message") or f"Twilio error {body['error_code']}")
+        return body.get("sid")
+
+    async def send_sms(self, job: DeliveryJob) -> Optional[str]:
+        return await self._create("Messages", {
+            "From": settings.TWILIO_PHONE_NUMBER,
+            "To": job.destination,
+            "Body": job.payload["body"]
+        })
+
+    async def send_sms_batch(self, jobs: List[DeliveryJob]) -> Optional[str]:
+        """One Twilio Notify request for jobs sharing a message body."""
+        response = await self.client.post(
+            f"{settings.TWILIO_NOTIFY_API_URL}/v1/Services/{settings.TWILIO_NOTIFY_SERVICE_SID}/Notifications",
+            auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            data={
+                "ToBinding": [
+                    json.dumps({"binding_type": "sms", "address": job.destination})
+                    for job in jobs
+                ],
+                "Body": jobs[0].payload["body"]
+            }
+        )
+        if response.status_code not in (200, 201):
+            raise provider_error("Twilio Notify", response)
+        return response.json().get("sid")
+
+    async def place_call(self, job: DeliveryJob) -> Optional[str]:
+        return await self._create("Calls", {
+            "From": settings.TWILIO_PHONE_NUMBER,
+            "To": job.destination,
+            "Twiml": job.payload["twiml"]
+        })
+
+
+class PushProvider(abc.ABC):
+    """
+    Base of the push services: a batch shares one payload and fans out as
+    concurrent per-device requests, each with its own result
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self._auth_lock = asyncio.Lock()
+
+    @abc.abstractmethod
+    async def authorize(self) -> str:
+        """Return the credential sent with every request of a batch."""
+
+    @abc.abstractmethod
+    async def send(self, job: DeliveryJob, auth: str) -> Optional[str]:
+        """Send one device its notification, returning the provider's message id."""
+
+    async def send_batch(self, jobs: List[DeliveryJob]):
+        """
+        Send every job and record its result on the job. Raises only when
+        the batch as a whole cannot be sent, such as failed authentication.
+        """
+        auth = await self.authorize()
+        streams = asyncio.Semaphore(settings.NOTIFICATION_PUSH_STREAMS)
+
+        async def send_one(job: DeliveryJob):
+            async with streams:
+                job.request_started_at = time.time()
+                try:
+                    job.provider_id = await self.send(job, auth)
+                    job.status = "sent"
+                except Exception as e:
+                    job.status = "failed"
+                    job.error = str(e)
+                    job.status_code = getattr(e, "status_code", None)
+                job.completed_at = datetime.utcnow()
+
+        await asyncio.gather(*(send_one(job) for job in jobs))
+
+    @staticmethod
+    def _private_key(value: str) -> str:
+        # Keys set through .env usually carry escaped newlines
+        return value.replace("\\n", "\n")
+
+
+class FCMProvider(PushProvider):
+    """Firebase Cloud Messaging HTTP v1 API"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        super().__init__(client)
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+
+    @staticmethod
+    def configured() -> bool:
+        return bool(settings.FCM_PROJECT_ID and settings.FCM_CLIENT_EMAIL and settings.FCM_PRIVATE_KEY)
+
+    async def authorize(self) -> str:
+        """OAuth access token of the service account, minted from a signed assertion."""
+        async with self._auth_lock:
+            if self._access_token and time.time() < self._expires_at:
+                return self._access_token
+
+            now = int(time.time())
+            assertion = jwt.encode(
+                {
+                    "iss": settings.FCM_CLIENT_EMAIL,
+                    "scope": "https://www.googleapis.com/auth/firebase.messaging",
+                    "aud": settings.FCM_TOKEN_URL,
+                    "iat": now,
+                    "exp": now + 3600
+                },
+                self._private_key(settings.FCM_PRIVATE_KEY),
+                algorithm="RS256"
+            )
+            response = await self.client.post(settings.FCM_TOKEN_URL, data={
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": assertion
+            })
+            if response.status_code != 200:
+                raise provider_error("FCM auth", response)
+
+            body = response.json()
+            self._access_token = body["access_token"]
+            self._expires_at = now + min(body.get("expires_in", 3600), PUSH_AUTH_TOKEN_SECONDS)
+            return self._access_token
+
+    async def send(self, job: DeliveryJob, auth: str) -> Optional[str]:
+        _, token = parse_destination(job.destination)
+        response = await self.client.post(
+            f"{settings.FCM_API_URL}/v1/projects/{settings.FCM_PROJECT_ID}/messages:send",
+            headers={"Authorization": f"Bearer {auth}"},
+            json={
+                "message": {
+                    "token": token,
+                    "notification": {"title": job.payload["title"], "body": job.payload["body"]},
+                    "data": job.payload.get("data", {}),
+                    "android": {"priority": "high"}
+                }
+            }
+        )
+        if response.status_code == 200:
+            return response.json().get("name")
+
+        error = provider_error("FCM", response)
+        job.invalid_destination = self._invalid_token(response)
+        raise error
+
+    @staticmethod
+    def _invalid_token(response: httpx.Response) -> bool:
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            return False
+        codes = {detail.get("errorCode") for detail in error.get("details", [])}
+        if "UNREGISTERED" in codes or response.status_code == 404:
+            return True
+        # INVALID_ARGUMENT also covers bad payloads; only prune for the token itself
+        return "INVALID_ARGUMENT" in codes and "registration token" in error.get("message", "")
+
+
+class APNsProvider(PushProvider):
+    """Apple Push Notification service with token-based authentication"""
+
+    # Reasons that mean the device token is gone for good
+    INVALID_TOKEN_REASONS = {"BadDeviceToken", "DeviceTokenNotForTopic", "Unregistered", "ExpiredToken"}
+
+    def __init__(self, client: httpx.AsyncClient):
+        super().__init__(client)
+        self._bearer: Optional[str] = None
+        self._issued_at = 0.0
+
+    @staticmethod
+    def configured() -> bool:
+        return bool(
+            settings.APNS_KEY_ID and settings.APNS_TEAM_ID
+            and settings.APNS_PRIVATE_KEY and settings.APNS_TOPIC
+        )
+
+    async def authorize(self) -> str:
+        async with self._auth_lock:
+            if self._bearer and time.time() - self._issued_at < PUSH_AUTH_TOKEN_SECONDS:
+                return self._bearer
+
+            self._issued_at = time.time()
+            self._bearer = jwt.encode(
+                {"iss": settings.APNS_TEAM_ID, "iat": int(self._issued_at)},
+                self._private_key(settings.APNS_PRIVATE_KEY),
+                algorithm="ES256",
+                headers={"kid": settings.APNS_KEY_ID}
+            )
+            return self._bearer
+
+    async def send(self, job: DeliveryJob, auth: str) -> Optional[str]:
+        _, token = parse_destination(job.destination)
+        data = job.payload.get("data", {})
+        urgent = data.get("severity") in (AlertSeverity.SEVERE.value, AlertSeverity.EXTREME.value)
+        response = await self.client.post(
+            f"{settings.APNS_API_URL}/3/device/{token}",
+            headers={
+                "authorization": f"bearer {auth}",
+                "apns-topic": settings.APNS_TOPIC,
+                "apns-push-type": "alert",
+                "apns-priority": "10"
+            },
+            json={
+                "aps": {
+                    "alert": {"title": job.payload["title"], "body": job.payload["body"]},
+                    "sound": "default",
+                    "interruption-level": "time-sensitive" if urgent else "active"
+                },
+                **data
+            }
+        )
+        if response.status_code == 200:
+            return response.headers.get("apns-id")
+
+        try:
+            reason = response.json().get("reason")
+        except ValueError:
+            reason = None
+        job.invalid_destination = response.status_code == 410 or reason in self.INVALID_TOKEN_REASONS
+        raise DeliveryError(
+            f"APNs returned {response.status_code}" + (f": {reason}" if reason else ""),
+            response.status_code,
+            retry_after_seconds(response)
+        )
+
+
+class LaneQueue:
+    """Batches of one channel in priority lanes, always served most urgent first"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lanes: List[Deque[List[DeliveryJob]]] = [deque() for _ in LANES]
+        self._changed = asyncio.Condition()
+
+    def qsize(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def lane_sizes(self) -> Dict[str, int]:
+        return {name: len(lane) for name, lane in zip(LANES, self._lanes)}
+
+    async def put(self, priority: int, batch: List[DeliveryJob]):
+        async with self._changed:
+            # Critical batches never wait for room behind a backlog
+            if priority != CRITICAL_LANE:
+                await self._changed.wait_for(lambda: self.qsize() < self.maxsize)
+            self._lanes[priority].append(batch)
+            self._changed.notify_all()
+
+    async def requeue(self, priority: int, batch: List[DeliveryJob]):
+        """Put a preempted batch back at the head of its lane."""
+        async with self._changed:
+            self._lanes[priority].appendleft(batch)
+            self._changed.notify_all()
+
+    def has_more_urgent(self, priority: int) -> bool:
+        return self._next_lane(priority - 1) is not None
+
+    async def get(self, max_priority: int) -> List[DeliveryJob]:
+        """Oldest batch of the most urgent non-empty lane up to max_priority."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._next_lane(max_priority) is not None)
+            batch = self._lanes[self._next_lane(max_priority)].popleft()
+            self._changed.notify_all()
+            return batch
+
+    def _next_lane(self, max_priority: int) -> Optional[int]:
+        for priority in range(max_priority + 1):
+            if self._lanes[priority]:
+                return priority
+        return None
+
+
+class DeliveryWorkerPool:
+    """Per-channel batch queues drained by a fixed number of async workers"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._push_client: Optional[httpx.AsyncClient] = None
+        self._push: Dict[str, PushProvider] = {}
+        self._queues: Dict[str, LaneQueue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._senders: Dict[str, Callable[[DeliveryJob], Awaitable[Optional[str]]]] = {}
+        self._batch_senders: Dict[str, Callable[[List[DeliveryJob]], Awaitable[Optional[str]]]] = {}
+
+        # Unfinished jobs stay tracked until they finish, only finished ones age out
+        self._jobs: Dict[str, DeliveryJob] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._waiters: Dict[str, asyncio.Future] = {}
+
+        self.sent: Dict[str, int] = {}
+        self.failed: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+
+    @staticmethod
+    def concurrency() -> Dict[str, int]:
+        return {
+            "email": settings.NOTIFICATION_EMAIL_CONCURRENCY,
+            "sms": settings.NOTIFICATION_SMS_CONCURRENCY,
+            "voice": settings.NOTIFICATION_VOICE_CONCURRENCY,
+            "push": settings.NOTIFICATION_PUSH_CONCURRENCY
+        }
+
+    @staticmethod
+    def worker_lanes(workers: int) -> List[int]:
+        """
+        Least urgent lane each of a channel's workers may serve. Reserved
+        workers only take their lane and the ones above it; at least one
+        worker always serves every lane.
+        """
+        lanes: List[int] = []
+        reserved = settings.NOTIFICATION_LANE_RESERVED_WORKERS
+        for priority, name in enumerate(LANES[:-1]):
+            count = min(reserved.get(name, 0), workers - 1 - len(lanes))
+            lanes.extend([priority] * max(0, count))
+        return lanes + [LOWEST_LANE] * (max(1, workers) - len(lanes))
+
+    @staticmethod
+    def batch_size(channel: str) -> int:
+        """Most recipients of one payload sent in a single provider request."""
+        if channel == "email":
+            return max(1, min(settings.NOTIFICATION_EMAIL_BATCH_SIZE, SENDGRID_MAX_PERSONALIZATIONS))
+        if channel == "sms" and TwilioProvider.notify_configured():
+            return max(1, min(settings.NOTIFICATION_SMS_BATCH_SIZE, TWILIO_NOTIFY_MAX_BINDINGS))
+        if channel == "push":
+            return max(1, min(settings.NOTIFICATION_PUSH_BATCH_SIZE, FCM_MAX_MULTICAST_TOKENS))
+        return 1
+
+    def _ensure_started(self):
+        # Started lazily on the running loop by the first submission
+        if self._workers:
+            return
+
+        limits = self.concurrency()
+        self._client = httpx.AsyncClient(
+            timeout=settings.NOTIFICATION_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=sum(
+                workers for channel, workers in limits.items() if channel != "push"
+            ))
+        )
+
+        # A few persistent HTTP/2 connections per push service carry every batch's streams
+        if h2 is None:
+            logger.warning("h2 is not installed, push requests use HTTP/1.1 and APNs will reject them")
+        self._push_client = httpx.AsyncClient(
+            http2=h2 is not None,
+            timeout=settings.NOTIFICATION_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=limits["push"] * (1 if h2 is not None else settings.NOTIFICATION_PUSH_STREAMS)
+            )
+        )
+        self._push = {
+            "fcm": FCMProvider(self._push_client),
+            "apns": APNsProvider(self._push_client)
+        }
+
+        sendgrid = SendGridProvider(self._client)
+        twilio = TwilioProvider(self._client)
+        self._senders = {
+            "email": sendgrid.send_email,
+            "sms": twilio.send_sms,
+            "voice": twilio.place_call
+        }
+        self._batch_senders = {
+            "email": sendgrid.send_email_batch,
+            "sms": twilio.send_sms_batch
+        }
+
+        for channel, workers in limits.items():
+            self._queues[channel] = LaneQueue(settings.NOTIFICATION_QUEUE_SIZE)
+            for max_priority in self.worker_lanes(workers):
+                self._workers.append(asyncio.create_task(self._worker(channel, max_priority)))
+
+        logger.info(f"Notification delivery workers started: {limits}")
+
+    def is_configured(self, channel: str) -> bool:
+        if channel == "email":
+            return SendGridProvider.configured()
+        if channel in ("sms", "voice"):
+            return TwilioProvider.configured()
+        if channel == "push":
+            return FCMProvider.configured() or APNsProvider.configured()
+        return False
+
+    @staticmethod
+    def push_configured(platform: str) -> bool:
+        if platform == "fcm":
+            return FCMProvider.configured()
+        if platform == "apns":
+            return APNsProvider.configured()
+        return False
+
+    async def submit(self, job: DeliveryJob) -> str:
+        """Queue a job, waiting for room when the channel's queue is full."""
+        await self.submit_batch([job])
+        return job.job_id
+
+    async def submit_batch(self, jobs: List[DeliveryJob]):
+        """
+        Queue jobs of one channel that share a payload to go out as a single
+        provider request. Batches larger than batch_size() are split, and
+        the batch goes in the lane of its most urgent job.
+        """
+        if not jobs:
+            return
+        channel = jobs[0].channel
+        if channel not in self.concurrency():
+            raise ValueError(f"Unsupported delivery channel: {channel}")
+        if any(job.channel != channel for job in jobs):
+            raise ValueError("A delivery batch must use a single channel")
+
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        for job in jobs:
+            self._track(job)
+            self._waiters[job.job_id] = loop.create_future()
+
+        priority = min(job.priority for job in jobs)
+        size = self.batch_size(channel)
+        for i in range(0, len(jobs), size):
+            await self._queues[channel].put(priority, jobs[i:i + size])
+
+    def get_job(self, job_id: str) -> Optional[DeliveryJob]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_ids: Iterable[str], timeout: Optional[float] = None) -> List[DeliveryJob]:
+        """Wait until the given jobs finish, or the timeout passes."""
+        job_ids = list(job_ids)
+        waiters = [self._waiters[job_id] for job_id in job_ids if job_id in self._waiters]
+        if waiters:
+            await asyncio.wait(waiters, timeout=timeout)
+        return [self._jobs[job_id] for job_id in job_ids if job_id in self._jobs]
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency(),
+            "batch_size": {channel: self.batch_size(channel) for channel in self.concurrency()},
+            "worker_lanes": {
+                channel: [LANES[priority] for priority in self.worker_lanes(workers)]
+                for channel, workers in self.concurrency().items()
+            },
+            "queued_batches": {channel: queue.qsize() for channel, queue in self._queues.items()},
+            "queued_batches_by_lane": {channel: queue.lane_sizes() for channel, queue in self._queues.items()},
+            "requests": dict(self.requests),
+            "sent": dict(self.sent),
+            "failed": dict(self.failed),
+            "throttled": dict(self.throttled),
+            "tracked_jobs": len(self._jobs)
+        }
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        if self._push_client:
+            await self._push_client.aclose()
+            self._push_client = None
+
+        await provider_rate_limiter.close()
+
+    def _track(self, job: DeliveryJob):
+        self._jobs[job.job_id] = job
+        self._finished.pop(job.job_id, None)
+
+    def _finish(self, job: DeliveryJob):
+        waiter = self._waiters.pop(job.job_id, None)
+        if waiter and not waiter.done():
+            waiter.set_result(job)
+
+        self._finished[job.job_id] = None
+        while len(self._finished) > MAX_TRACKED_JOBS:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
+
+    async def _worker(self, channel: str, max_priority: int):
+        queue = self._queues[channel]
+        while True:
+            batch = await queue.get(max_priority)
+            try:
+                await self._deliver(batch)
+            except LanePreempted:
+                await queue.requeue(min(job.priority for job in batch), batch)
+            except Exception as e:
+                logger.error(f"Delivery worker error on {len(batch)} {channel} jobs: {e}")
+
+    async def _deliver(self, batch: List[DeliveryJob]):
+        for job in batch:
+            job.status = "sending"
+            job.attempts += 1
+
+        try:
+            await self._send(batch, may_yield=True)
+        except LanePreempted:
+            for job in batch:
+                job.status = "queued"
+                job.attempts -= 1
+            raise
+
+        # Session work is synchronous, keep it off the event loop
+        recorded = [job for job in batch if job.notification_id]
+        if recorded:
+            await asyncio.to_thread(self._record_results, recorded)
+
+        for job in batch:
+            self._finish(job)
+
+    async def _request(self, batch: List[DeliveryJob], may_yield: bool = False) -> Optional[str]:
+        """
+        One paced provider request, retried in place while throttled. With
+        may_yield, a batch still waiting for its first slot raises
+        LanePreempted once a more urgent batch is queued for its channel.
+        """
+        channel = batch[0].channel
+        platform = parse_destination(batch[0].destination)[0] if channel == "push" else None
+        bucket, rate = provider_rate_limiter.bucket_for(channel, batch_mode=len(batch) > 1, platform=platform)
+
+        # Twilio caps messages per second, SendGrid caps requests
+        cost = 1 if channel == "email" else len(batch)
+        priority = min(job.priority for job in batch)
+        preempt = priority == CRITICAL_LANE
+
+        for attempt in range(settings.NOTIFICATION_RATE_LIMIT_RETRIES + 1):
+            abandon = None
+            if may_yield and attempt == 0 and not preempt:
+                abandon = lambda: self._queues[channel].has_more_urgent(priority)
+            if not await provider_rate_limiter.acquire(bucket, rate, cost, preempt=preempt, abandon=abandon):
+                raise LanePreempted()
+
+            self.requests[channel] = self.requests.get(channel, 0) + 1
+            started_at = time.time()
+            for job in batch:
+                job.request_started_at = started_at
+            if channel == "push":
+                return await self._send_push(batch, platform, bucket)
+            try:
+                if len(batch) == 1:
+                    return await self._senders[channel](batch[0])
+                return await self._batch_senders[channel](batch)
+            except DeliveryError as e:
+                if e.status_code != 429 or attempt == settings.NOTIFICATION_RATE_LIMIT_RETRIES:
+                    raise
+                self.throttled[channel] = self.throttled.get(channel, 0) + 1
+                await provider_rate_limiter.penalize(bucket, e.retry_after)
+
+    async def _send_push(self, batch: List[DeliveryJob], platform: str, bucket: str):
+        # Throttled devices fail and go back to the queue; the bucket backs off for all
+        await self._push[platform].send_batch(batch)
+        if any(job.status_code == 429 for job in batch):
+            self.throttled["push"] = self.throttled.get("push", 0) + 1
+            await provider_rate_limiter.penalize(bucket, None)
+
+    async def _send(self, batch: List[DeliveryJob], may_yield: bool = False):
+        channel = batch[0].channel
+
+        try:
+            provider_id = await self._request(batch, may_yield)
+        except LanePreempted:
+            raise
+        except Exception as e:
+            status_code = getattr(e, "status_code", None)
+
+            # One bad recipient fails the whole request; bisect to isolate it.
+            # Auth, permission and size errors would fail every half too.
+            # Push batches only fail as a whole when the service rejects our credentials.
+            if len(batch) > 1 and channel != "push" and status_code in RECIPIENT_REJECTED_STATUS_CODES:
+                middle = len(batch) // 2
+                await self._send(batch[:middle])
+                await self._send(batch[middle:])
+                return
+
+            completed_at = datetime.utcnow()
+            for job in batch:
+                job.status = "failed"
+                job.error = str(e)
+                job.status_code = status_code
+                job.completed_at = completed_at
+            self.failed[channel] = self.failed.get(channel, 0) + len(batch)
+            logger.error(f"Failed to deliver {len(batch)} {channel} jobs: {e}")
+            return
+
+        if channel == "push":
+            sent = sum(1 for job in batch if job.status == "sent")
+            self.sent[channel] = self.sent.get(channel, 0) + sent
+            self.failed[channel] = self.failed.get(channel, 0) + len(batch) - sent
+            return
+
+        # Batch requests return one id shared by every recipient
+        completed_at = datetime.utcnow()
+        for job in batch:
+            job.status = "sent"
+            job.provider_id = provider_id
+            job.completed_at = completed_at
+        self.sent[channel] = self.sent.get(channel, 0) + len(batch)
+
+    @staticmethod
+    def _record_results(jobs: List[DeliveryJob]):
+        db = SessionLocal()
+        try:
+            for job in jobs:
+                notification = db.query(Notification).filter(
+                    Notification.id == job.notification_id
+                ).first()
+                if notification:
+                    notification.status = job.status
+                    notification.error_message = job.error
+                    if job.status == "sent":
+                        notification.sent_at = job.completed_at
+
+                if job.channel_id and job.status == "sent":
+                    db.query(NotificationChannel).filter(
+                        NotificationChannel.id == job.channel_id
+                    ).update({NotificationChannel.last_used: job.completed_at})
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record delivery results for {len(jobs)} jobs: {e}")
+        finally:
+            db.close()
+
+
+# Create singleton instance
+delivery_pool = DeliveryWorkerPool()
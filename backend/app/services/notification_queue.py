@@ -0,0 +1,674 @@
+"""
+Durable notification job queue
+Persists every alert notification as a row in notification_jobs, one per
+(user, alert, channel) and per device for push, so sends survive
+restarts. A rendered message is stored once in notification_messages and
+its jobs reference it by key. Consumers in any number of processes claim
+due jobs under a lease, hand them to the delivery workers, retry failures
+with exponential backoff and move jobs that run out of attempts to the
+dead-letter table. Critical jobs are claimed ahead of everything else and
+do not wait for the backlog of lesser lanes
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import signal
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from prometheus_client import start_http_server
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import (
+    Alert,
+    Notification,
+    NotificationChannel,
+    NotificationDeadLetter,
+    NotificationJob,
+    NotificationMessage
+)
+from app.services import push_devices
+from app.services.alert_latency import alert_latency, epoch
+from app.services.notification_dedup import notification_dedup
+from app.services.notification_delivery import (
+    CRITICAL_LANE,
+    LOWEST_LANE,
+    DeliveryJob,
+    delivery_pool
+)
+
+logger = logging.getLogger(__name__)
+
+# Provider statuses worth retrying; other 4xx responses will never succeed
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+KEY_LOOKUP_CHUNK_SIZE = 500
+
+# Inserts retried after losing a race with another process on some keys
+ENQUEUE_ATTEMPTS = 3
+
+
+def idempotency_key(user_id: str, alert_id: str, channel: str, destination: Optional[str] = None) -> str:
+    # A user's devices each get their own push job
+    if channel == "push":
+        return f"{user_id}:{alert_id}:{channel}:{destination}"
+    return f"{user_id}:{alert_id}:{channel}"
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before the next attempt, with jitter so retries spread out."""
+    delay = min(
+        settings.NOTIFICATION_RETRY_MAX_SECONDS,
+        settings.NOTIFICATION_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1)
+    )
+    return random.uniform(delay / 2, delay)
+
+
+def is_retryable(job: DeliveryJob) -> bool:
+    if job.invalid_destination:
+        return False
+    # No status means a network error or timeout
+    if job.status_code is None:
+        return True
+    return job.status_code >= 500 or job.status_code in RETRYABLE_STATUS_CODES
+
+
+class NotificationQueue:
+    """Database-backed job queue feeding the delivery worker pool"""
+
+    def __init__(self):
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._consumer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._batches: set = set()
+        self._in_flight: Dict[str, int] = {}
+        self._critical_in_flight: Dict[str, int] = {}
+
+        self.claimed = 0
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    @staticmethod
+    def capacity(channel: str) -> int:
+        # Enough provider requests in flight to keep the channel's workers busy, and no more
+        return 2 * delivery_pool.concurrency()[channel]
+
+    def enqueue(
+        self,
+        user_id: str,
+        alert_id: str,
+        channel: str,
+        destination: str,
+        payload: Dict,
+        channel_id: Optional[str] = None,
+        message_key: Optional[str] = None,
+        priority: int = 2
+    ) -> Optional[str]:
+        """
+        Persist a job and its pending notification. Returns the job id, or
+        None when the user was already queued this alert on this channel.
+        """
+        job_ids = self.enqueue_many([{
+            "user_id": user_id,
+            "alert_id": alert_id,
+            "channel": channel,
+            "destination": destination,
+            "payload": payload,
+            "channel_id": channel_id,
+            "message_key": message_key,
+            "priority": priority
+        }])
+        return job_ids[0] if job_ids else None
+
+    def enqueue_many(
+        self,
+        jobs: List[Dict],
+        alert: Optional[Alert] = None,
+        windows: Optional[List[int]] = None
+    ) -> List[str]:
+        """
+        Persist jobs (enqueue keyword arguments) and their pending
+        notifications in one transaction, skipping keys already queued.
+        Given the alert and each job's digest window in minutes, repeats
+        about its event are dropped first, and the dedup records commit
+        with the jobs. Returns the ids of the new jobs. Uses its own session,
+        so callers' loaded objects are not expired by the commit; blocking,
+        run it in a thread from async code.
+        """
+        for attempt in range(ENQUEUE_ATTEMPTS):
+            try:
+                job_ids, sent_keys = self._enqueue(jobs, alert, windows)
+                break
+            except IntegrityError:
+                # Another process queued some of the same keys or messages first;
+                # the next attempt sees them and skips them
+                if attempt == ENQUEUE_ATTEMPTS - 1:
+                    raise
+
+        if job_ids:
+            notification_dedup.remember(sent_keys)
+            self.notify()
+        return job_ids
+
+    def _enqueue(
+        self,
+        jobs: List[Dict],
+        alert: Optional[Alert],
+        windows: Optional[List[int]]
+    ) -> Tuple[List[str], List[str]]:
+        db = SessionLocal()
+        try:
+            sent_keys: List[str] = []
+            if alert is not None and jobs:
+                jobs, sent_keys = notification_dedup.filter(db, alert, jobs, windows)
+
+            by_key: Dict[str, Dict] = {}
+            for job in jobs:
+                key = idempotency_key(job["user_id"], job["alert_id"], job["channel"], job["destination"])
+                by_key.setdefault(key, job)
+
+            keys = list(by_key)
+            for i in range(0, len(keys), KEY_LOOKUP_CHUNK_SIZE):
+                chunk = keys[i:i + KEY_LOOKUP_CHUNK_SIZE]
+                for (key,) in db.query(NotificationJob.idempotency_key).filter(
+                    NotificationJob.idempotency_key.in_(chunk)
+                ):
+                    by_key.pop(key, None)
+            # Nothing new: closing the session discards any dedup records
+            if not by_key:
+                return [], []
+
+            return self._insert(db, by_key), sent_keys
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert(db: Session, by_key: Dict[str, Dict]) -> List[str]:
+        now = datetime.utcnow()
+
+        # Each rendered variant is written once, however many jobs share it
+        messages: Dict[str, Dict] = {}
+        for job in by_key.values():
+            if job.get("message_key") and job["message_key"] not in messages:
+                messages[job["message_key"]] = {
+                    "key": job["message_key"],
+                    "alert_id": job["alert_id"],
+                    "channel": job["channel"],
+                    "payload": job["payload"],
+                    "created_at": now
+                }
+        message_keys = list(messages)
+        for i in range(0, len(message_keys), KEY_LOOKUP_CHUNK_SIZE):
+            for (key,) in db.query(NotificationMessage.key).filter(
+                NotificationMessage.key.in_(message_keys[i:i + KEY_LOOKUP_CHUNK_SIZE])
+            ):
+                messages.pop(key)
+
+        notifications = []
+        rows = []
+        for key, job in by_key.items():
+            notification_id = str(uuid.uuid4())
+            notifications.append({
+                "id": notification_id,
+                "user_id": job["user_id"],
+                "alert_id": job["alert_id"],
+                "channel": job["channel"],
+                "status": "pending"
+            })
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "idempotency_key": key,
+                "user_id": job["user_id"],
+                "alert_id": job["alert_id"],
+                "notification_id": notification_id,
+                "channel_id": job.get("channel_id"),
+                "channel": job["channel"],
+                "destination": job["destination"],
+                "payload": None if job.get("message_key") else job["payload"],
+                "message_key": job.get("message_key"),
+                "priority": job.get("priority", 2),
+                "status": "queued",
+                "attempts": 0,
+                "max_attempts": settings.NOTIFICATION_MAX_ATTEMPTS,
+                "next_attempt_at": now,
+                "created_at": now,
+                "updated_at": now
+            })
+
+        if messages:
+            db.execute(insert(NotificationMessage), list(messages.values()))
+        db.execute(insert(Notification), notifications)
+        db.execute(insert(NotificationJob), rows)
+        db.commit()
+        return [row["id"] for row in rows]
+
+    def notify(self):
+        """Wake the local consumer so new jobs skip the poll interval. Thread-safe."""
+        if self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        if self._consumer:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._consumer = asyncio.create_task(self._consume())
+        logger.info(f"Notification queue consumer {self.consumer_id} started")
+
+    async def stop(self):
+        if not self._consumer:
+            return
+
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+        self._consumer = None
+        self._wakeup = None
+
+        # Let claimed jobs finish; anything left is reclaimed once its lease expires
+        if self._batches:
+            await asyncio.wait(self._batches, timeout=settings.NOTIFICATION_HTTP_TIMEOUT_SECONDS)
+
+    def stats(self, db: Session) -> Dict:
+        by_status = dict(
+            db.query(NotificationJob.status, func.count(NotificationJob.id))
+            .group_by(NotificationJob.status)
+            .all()
+        )
+        pending_by_channel = dict(
+            db.query(NotificationJob.channel, func.count(NotificationJob.id))
+            .filter(NotificationJob.status.in_(["queued", "retry", "sending"]))
+            .group_by(NotificationJob.channel)
+            .all()
+        )
+        return {
+            "consumer_id": self.consumer_id,
+            "consuming": self._consumer is not None,
+            "in_flight_requests": dict(self._in_flight),
+            "critical_in_flight_requests": dict(self._critical_in_flight),
+            "jobs_by_status": by_status,
+            "pending_by_channel": pending_by_channel,
+            "dead_letters": db.query(func.count(NotificationDeadLetter.id)).filter(
+                NotificationDeadLetter.requeued_at.is_(None)
+            ).scalar(),
+            "claimed": self.claimed,
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered
+        }
+
+    def requeue(self, db: Session, dead_letter_id: str) -> Optional[NotificationJob]:
+        """Give a dead-lettered job a fresh set of attempts."""
+        dead_letter = db.query(NotificationDeadLetter).filter(
+            NotificationDeadLetter.id == dead_letter_id
+        ).first()
+        if not dead_letter or dead_letter.requeued_at:
+            return None
+
+        job = db.query(NotificationJob).filter(NotificationJob.id == dead_letter.job_id).first()
+        if not job:
+            return None
+
+        job.status = "queued"
+        job.attempts = 0
+        job.next_attempt_at = datetime.utcnow()
+        job.locked_by = None
+        job.locked_until = None
+        dead_letter.requeued_at = datetime.utcnow()
+
+        db.query(Notification).filter(Notification.id == job.notification_id).update(
+            {Notification.status: "pending", Notification.error_message: None},
+            synchronize_session=False
+        )
+        db.commit()
+
+        self.notify()
+        return job
+
+    async def _consume(self):
+        while True:
+            more_due = False
+            for channel in delivery_pool.concurrency():
+                try:
+                    more_due |= await self._consume_channel(channel)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Notification queue consumer error on {channel}: {e}")
+
+            if more_due:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.NOTIFICATION_QUEUE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _consume_channel(self, channel: str) -> bool:
+        """Claim and dispatch due jobs of one channel; True if more are probably due."""
+        # Every free request slot can carry a full provider batch. Critical
+        # jobs have room of their own, whatever the other lanes have in flight.
+        batch_size = delivery_pool.batch_size(channel)
+        critical_room = self.capacity(channel) - self._critical_in_flight.get(channel, 0)
+        room = self.capacity(channel) - self._in_flight.get(channel, 0)
+        critical_limit = min(settings.NOTIFICATION_QUEUE_BATCH_SIZE, max(0, critical_room) * batch_size)
+        limit = min(settings.NOTIFICATION_QUEUE_BATCH_SIZE, max(0, room) * batch_size)
+
+        # Other lanes refill in chunks rather than a claim per freed slot
+        if room < max(1, self.capacity(channel) // 4):
+            limit = 0
+        if not critical_limit and not limit:
+            return False
+
+        jobs = await asyncio.to_thread(self._claim, channel, critical_limit, limit)
+        if jobs:
+            await self._dispatch(channel, jobs)
+
+        critical = sum(1 for job in jobs if job.priority == CRITICAL_LANE)
+        return bool(critical_limit and critical == critical_limit) or bool(limit and len(jobs) - critical == limit)
+
+    def _claim(self, channel: str, critical_limit: int, limit: int) -> List[DeliveryJob]:
+        """
+        Atomically lease due jobs of a channel to this consumer: up to
+        critical_limit critical jobs, and up to limit of the other lanes,
+        most urgent first.
+        """
+        now = datetime.utcnow()
+        due = and_(
+            NotificationJob.channel == channel,
+            or_(
+                and_(
+                    NotificationJob.status.in_(("queued", "retry")),
+                    NotificationJob.next_attempt_at <= now
+                ),
+                # Leases of crashed or stalled consumers
+                and_(
+                    NotificationJob.status == "sending",
+                    NotificationJob.locked_until < now
+                )
+            )
+        )
+
+        db = SessionLocal()
+
+        def candidates(lanes, count: int, *order):
+            query = select(NotificationJob.id).where(due, lanes).order_by(*order).limit(count)
+            if db.bind.dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            return NotificationJob.id.in_(query.scalar_subquery())
+
+        # Starvation protection: part of every claim goes to the longest-waiting jobs of any lane
+        oldest_limit = math.ceil(limit * settings.NOTIFICATION_LANE_MIN_SHARE) if limit > 1 else 0
+        lesser = NotificationJob.priority > CRITICAL_LANE
+
+        try:
+            parts = []
+            if critical_limit:
+                parts.append(candidates(
+                    NotificationJob.priority == CRITICAL_LANE, critical_limit, NotificationJob.next_attempt_at
+                ))
+            if oldest_limit:
+                parts.append(candidates(lesser, oldest_limit, NotificationJob.next_attempt_at))
+            if limit - oldest_limit:
+                parts.append(candidates(
+                    lesser, limit - oldest_limit, NotificationJob.priority, NotificationJob.next_attempt_at
+                ))
+
+            rows = db.execute(
+                update(NotificationJob)
+                .where(or_(*parts), due)
+                .values(
+                    status="sending",
+                    attempts=NotificationJob.attempts + 1,
+                    locked_by=self.consumer_id,
+                    locked_until=now + timedelta(seconds=settings.NOTIFICATION_QUEUE_LEASE_SECONDS),
+                    updated_at=now
+                )
+                .returning(
+                    NotificationJob.id,
+                    NotificationJob.channel,
+                    NotificationJob.destination,
+                    NotificationJob.payload,
+                    NotificationJob.message_key,
+                    NotificationJob.priority,
+                    NotificationJob.attempts
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+
+            payloads = self._message_payloads(db, {row.message_key for row in rows if row.payload is None})
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.claimed += len(rows)
+        return [
+            DeliveryJob(
+                channel=row.channel,
+                destination=row.destination,
+                payload=row.payload if row.payload is not None else payloads[row.message_key],
+                batch_key=row.message_key,
+                priority=row.priority if row.priority is not None else 2,
+                job_id=row.id,
+                attempts=row.attempts - 1
+            )
+            for row in rows
+        ]
+
+    @staticmethod
+    def _message_payloads(db: Session, message_keys: Set[str]) -> Dict[str, Dict]:
+        # A claim usually spans a handful of variants, whatever its size
+        message_keys = list(message_keys)
+        payloads: Dict[str, Dict] = {}
+        for i in range(0, len(message_keys), KEY_LOOKUP_CHUNK_SIZE):
+            payloads.update(db.query(NotificationMessage.key, NotificationMessage.payload).filter(
+                NotificationMessage.key.in_(message_keys[i:i + KEY_LOOKUP_CHUNK_SIZE])
+            ).all())
+        return payloads
+
+    async def _dispatch(self, channel: str, jobs: List[DeliveryJob]):
+        # Recipients of the same rendered message go out as provider batches
+        groups: Dict[Optional[str], List[DeliveryJob]] = {}
+        singles: List[List[DeliveryJob]] = []
+        for job in jobs:
+            if job.batch_key:
+                groups.setdefault(job.batch_key, []).append(job)
+            else:
+                singles.append([job])
+
+        size = delivery_pool.batch_size(channel)
+        batches = singles + [
+            group[i:i + size]
+            for group in groups.values()
+            for i in range(0, len(group), size)
+        ]
+
+        critical = sum(1 for batch in batches if batch[0].priority == CRITICAL_LANE)
+        self._in_flight[channel] = self._in_flight.get(channel, 0) + len(batches)
+        self._critical_in_flight[channel] = self._critical_in_flight.get(channel, 0) + critical
+        for batch in batches:
+            await delivery_pool.submit_batch(batch)
+
+        task = asyncio.create_task(self._complete(channel, jobs, batches))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _complete(self, channel: str, jobs: List[DeliveryJob], batches: List[List[DeliveryJob]]):
+        try:
+            # Each finished request frees its slot at once; results are recorded together
+            await asyncio.gather(*(self._release(channel, batch) for batch in batches))
+            await asyncio.to_thread(self._record_results, jobs)
+        except Exception as e:
+            logger.error(f"Failed to record notification job results: {e}")
+
+    async def _release(self, channel: str, batch: List[DeliveryJob]):
+        try:
+            await delivery_pool.wait([job.job_id for job in batch])
+        finally:
+            self._in_flight[channel] -= 1
+            if batch[0].priority == CRITICAL_LANE:
+                self._critical_in_flight[channel] -= 1
+
+        # Capacity freed up
+        self.notify()
+
+    def _record_results(self, jobs: List[DeliveryJob]):
+        now = datetime.utcnow()
+        results = {job.job_id: job for job in jobs if job.status in ("sent", "failed")}
+        notifications: List[Dict] = []
+        used_channels: List[str] = []
+        invalid_devices: Dict[str, Set[str]] = {}
+        deliveries: List[Tuple[str, str, Optional[float], float]] = []
+
+        db = SessionLocal()
+        try:
+            job_ids = list(results)
+            for i in range(0, len(job_ids), KEY_LOOKUP_CHUNK_SIZE):
+                rows = db.query(NotificationJob).filter(
+                    NotificationJob.id.in_(job_ids[i:i + KEY_LOOKUP_CHUNK_SIZE]),
+                    # Skip jobs whose lease expired and moved to another consumer
+                    NotificationJob.locked_by == self.consumer_id,
+                    NotificationJob.status == "sending"
+                ).all()
+
+                for row in rows:
+                    result = results[row.id]
+                    row.locked_by = None
+                    row.locked_until = None
+                    row.updated_at = now
+
+                    if result.status == "sent":
+                        self._mark_sent(row, result, now)
+                        if row.channel_id:
+                            used_channels.append(row.channel_id)
+                        if row.alert_id:
+                            deliveries.append((
+                                row.alert_id, row.channel, result.request_started_at, epoch(row.completed_at)
+                            ))
+                    elif row.attempts < row.max_attempts and is_retryable(result):
+                        self._mark_retry(row, result, now)
+                    else:
+                        self._mark_dead(db, row, result, now)
+                        if row.channel == "push" and result.invalid_destination and row.user_id:
+                            invalid_devices.setdefault(row.user_id, set()).add(row.destination)
+
+                    if row.notification_id:
+                        notifications.append({
+                            "id": row.notification_id,
+                            "status": {"sent": "sent", "retry": "pending"}.get(row.status, "failed"),
+                            "sent_at": row.completed_at if row.status == "sent" else None,
+                            "error_message": row.last_error
+                        })
+
+            # Bulk updates by primary key, one statement per table
+            if notifications:
+                db.execute(update(Notification), notifications)
+            for i in range(0, len(used_channels), KEY_LOOKUP_CHUNK_SIZE):
+                db.query(NotificationChannel).filter(
+                    NotificationChannel.id.in_(used_channels[i:i + KEY_LOOKUP_CHUNK_SIZE])
+                ).update({NotificationChannel.last_used: now}, synchronize_session=False)
+            if invalid_devices:
+                push_devices.prune(db, invalid_devices)
+
+            db.commit()
+
+            # Best effort, once the results are safely recorded
+            if deliveries:
+                self._observe_latency(db, deliveries)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _observe_latency(db: Session, deliveries: List[Tuple[str, str, Optional[float], float]]):
+        try:
+            alert_latency.observe_deliveries(db, deliveries)
+        except Exception as e:
+            logger.error(f"Failed to observe latency of {len(deliveries)} deliveries: {e}")
+
+    def _mark_sent(self, row: NotificationJob, result: DeliveryJob, now: datetime):
+        row.status = "sent"
+        row.provider_id = result.provider_id
+        row.last_error = None
+        # When the provider accepted it, not when the result was recorded
+        row.completed_at = result.completed_at or now
+        self.sent += 1
+
+    def _mark_retry(self, row: NotificationJob, result: DeliveryJob, now: datetime):
+        row.status = "retry"
+        row.last_error = result.error
+        row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+        self.retried += 1
+
+    def _mark_dead(self, db: Session, row: NotificationJob, result: DeliveryJob, now: datetime):
+        row.status = "dead"
+        row.last_error = result.error
+        row.completed_at = now
+        self.dead_lettered += 1
+
+        db.add(NotificationDeadLetter(
+            job_id=row.id,
+            idempotency_key=row.idempotency_key,
+            user_id=row.user_id,
+            alert_id=row.alert_id,
+            channel=row.channel,
+            destination=row.destination,
+            attempts=row.attempts,
+            last_error=result.error,
+            failed_at=now
+        ))
+        # A dead device token says nothing about the user's other devices
+        if row.user_id and row.alert_id and not result.invalid_destination:
+            notification_dedup.release(db, row.user_id, row.alert_id, row.channel)
+        logger.warning(f"Notification job {row.id} dead-lettered after {row.attempts} attempts: {result.error}")
+
+
+# Create singleton instance
+notification_queue = NotificationQueue()
+
+
+async def run_worker():
+    """Standalone consumer; run more of these to scale delivery out."""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    # Latency metrics of this process, scraped separately from the API
+    if settings.NOTIFICATION_WORKER_METRICS_PORT:
+        start_http_server(settings.NOTIFICATION_WORKER_METRICS_PORT)
+
+    await notification_queue.start()
+    await stopping.wait()
+
+    await notification_queue.stop()
+    await delivery_pool.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(run_worker())
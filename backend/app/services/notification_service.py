@@ -1,127 +1,161 @@
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
 import asyncio
-from twilio.rest import Client as TwilioClient
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, To, From, Content
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.models.models import User, Alert, Notification, NotificationChannel, AlertSeverity
-import httpx
+from app.models.models import User, Alert, Notification, NotificationChannel, AlertSeverity, SubscriptionTier
+from app.services.alert_latency import alert_latency
+from app.services.message_renderer import message_renderer
+from app.services.notification_dedup import notification_dedup
+from app.services.notification_delivery import DeliveryJob, delivery_pool, lane_for
+from app.services.notification_queue import notification_queue
+from app.services.push_devices import parse_destination, push_destinations
+from app.services.user_snapshot import user_snapshot
 
 logger = logging.getLogger(__name__)
 
+CHANNEL_FETCH_CHUNK_SIZE = 500
+
+# Free tier only gets web/push notifications; these tiers also get email, SMS and voice
+NOTIFICATION_TIERS = [tier for tier in SubscriptionTier if tier != SubscriptionTier.FREE]
+
 class NotificationService:
     """Handle multi-channel notifications for alerts"""
     
     def __init__(self):
-        # Initialize Twilio
-        if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-            self.twilio_client = TwilioClient(
-                settings.TWILIO_ACCOUNT_SID,
-                settings.TWILIO_AUTH_TOKEN
-            )
-        else:
-            self.twilio_client = None
-            logger.warning("Twilio credentials not configured")
+        # Alert sends go through the durable queue, which feeds the shared delivery workers
+        self.delivery = delivery_pool
+        self.queue = notification_queue
+        self.renderer = message_renderer
+        self.dedup = notification_dedup
         
-        # Initialize SendGrid
-        if settings.SENDGRID_API_KEY:
-            self.sendgrid_client = SendGridAPIClient(settings.SENDGRID_API_KEY)
-        else:
-            self.sendgrid_client = None
+        if not self.delivery.is_configured("sms"):
+            logger.warning("Twilio credentials not configured")
+        if not self.delivery.is_configured("email"):
             logger.warning("SendGrid credentials not configured")
+        if not self.delivery.is_configured("push"):
+            logger.warning("FCM and APNs credentials not configured")
     
     async def send_alert_notifications(
         self,
         db: Session,
         alert: Alert,
         affected_users: List[User]
-    ):
-        """Send notifications to all affected users based on their preferences"""
-        tasks = []
+    ) -> List[str]:
+        """
+        Queue notifications to all affected users based on their preferences.
+        Returns the ids of newly queued jobs; sends complete in the background.
+        """
+        recipients = self._filter_recipients(db, alert, affected_users)
+        if not recipients:
+            return []
         
-        for user in affected_users:
-            # Check user's subscription allows notifications
-            if not self._can_send_notifications(user):
-                continue
-            
-            # Check severity threshold
-            if not self._meets_severity_threshold(alert, user):
-                continue
-            
-            # Check quiet hours
-            if self._is_quiet_hours(user):
-                continue
-            
-            # Get user's notification channels
-            channels = db.query(NotificationChannel).filter(
-                NotificationChannel.user_id == user.id,
-                NotificationChannel.is_active == True,
-                NotificationChannel.is_verified == True
-            ).all()
-            
-            for channel in channels:
+        paid_ids = [
+            user_id for user_id, user in recipients.items()
+            if user.subscription_tier in NOTIFICATION_TIERS
+        ]
+        channels_by_user = self._fetch_channels(db, paid_ids)
+        
+        jobs = []
+        windows = []
+        for user_id, user in recipients.items():
+            for job in self._push_jobs(user, alert):
+                jobs.append(job)
+                windows.append(self.dedup.window("push"))
+            
+            for channel in channels_by_user.get(user_id, []):
                 # Check channel-specific settings
                 if not self._channel_accepts_alert(channel, alert):
                     continue
                 
-                # Create notification task
-                if channel.channel_type == "email":
-                    tasks.append(self._send_email_notification(db, user, alert, channel))
-                elif channel.channel_type == "sms":
-                    tasks.append(self._send_sms_notification(db, user, alert, channel))
-                elif channel.channel_type == "voice":
-                    tasks.append(self._send_voice_notification(db, user, alert, channel))
+                try:
+                    job = self._build_job(user, alert, channel)
+                except Exception as e:
+                    logger.error(f"Notification failed: {e}")
+                    continue
+                if job:
+                    jobs.append(job)
+                    windows.append(self.dedup.window(channel.channel_type, channel.digest_minutes))
         
-        # Send all notifications concurrently
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"Notification failed: {result}")
-    
-    def _can_send_notifications(self, user: User) -> bool:
-        """Check if user's subscription allows notifications"""
-        from app.services.subscription_service import SubscriptionService
-        limits = SubscriptionService.get_user_limits(user)
+        alert_latency.stamp(alert, "render")
         
-        # Free tier only gets web/push notifications
-        if user.subscription_tier.value == "free":
-            return False
+        # Persist all notifications to the job queue in one transaction, dropping
+        # repeats about the same event within each channel's digest window
+        job_ids = await asyncio.to_thread(self.queue.enqueue_many, jobs, alert, windows)
         
-        return True
+        alert_latency.stamp(alert, "enqueue")
+        await asyncio.to_thread(alert_latency.save, alert)
+        return job_ids
     
-    def _meets_severity_threshold(self, alert: Alert, user: User) -> bool:
-        """Check if alert meets user's severity threshold"""
-        severity_order = {
-            AlertSeverity.MINOR: 1,
-            AlertSeverity.MODERATE: 2,
-            AlertSeverity.SEVERE: 3,
-            AlertSeverity.EXTREME: 4
-        }
+    def _filter_recipients(self, db: Session, alert: Alert, users: List[User]) -> Dict[str, User]:
+        """
+        Apply the severity threshold and quiet hours checks to the whole
+        audience at once using the user snapshot. Every tier gets push;
+        channels are only fetched for paid tiers.
+        """
+        if not users:
+            return {}
+        
+        from zoneinfo import ZoneInfo
+        user_snapshot.ensure_loaded(db)
         
-        alert_level = severity_order.get(alert.severity, 1)
-        user_threshold = severity_order.get(user.severity_threshold, 1)
+        # Users committed elsewhere may not have reached the snapshot yet
+        user_ids = [user.id for user in users]
+        user_snapshot.load_missing(db, user_ids)
         
-        return alert_level >= user_threshold
+        allowed = user_snapshot.select(
+            user_ids=user_ids,
+            alert_severity=alert.severity,
+            not_quiet_at_hour=datetime.now(ZoneInfo("Pacific/Honolulu")).hour
+        )
+        allowed = set(allowed.tolist())
+        
+        return {user.id: user for user in users if user.id in allowed}
     
-    def _is_quiet_hours(self, user: User) -> bool:
-        """Check if current time is within user's quiet hours"""
-        if not user.quiet_hours_start or not user.quiet_hours_end:
-            return False
+    @staticmethod
+    def _fetch_channels(db: Session, user_ids: Iterable[str]) -> Dict[str, List[NotificationChannel]]:
+        """Load active, verified channels of every recipient using chunked IN queries"""
+        user_ids = list(user_ids)
+        channels_by_user: Dict[str, List[NotificationChannel]] = {}
         
-        # Convert to HST
-        from zoneinfo import ZoneInfo
-        now_hst = datetime.now(ZoneInfo("Pacific/Honolulu"))
-        current_hour = now_hst.hour
+        for i in range(0, len(user_ids), CHANNEL_FETCH_CHUNK_SIZE):
+            chunk = user_ids[i:i + CHANNEL_FETCH_CHUNK_SIZE]
+            channels = db.query(NotificationChannel).filter(
+                NotificationChannel.user_id.in_(chunk),
+                NotificationChannel.is_active == True,
+                NotificationChannel.is_verified == True
+            ).all()
+            for channel in channels:
+                channels_by_user.setdefault(channel.user_id, []).append(channel)
         
-        # Handle overnight quiet hours
-        if user.quiet_hours_start > user.quiet_hours_end:
-            return current_hour >= user.quiet_hours_start or current_hour < user.quiet_hours_end
-        else:
-            return user.quiet_hours_start <= current_hour < user.quiet_hours_end
+        return channels_by_user
+    
+    def _build_job(self, user: User, alert: Alert, channel: NotificationChannel) -> Optional[Dict]:
+        if channel.channel_type == "email":
+            return self._email_job(user, alert, channel)
+        if channel.channel_type == "sms":
+            return self._sms_job(user, alert, channel)
+        if channel.channel_type == "voice":
+            return self._voice_job(user, alert, channel)
+        return None
+    
+    def _push_jobs(self, user: User, alert: Alert) -> List[Dict]:
+        """Build one push notification job per registered device"""
+        if user.push_enabled is False:
+            return []
+        
+        jobs = []
+        for destination in push_destinations(user):
+            platform, _ = parse_destination(destination)
+            if not self.delivery.push_configured(platform):
+                continue
+            
+            job = self._job(user, alert, None, "push", destination)
+            # FCM and APNs devices go out in separate batches
+            job["message_key"] = f"{job['message_key']}:{platform}"
+            jobs.append(job)
+        return jobs
     
     def _channel_accepts_alert(self, channel: NotificationChannel, alert: Alert) -> bool:
         """Check if channel accepts this type of alert"""
@@ -145,242 +179,86 @@ class NotificationService:
         
         return True
     
-    async def _send_email_notification(
+    def _email_job(
         self,
-        db: Session,
         user: User,
         alert: Alert,
         channel: NotificationChannel
-    ):
-        """Send email notification"""
-        try:
-            if not self.sendgrid_client:
-                logger.warning("SendGrid not configured, skipping email")
-                return
-            
-            # Create notification record
-            notification = Notification(
-                user_id=user.id,
-                alert_id=alert.id,
-                channel="email",
-                status="pending"
-            )
-            db.add(notification)
-            db.commit()
-            
-            # Prepare email content
-            subject = f"[{alert.severity.value.upper()}] {alert.title}"
-            
-            # Get translated content if available
-            content = alert.description
-            if user.preferred_language != "en" and alert.translations:
-                lang_content = alert.translations.get(user.preferred_language, {})
-                content = lang_content.get("description", content)
-            
-            html_content = f"""
-            <html>
-                <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                    <div style="background-color: #{self._get_severity_color(alert.severity)}; color: white; padding: 20px; text-align: center;">
-                        <h1 style="margin: 0;">{alert.severity.value.upper()} ALERT</h1>
-                    </div>
-                    <div style="padding: 20px;">
-                        <h2>{alert.title}</h2>
-                        <p>{content}</p>
-                        <p><strong>Location:</strong> {alert.location_name or 'Hawaii'}</p>
-                        <p><strong>Effective:</strong> {alert.effective_time.strftime('%Y-%m-%d %H:%M HST')}</p>
-                        {f'<p><strong>Expires:</strong> {alert.expires_time.strftime("%Y-%m-%d %H:%M HST")}</p>' if alert.expires_time else ''}
-                        <hr>
-                        <p style="text-align: center; margin-top: 30px;">
-                            <a href="https://hawaii-emergency.com/alerts/{alert.id}" 
-                               style="background-color: #0066cc; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">
-                                View Full Alert
-                            </a>
-                        </p>
-                        <p style="font-size: 12px; color: #666; margin-top: 30px;">
-                            You received this alert because you are subscribed to Hawaii Emergency Network Hub.
-                            <a href="https://hawaii-emergency.com/settings/notifications">Manage your notification preferences</a>
-                        </p>
-                    </div>
-                </body>
-            </html>
-            """
-            
-            message = Mail(
-                from_email=From(settings.SENDGRID_FROM_EMAIL, "Hawaii Emergency Network"),
-                to_emails=To(channel.destination or user.email),
-                subject=subject,
-                html_content=Content("text/html", html_content)
-            )
-            
-            # Send email
-            response = self.sendgrid_client.send(message)
-            
-            # Update notification status
-            notification.sent_at = datetime.utcnow()
-            notification.status = "sent" if response.status_code == 202 else "failed"
-            if response.status_code != 202:
-                notification.error_message = f"SendGrid returned {response.status_code}"
-            
-            # Update channel last used
-            channel.last_used = datetime.utcnow()
-            db.commit()
-            
-        except Exception as e:
-            logger.error(f"Failed to send email to {user.email}: {e}")
-            if 'notification' in locals():
-                notification.status = "failed"
-                notification.error_message = str(e)
-                db.commit()
+    ) -> Optional[Dict]:
+        """Build email notification job"""
+        if not self.delivery.is_configured("email"):
+            logger.warning("SendGrid not configured, skipping email")
+            return None
+        
+        return self._job(user, alert, channel, "email", channel.destination or user.email)
     
-    async def _send_sms_notification(
+    def _sms_job(
         self,
-        db: Session,
         user: User,
         alert: Alert,
         channel: NotificationChannel
-    ):
-        """Send SMS notification"""
-        try:
-            if not self.twilio_client:
-                logger.warning("Twilio not configured, skipping SMS")
-                return
-            
-            # Check if user can receive SMS
-            from app.services.subscription_service import SubscriptionService
-            if not SubscriptionService.can_user_access_feature(user, "sms_enabled"):
-                logger.info(f"User {user.id} subscription doesn't include SMS")
-                return
-            
-            # Create notification record
-            notification = Notification(
-                user_id=user.id,
-                alert_id=alert.id,
-                channel="sms",
-                status="pending"
-            )
-            db.add(notification)
-            db.commit()
-            
-            # Prepare SMS content (limited to 160 chars)
-            severity = alert.severity.value.upper()
-            location = alert.location_name or "Hawaii"
-            
-            # Get translated content if needed
-            title = alert.title
-            if user.preferred_language != "en" and alert.translations:
-                lang_content = alert.translations.get(user.preferred_language, {})
-                title = lang_content.get("title", title)
-            
-            message_body = f"{severity}: {title}\nLocation: {location}\nReply STOP to unsubscribe"
-            
-            # Truncate if too long
-            if len(message_body) > 160:
-                message_body = message_body[:157] + "..."
-            
-            # Send SMS
-            message = self.twilio_client.messages.create(
-                body=message_body,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=channel.destination or user.phone
-            )
-            
-            # Update notification status
-            notification.sent_at = datetime.utcnow()
-            notification.status = "sent" if message.sid else "failed"
-            if message.error_code:
-                notification.error_message = message.error_message
-            
-            # Update channel last used
-            channel.last_used = datetime.utcnow()
-            db.commit()
-            
-        except Exception as e:
-            logger.error(f"Failed to send SMS to user {user.id}: {e}")
-            if 'notification' in locals():
-                notification.status = "failed"
-                notification.error_message = str(e)
-                db.commit()
+    ) -> Optional[Dict]:
+        """Build SMS notification job"""
+        if not self.delivery.is_configured("sms"):
+            logger.warning("Twilio not configured, skipping SMS")
+            return None
+        
+        # Check if user can receive SMS
+        from app.services.subscription_service import SubscriptionService
+        if not SubscriptionService.can_user_access_feature(user, "sms_enabled"):
+            logger.info(f"User {user.id} subscription doesn't include SMS")
+            return None
+        
+        return self._job(user, alert, channel, "sms", channel.destination or user.phone)
     
-    async def _send_voice_notification(
+    def _voice_job(
         self,
-        db: Session,
         user: User,
         alert: Alert,
         channel: NotificationChannel
-    ):
-        """Send voice call notification for critical alerts"""
-        try:
-            if not self.twilio_client:
-                logger.warning("Twilio not configured, skipping voice call")
-                return
-            
-            # Check if user can receive voice calls
-            from app.services.subscription_service import SubscriptionService
-            if not SubscriptionService.can_user_access_feature(user, "voice_enabled"):
-                logger.info(f"User {user.id} subscription doesn't include voice calls")
-                return
-            
-            # Only for severe/extreme alerts
-            if alert.severity not in [AlertSeverity.SEVERE, AlertSeverity.EXTREME]:
-                return
-            
-            # Create notification record
-            notification = Notification(
-                user_id=user.id,
-                alert_id=alert.id,
-                channel="voice",
-                status="pending"
-            )
-            db.add(notification)
-            db.commit()
-            
-            # Create TwiML for voice message
-            twiml = f"""
-            <Response>
-                <Say voice="alice" language="en-US">
-                    This is an emergency alert from Hawaii Emergency Network.
-                    {alert.severity.value} alert: {alert.title}.
-                    Location: {alert.location_name or 'Hawaii'}.
-                    Please check your email or app for more details.
-                    Press 1 to hear this message again.
-                </Say>
-                <Gather numDigits="1" action="/api/v1/voice/repeat/{alert.id}">
-                    <Say>Press 1 to repeat this message.</Say>
-                </Gather>
-            </Response>
-            """
-            
-            # Make voice call
-            call = self.twilio_client.calls.create(
-                twiml=twiml,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=channel.destination or user.phone
-            )
-            
-            # Update notification status
-            notification.sent_at = datetime.utcnow()
-            notification.status = "sent" if call.sid else "failed"
-            
-            # Update channel last used
-            channel.last_used = datetime.utcnow()
-            db.commit()
-            
-        except Exception as e:
-            logger.error(f"Failed to make voice call to user {user.id}: {e}")
-            if 'notification' in locals():
-                notification.status = "failed"
-                notification.error_message = str(e)
-                db.commit()
+    ) -> Optional[Dict]:
+        """Build voice call notification job for critical alerts"""
+        if not self.delivery.is_configured("voice"):
+            logger.warning("Twilio not configured, skipping voice call")
+            return None
+        
+        # Check if user can receive voice calls
+        from app.services.subscription_service import SubscriptionService
+        if not SubscriptionService.can_user_access_feature(user, "voice_enabled"):
+            logger.info(f"User {user.id} subscription doesn't include voice calls")
+            return None
+        
+        # Only for severe/extreme alerts
+        if alert.severity not in [AlertSeverity.SEVERE, AlertSeverity.EXTREME]:
+            return None
+        
+        return self._job(user, alert, channel, "voice", channel.destination or user.phone)
     
-    def _get_severity_color(self, severity: AlertSeverity) -> str:
-        """Get color code for severity level"""
-        colors = {
-            AlertSeverity.MINOR: "f39c12",
-            AlertSeverity.MODERATE: "e67e22",
-            AlertSeverity.SEVERE: "e74c3c",
-            AlertSeverity.EXTREME: "c0392b"
+    def _job(
+        self,
+        user: User,
+        alert: Alert,
+        channel: Optional[NotificationChannel],
+        channel_type: str,
+        destination: str
+    ) -> Dict:
+        # Recipients of the same variant share one rendered payload
+        return {
+            "user_id": user.id,
+            "alert_id": alert.id,
+            "channel": channel_type,
+            "destination": destination,
+            "payload": self.renderer.render(alert, user.preferred_language, channel_type),
+            "message_key": self.renderer.message_key(alert, user.preferred_language, channel_type),
+            "priority": lane_for(alert.severity, alert.category),
+            "channel_id": channel.id if channel else None
         }
-        return colors.get(severity, "333333")
+    
+    async def _queue_delivery(self, job: Optional[Dict]) -> Optional[str]:
+        """Persist a pending notification and its delivery job; None if skipped or already queued"""
+        if not job:
+            return None
+        return await asyncio.to_thread(self.queue.enqueue, **job)
     
     async def verify_channel(
         self,
@@ -398,34 +276,35 @@ class NotificationService:
         channel.verification_sent_at = datetime.utcnow()
         db.commit()
         
-        try:
-            if channel.channel_type == "email":
-                # Send verification email
-                if self.sendgrid_client:
-                    message = Mail(
-                        from_email=From(settings.SENDGRID_FROM_EMAIL, "Hawaii Emergency Network"),
-                        to_emails=To(channel.destination),
-                        subject="Verify your email for Hawaii Emergency Network",
-                        html_content=f"""
-                        <p>Your verification code is: <strong>{code}</strong></p>
-                        <p>This code expires in 10 minutes.</p>
-                        """
-                    )
-                    self.sendgrid_client.send(message)
-                    return True
-                    
-            elif channel.channel_type == "sms":
-                # Send verification SMS
-                if self.twilio_client:
-                    self.twilio_client.messages.create(
-                        body=f"Hawaii Emergency Network verification code: {code}",
-                        from_=settings.TWILIO_PHONE_NUMBER,
-                        to=channel.destination
-                    )
-                    return True
-            
+        if channel.channel_type == "email":
+            job = DeliveryJob(
+                channel="email",
+                destination=channel.destination,
+                payload={
+                    "subject": "Verify your email for Hawaii Emergency Network",
+                    "html": f"""
+                    <p>Your verification code is: <strong>{code}</strong></p>
+                    <p>This code expires in 10 minutes.</p>
+                    """
+                }
+            )
+        elif channel.channel_type == "sms":
+            job = DeliveryJob(
+                channel="sms",
+                destination=channel.destination,
+                payload={"body": f"Hawaii Emergency Network verification code: {code}"}
+            )
+        else:
+            return False
+        
+        if not self.delivery.is_configured(job.channel):
             return False
+        
+        try:
+            await self.delivery.submit(job)
+            await self.delivery.wait([job.job_id], timeout=settings.NOTIFICATION_HTTP_TIMEOUT_SECONDS * 2)
+            return job.status == "sent"
             
         except Exception as e:
             logger.error(f"Failed to send verification: {e}")
-            return False
\ No newline at end of file
+            return False
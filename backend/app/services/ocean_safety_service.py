@@ -5,6 +5,7 @@ from datetime import datetime, timezone
 from sqlalchemy.orm import Session
 
 from app.models.models import Alert, AlertCategory, AlertSeverity
+from app.services.hawaii_boundaries import hawaii_boundaries
 
 logger = logging.getLogger(__name__)
 
@@ -207,6 +208,8 @@ class OceanSafetyService:
                 if beach_info:
                     alert.latitude = beach_info["lat"]
                     alert.longitude = beach_info["lng"]
+                    county = hawaii_boundaries.county_for_point(beach_info["lat"], beach_info["lng"])
+                    alert.affected_counties = [county] if county else []
                     alert.radius_miles = 2
                 
                 db.add(alert)
@@ -230,6 +233,8 @@ class OceanSafetyService:
                 if beach_info:
                     alert.latitude = beach_info["lat"]
                     alert.longitude = beach_info["lng"]
+                    county = hawaii_boundaries.county_for_point(beach_info["lat"], beach_info["lng"])
+                    alert.affected_counties = [county] if county else []
                     alert.radius_miles = 1
                 
                 db.add(alert)
@@ -0,0 +1,304 @@
+"""
+Provider rate limiting
+Token buckets per provider and sender that pace outbound notification
+requests under the account throughput caps of SendGrid, Twilio and the push
+services. A 429 halves the bucket's rate and pauses it for the Retry-After
+period; the rate then recovers linearly. State is shared by all workers
+through Redis, with per-process buckets when Redis is unavailable
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY_PREFIX = "notify:bucket:"
+
+# Lowest fraction of the configured rate a bucket backs off to
+MIN_RATE_FACTOR = 0.1
+
+# How often a caller that may abandon its wait checks whether to
+ABANDON_CHECK_SECONDS = 0.05
+
+# Returns the seconds to wait before sending cost units. Ordinary callers
+# take tokens only once none are left to wait for, and retry after the wait.
+# Preempting callers reserve a slot on their own timeline right away, paced
+# at the bucket's rate among themselves, and the tokens they take push
+# everyone else back; a batch costing more than the burst overdraws it.
+RESERVE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local base_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local recovery = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local preempt = ARGV[5] == '1'
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'factor', 'blocked_until', 'preempt_at')
+local factor = tonumber(state[3]) or 1
+local ts = tonumber(state[2]) or now
+local blocked_until = tonumber(state[4]) or 0
+
+-- Nothing refills or recovers while the provider has us paused
+local elapsed = math.max(0, now - math.max(ts, blocked_until))
+factor = math.min(1, factor + elapsed / recovery)
+local rate = base_rate * factor
+local capacity = math.max(rate * burst, 1)
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + elapsed * rate)
+
+local ready = math.max(now, blocked_until)
+local delay
+if preempt then
+    local start = math.max(ready, tonumber(state[5]) or 0)
+    redis.call('HSET', KEYS[1], 'preempt_at', start + cost / rate)
+    delay = start - now
+    tokens = tokens - cost
+else
+    local needed = math.min(cost, capacity)
+    delay = ready - now
+    if tokens < needed then
+        delay = delay + (needed - tokens) / rate
+    end
+    if delay <= 0 then
+        tokens = tokens - cost
+    end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', math.max(now, ts), 'factor', factor)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(math.max(0, delay))
+"""
+
+PENALIZE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local retry_after = tonumber(ARGV[1])
+local min_factor = tonumber(ARGV[2])
+
+local state = redis.call('HMGET', KEYS[1], 'factor', 'blocked_until')
+local factor = math.max(min_factor, (tonumber(state[1]) or 1) / 2)
+local blocked_until = math.max(tonumber(state[2]) or 0, now + retry_after)
+
+redis.call('HSET', KEYS[1], 'factor', factor, 'blocked_until', blocked_until, 'tokens', 0, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(factor)
+"""
+
+
+@dataclass
+class LocalBucket:
+    tokens: Optional[float] = None
+    ts: float = 0.0
+    factor: float = 1.0
+    blocked_until: float = 0.0
+    preempt_at: float = 0.0
+
+
+class ProviderRateLimiter:
+    """Adaptive token buckets keyed by provider and sender"""
+
+    def __init__(self):
+        self._redis: Optional[aioredis.Redis] = None
+        self._redis_checked = False
+        self._reserve = None
+        self._penalize = None
+        self._local: Dict[str, LocalBucket] = {}
+
+        self.waiting: Dict[str, int] = {}
+        self.wait_seconds: Dict[str, float] = {}
+        self.throttled: Dict[str, int] = {}
+
+    @staticmethod
+    def bucket_for(channel: str, batch_mode: bool = False, platform: Optional[str] = None) -> Tuple[str, float]:
+        """Bucket name and configured rate (units per second) of a channel."""
+        if channel == "push":
+            return f"push:{platform or 'fcm'}", settings.NOTIFICATION_PUSH_PER_SECOND
+        if channel == "email":
+            return "sendgrid", settings.NOTIFICATION_SENDGRID_REQUESTS_PER_SECOND
+        if channel == "sms":
+            sender = settings.TWILIO_NOTIFY_SERVICE_SID if batch_mode else settings.TWILIO_PHONE_NUMBER
+            return f"twilio:sms:{sender}", settings.NOTIFICATION_TWILIO_SMS_PER_SECOND
+        return f"twilio:voice:{settings.TWILIO_PHONE_NUMBER}", settings.NOTIFICATION_TWILIO_CALLS_PER_SECOND
+
+    async def acquire(
+        self,
+        bucket: str,
+        rate: float,
+        cost: float = 1.0,
+        preempt: bool = False,
+        abandon: Optional[Callable[[], bool]] = None
+    ) -> bool:
+        """
+        Wait until cost units may be sent through the bucket. Preempting
+        callers go ahead of everyone waiting, who then wait for the tokens
+        the preempting callers took. Returns False, without taking tokens,
+        if abandon() turns true while waiting.
+        """
+        self.waiting[bucket] = self.waiting.get(bucket, 0) + 1
+        try:
+            while True:
+                delay = await self._reserve_delay(bucket, rate, cost, preempt)
+                if delay > 0 and not preempt and abandon:
+                    delay = min(delay, ABANDON_CHECK_SECONDS)
+                if delay > 0:
+                    self.wait_seconds[bucket] = self.wait_seconds.get(bucket, 0.0) + delay
+                    await asyncio.sleep(delay)
+
+                # Preempting callers hold their slot; others only take tokens once no wait is left
+                if preempt or delay <= 0:
+                    return True
+                if abandon and abandon():
+                    return False
+        finally:
+            self.waiting[bucket] -= 1
+
+    async def penalize(self, bucket: str, retry_after: Optional[float]):
+        """Back off after the provider throttled us."""
+        retry_after = retry_after if retry_after is not None else settings.NOTIFICATION_RATE_LIMIT_DEFAULT_RETRY_SECONDS
+        self.throttled[bucket] = self.throttled.get(bucket, 0) + 1
+
+        client = await self._client()
+        if client:
+            try:
+                factor = await self._penalize(keys=[BUCKET_KEY_PREFIX + bucket], args=[retry_after, MIN_RATE_FACTOR])
+                logger.warning(f"{bucket} throttled, rate factor now {float(factor):.2f} for {retry_after}s")
+                return
+            except Exception as e:
+                logger.error(f"Redis rate limiter error, using local bucket: {e}")
+
+        state = self._local.setdefault(bucket, LocalBucket(ts=time.monotonic()))
+        now = time.monotonic()
+        state.factor = max(MIN_RATE_FACTOR, state.factor / 2)
+        state.blocked_until = max(state.blocked_until, now + retry_after)
+        state.tokens = 0.0
+        state.ts = now
+        logger.warning(f"{bucket} throttled, rate factor now {state.factor:.2f} for {retry_after}s")
+
+    async def stats(self) -> Dict:
+        client = await self._client()
+        buckets = {}
+        for bucket in set(self.waiting) | set(self._local):
+            state = self._local.get(bucket)
+            if client:
+                try:
+                    values = await client.hmget(BUCKET_KEY_PREFIX + bucket, "tokens", "factor")
+                    state = LocalBucket(
+                        tokens=float(values[0] or 0.0),
+                        factor=float(values[1] or 1.0)
+                    )
+                except Exception as e:
+                    logger.error(f"Redis rate limiter error: {e}")
+
+            buckets[bucket] = {
+                "tokens": round(state.tokens or 0.0, 2) if state else None,
+                "rate_factor": round(state.factor, 3) if state else 1.0,
+                "waiting": self.waiting.get(bucket, 0),
+                "wait_seconds": round(self.wait_seconds.get(bucket, 0.0), 3),
+                "throttled": self.throttled.get(bucket, 0)
+            }
+
+        return {
+            "backend": "redis" if client else "memory",
+            "buckets": buckets
+        }
+
+    async def drain_estimates(self, pending_by_channel: Dict[str, int], batch_sizes: Dict[str, int]) -> Dict[str, float]:
+        """Seconds to send each channel's pending jobs at the current paced rate."""
+        stats = (await self.stats())["buckets"]
+        estimates = {}
+        for channel, pending in pending_by_channel.items():
+            batch_mode = batch_sizes.get(channel, 1) > 1
+            bucket, rate = self.bucket_for(channel, batch_mode)
+            factor = stats.get(bucket, {}).get("rate_factor", 1.0)
+
+            # SendGrid is paced per request; Twilio and push per message, call or device
+            units = pending / batch_sizes.get(channel, 1) if channel == "email" else pending
+            estimates[channel] = round(units / max(rate * factor, 1e-6), 1)
+        return estimates
+
+    async def close(self):
+        if self._redis:
+            await self._redis.close()
+            self._redis = None
+        self._redis_checked = False
+
+    async def _client(self) -> Optional[aioredis.Redis]:
+        if self._redis_checked:
+            return self._redis
+
+        self._redis_checked = True
+        if not settings.NOTIFICATION_RATE_LIMIT_SHARED:
+            return None
+
+        try:
+            client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            await client.ping()
+            self._reserve = client.register_script(RESERVE_SCRIPT)
+            self._penalize = client.register_script(PENALIZE_SCRIPT)
+            self._redis = client
+            logger.info("Provider rate limits shared through Redis")
+        except Exception as e:
+            logger.warning(f"Redis not available for provider rate limits, using local buckets: {e}")
+            self._redis = None
+
+        return self._redis
+
+    async def _reserve_delay(self, bucket: str, rate: float, cost: float, preempt: bool) -> float:
+        client = await self._client()
+        if client:
+            try:
+                delay = await self._reserve(
+                    keys=[BUCKET_KEY_PREFIX + bucket],
+                    args=[
+                        rate,
+                        settings.NOTIFICATION_RATE_BURST_SECONDS,
+                        settings.NOTIFICATION_RATE_RECOVERY_SECONDS,
+                        cost,
+                        int(preempt)
+                    ]
+                )
+                return float(delay)
+            except Exception as e:
+                logger.error(f"Redis rate limiter error, using local bucket: {e}")
+
+        return self._reserve_local(bucket, rate, cost, preempt)
+
+    def _reserve_local(self, bucket: str, rate: float, cost: float, preempt: bool) -> float:
+        now = time.monotonic()
+        state = self._local.setdefault(bucket, LocalBucket(ts=now))
+
+        # Nothing refills or recovers while the provider has us paused
+        elapsed = max(0.0, now - max(state.ts, state.blocked_until))
+
+        state.factor = min(1.0, state.factor + elapsed / settings.NOTIFICATION_RATE_RECOVERY_SECONDS)
+        effective = rate * state.factor
+        capacity = max(effective * settings.NOTIFICATION_RATE_BURST_SECONDS, 1.0)
+        tokens = capacity if state.tokens is None else min(capacity, state.tokens + elapsed * effective)
+
+        ready = max(now, state.blocked_until)
+        if preempt:
+            start = max(ready, state.preempt_at)
+            state.preempt_at = start + cost / effective
+            delay = start - now
+            tokens -= cost
+        else:
+            needed = min(cost, capacity)
+            delay = ready - now
+            if tokens < needed:
+                delay += (needed - tokens) / effective
+            if delay <= 0:
+                tokens -= cost
+
+        state.tokens = tokens
+        state.ts = max(now, state.ts)
+        return max(0.0, delay)
+
+
+# Create singleton instance
+provider_rate_limiter = ProviderRateLimiter()
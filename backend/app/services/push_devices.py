@@ -0,0 +1,97 @@
+"""
+Push device registry
+Device tokens live on User.device_tokens as {"token", "platform",
+"registered_at"} entries; plain strings stored by older clients are FCM
+tokens. Push jobs address one device as "<platform>:<token>"
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.models import User
+
+logger = logging.getLogger(__name__)
+
+PUSH_PLATFORMS = ("fcm", "apns")
+
+# Oldest registrations are dropped beyond this
+MAX_DEVICES_PER_USER = 10
+
+USER_CHUNK_SIZE = 500
+
+
+def _entry(value) -> Optional[Dict]:
+    if isinstance(value, str):
+        return {"token": value, "platform": "fcm"}
+    if isinstance(value, dict) and value.get("token") and value.get("platform") in PUSH_PLATFORMS:
+        return value
+    return None
+
+
+def devices(user: User) -> List[Dict]:
+    """Registered devices of a user, oldest first."""
+    return [entry for entry in map(_entry, user.device_tokens or []) if entry]
+
+
+def push_destination(platform: str, token: str) -> str:
+    return f"{platform}:{token}"
+
+
+def parse_destination(destination: str) -> Tuple[str, str]:
+    """Platform and device token of a push job destination."""
+    platform, token = destination.split(":", 1)
+    return platform, token
+
+
+def push_destinations(user: User) -> List[str]:
+    return [push_destination(entry["platform"], entry["token"]) for entry in devices(user)]
+
+
+def register(user: User, token: str, platform: str) -> Dict:
+    """Add or refresh a device of the user; the caller commits."""
+    if platform not in PUSH_PLATFORMS:
+        raise ValueError(f"Unsupported push platform: {platform}")
+
+    entry = {"token": token, "platform": platform, "registered_at": datetime.utcnow().isoformat()}
+    entries = [existing for existing in devices(user) if existing["token"] != token] + [entry]
+
+    # JSON columns only notice reassignment, not in-place edits
+    user.device_tokens = entries[-MAX_DEVICES_PER_USER:]
+    return entry
+
+
+def unregister(user: User, token: str) -> bool:
+    """Remove a device of the user; the caller commits. False if it was not registered."""
+    entries = devices(user)
+    remaining = [entry for entry in entries if entry["token"] != token]
+    if len(remaining) == len(entries):
+        return False
+    user.device_tokens = remaining
+    return True
+
+
+def prune(db: Session, destinations_by_user: Dict[str, Set[str]]) -> int:
+    """
+    Drop devices the push services reported as no longer valid, given as
+    job destinations per user id. Returns the number removed; the caller
+    commits.
+    """
+    user_ids = list(destinations_by_user)
+    removed = 0
+    for i in range(0, len(user_ids), USER_CHUNK_SIZE):
+        for user in db.query(User).filter(User.id.in_(user_ids[i:i + USER_CHUNK_SIZE])):
+            invalid = destinations_by_user[user.id]
+            entries = devices(user)
+            remaining = [
+                entry for entry in entries
+                if push_destination(entry["platform"], entry["token"]) not in invalid
+            ]
+            if len(remaining) != len(entries):
+                removed += len(entries) - len(remaining)
+                user.device_tokens = remaining
+
+    if removed:
+        logger.info(f"Pruned {removed} invalid push device tokens")
+    return removed
@@ -0,0 +1,339 @@
+"""
+Columnar user targeting snapshot
+Keeps the targeting fields of every active user in NumPy columns with
+interned enum codes, updated incrementally from User changes committed
+in any process and rebuilt periodically, so audience filters run as
+vectorized predicates instead of per-user Python checks on ORM objects
+"""
+import logging
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.user_events import UserChange, on_user_change, subscribe_remote_changes
+from app.models.models import AlertSeverity, SubscriptionTier, User
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_CODES = {
+    AlertSeverity.MINOR: 1,
+    AlertSeverity.MODERATE: 2,
+    AlertSeverity.SEVERE: 3,
+    AlertSeverity.EXTREME: 4
+}
+
+TIER_CODES = {tier: code for code, tier in enumerate(SubscriptionTier)}
+TIER_TIERS = list(SubscriptionTier)
+
+# One bit per county, in settings order
+COUNTY_BITS = {county: 1 << i for i, county in enumerate(settings.HAWAII_COUNTIES)}
+
+NO_HOUR = -1
+
+USER_CHUNK_SIZE = 500
+
+# name -> (dtype, fill value for empty rows)
+COLUMNS = {
+    "active": (np.bool_, False),
+    "has_location": (np.bool_, False),
+    "lat_rad": (np.float64, 0.0),
+    "lon_rad": (np.float64, 0.0),
+    "radius": (np.float32, 0.0),
+    "severity": (np.int8, 1),
+    "quiet_start": (np.int8, NO_HOUR),
+    "quiet_end": (np.int8, NO_HOUR),
+    "tier": (np.int8, 0),
+    "language": (np.int16, 0),
+    "counties": (np.uint8, 0),
+}
+
+
+class UserSnapshot:
+    """Array-backed snapshot of user targeting preferences"""
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._size = 0
+        self._loaded = False
+        self._built_at = 0.0
+
+        self._languages: List[str] = []
+        self._language_codes: Dict[str, int] = {}
+
+        self.ids = np.empty(initial_capacity, dtype=object)
+        for name, (dtype, fill) in COLUMNS.items():
+            setattr(self, name, np.full(initial_capacity, fill, dtype=dtype))
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ensure_loaded(self, db: Session):
+        """Build the snapshot from the database when first needed, and again once it is due a refresh."""
+        if not self._loaded or time.monotonic() - self._built_at >= settings.USER_INDEX_REFRESH_SECONDS:
+            # Subscribe first so changes committed during the rebuild are not missed
+            subscribe_remote_changes()
+            self.rebuild(db)
+
+    def rebuild(self, db: Session):
+        """Reload every active user from the database."""
+        rows = self._query(db).all()
+
+        with self._lock:
+            self._rows = {}
+            self._free_rows = []
+            self._size = 0
+            capacity = max(len(rows), 1024)
+            self.ids = np.empty(capacity, dtype=object)
+            for name, (dtype, fill) in COLUMNS.items():
+                setattr(self, name, np.full(capacity, fill, dtype=dtype))
+
+            for row in rows:
+                self._write_row(self._allocate_row(row[0]), *row[1:])
+
+            self._loaded = True
+            self._built_at = time.monotonic()
+
+        logger.info(f"User snapshot built for {len(rows)} users ({self.memory_bytes()} bytes)")
+
+    def apply_change(self, change: UserChange):
+        """Apply one committed user change."""
+        with self._lock:
+            if change.deleted or not change.is_active:
+                self._release_row(change.user_id)
+                return
+
+            row = self._rows.get(change.user_id)
+            if row is None:
+                row = self._allocate_row(change.user_id)
+
+            self._write_row(
+                row,
+                change.home_latitude,
+                change.home_longitude,
+                change.alert_radius_miles,
+                change.severity_threshold,
+                change.quiet_hours_start,
+                change.quiet_hours_end,
+                change.subscription_tier,
+                change.preferred_language,
+                change.subscribed_counties
+            )
+
+    def load_missing(self, db: Session, user_ids: Iterable[str]) -> int:
+        """
+        Read users absent from the snapshot from the database, such as
+        sign-ups whose change has not arrived yet. Returns the number added.
+        """
+        with self._lock:
+            missing = [user_id for user_id in user_ids if user_id not in self._rows]
+        if not missing:
+            return 0
+
+        rows = []
+        for i in range(0, len(missing), USER_CHUNK_SIZE):
+            rows.extend(self._query(db).filter(User.id.in_(missing[i:i + USER_CHUNK_SIZE])).all())
+
+        with self._lock:
+            for row in rows:
+                if row[0] not in self._rows:
+                    self._write_row(self._allocate_row(row[0]), *row[1:])
+        return len(rows)
+
+    def location_columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ids, latitude (radians), longitude (radians) and alert radius of located users."""
+        with self._lock:
+            mask = self.active[:self._size] & self.has_location[:self._size]
+            return (
+                self.ids[:self._size][mask],
+                self.lat_rad[:self._size][mask],
+                self.lon_rad[:self._size][mask],
+                self.radius[:self._size][mask].astype(np.float64)
+            )
+
+    def select(
+        self,
+        user_ids: Optional[Iterable[str]] = None,
+        alert_severity: Optional[AlertSeverity] = None,
+        tiers: Optional[Iterable[SubscriptionTier]] = None,
+        languages: Optional[Iterable[str]] = None,
+        counties: Optional[Iterable[str]] = None,
+        not_quiet_at_hour: Optional[int] = None,
+        require_location: bool = False
+    ) -> np.ndarray:
+        """
+        Return ids of active users matching every given predicate.
+        alert_severity keeps users whose severity threshold the alert meets;
+        not_quiet_at_hour drops users whose quiet hours cover that HST hour.
+        """
+        with self._lock:
+            size = self._size
+            if user_ids is not None:
+                rows = [self._rows[user_id] for user_id in user_ids if user_id in self._rows]
+                mask = np.zeros(size, dtype=bool)
+                mask[rows] = True
+                mask &= self.active[:size]
+            else:
+                mask = self.active[:size].copy()
+
+            if require_location:
+                mask &= self.has_location[:size]
+
+            if alert_severity is not None:
+                mask &= self.severity[:size] <= SEVERITY_CODES.get(alert_severity, 1)
+
+            if tiers is not None:
+                mask &= np.isin(self.tier[:size], [TIER_CODES[tier] for tier in tiers])
+
+            if languages is not None:
+                codes = [self._language_codes[lang] for lang in languages if lang in self._language_codes]
+                mask &= np.isin(self.language[:size], codes)
+
+            if counties is not None:
+                bits = 0
+                for county in counties:
+                    bits |= COUNTY_BITS.get(county, 0)
+                mask &= (self.counties[:size] & bits) != 0
+
+            if not_quiet_at_hour is not None:
+                mask &= ~self._quiet_mask(size, not_quiet_at_hour)
+
+            return self.ids[:size][mask]
+
+    def language_of(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._rows.get(user_id)
+            return self._languages[self.language[row]] if row is not None else None
+
+    def tier_of(self, user_id: str) -> Optional[SubscriptionTier]:
+        with self._lock:
+            row = self._rows.get(user_id)
+            return TIER_TIERS[self.tier[row]] if row is not None else None
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the fixed-width columns."""
+        return sum(getattr(self, name).nbytes for name in COLUMNS) + self.ids.nbytes
+
+    @staticmethod
+    def _query(db: Session):
+        return db.query(
+            User.id,
+            User.home_latitude,
+            User.home_longitude,
+            User.alert_radius_miles,
+            User.severity_threshold,
+            User.quiet_hours_start,
+            User.quiet_hours_end,
+            User.subscription_tier,
+            User.preferred_language,
+            User.subscribed_counties
+        ).filter(User.is_active == True)
+
+    def _quiet_mask(self, size: int, hour: int) -> np.ndarray:
+        start = self.quiet_start[:size]
+        end = self.quiet_end[:size]
+        configured = (start != NO_HOUR) & (end != NO_HOUR)
+
+        # Overnight quiet hours wrap past midnight
+        overnight = start > end
+        in_window = np.where(
+            overnight,
+            (hour >= start) | (hour < end),
+            (start <= hour) & (hour < end)
+        )
+        return configured & in_window
+
+    def _allocate_row(self, user_id: str) -> int:
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            if self._size == len(self.ids):
+                self._grow(len(self.ids) * 2)
+            row = self._size
+            self._size += 1
+
+        self._rows[user_id] = row
+        self.ids[row] = user_id
+        return row
+
+    def _release_row(self, user_id: str):
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return
+
+        self.ids[row] = None
+        for name, (dtype, fill) in COLUMNS.items():
+            getattr(self, name)[row] = fill
+        self._free_rows.append(row)
+
+    def _grow(self, capacity: int):
+        ids = np.empty(capacity, dtype=object)
+        ids[:len(self.ids)] = self.ids
+        self.ids = ids
+
+        for name, (dtype, fill) in COLUMNS.items():
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _intern_language(self, language: Optional[str]) -> int:
+        language = language or "en"
+        code = self._language_codes.get(language)
+        if code is None:
+            code = len(self._languages)
+            self._languages.append(language)
+            self._language_codes[language] = code
+        return code
+
+    def _write_row(
+        self,
+        row: int,
+        home_latitude: Optional[float],
+        home_longitude: Optional[float],
+        alert_radius_miles: Optional[float],
+        severity_threshold: Optional[AlertSeverity],
+        quiet_hours_start: Optional[int],
+        quiet_hours_end: Optional[int],
+        subscription_tier: Optional[SubscriptionTier],
+        preferred_language: Optional[str],
+        subscribed_counties: Optional[List[str]]
+    ):
+        has_location = home_latitude is not None and home_longitude is not None
+
+        self.active[row] = True
+        self.has_location[row] = has_location
+        self.lat_rad[row] = math.radians(home_latitude) if has_location else 0.0
+        self.lon_rad[row] = math.radians(home_longitude) if has_location else 0.0
+        self.radius[row] = alert_radius_miles or 0.0
+        self.severity[row] = SEVERITY_CODES.get(severity_threshold, 1)
+        self.quiet_start[row] = quiet_hours_start if quiet_hours_start is not None else NO_HOUR
+        self.quiet_end[row] = quiet_hours_end if quiet_hours_end is not None else NO_HOUR
+        self.tier[row] = TIER_CODES.get(subscription_tier or SubscriptionTier.FREE, 0)
+        self.language[row] = self._intern_language(preferred_language)
+
+        bits = 0
+        for county in subscribed_counties or []:
+            bits |= COUNTY_BITS.get(county, 0)
+        self.counties[row] = bits
+
+
+# Create singleton instance
+user_snapshot = UserSnapshot()
+
+
+@on_user_change
+def _apply_user_change(change: UserChange):
+    # Until the first rebuild the database is the source of truth
+    if user_snapshot.loaded:
+        user_snapshot.apply_change(change)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Add alert lifecycle timestamps and the sent_at index for end-to-end latency tracking
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # Origin and pipeline stage times of each alert
+    op.add_column('alerts', sa.Column('lifecycle', sa.JSON(), nullable=True))
+
+    # Latency dashboard reads recently sent notifications
+    op.create_index('ix_notifications_sent_at', 'notifications', ['sent_at'])
+
+def downgrade():
+    op.drop_index('ix_notifications_sent_at', table_name='notifications')
+    op.drop_column('alerts', 'lifecycle')
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Add cross-alert notification dedup table and per-channel digest windows
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    # Add digest window to notification channels
+    op.add_column('notification_channels', sa.Column('digest_minutes', sa.Integer(), nullable=True))
+
+    # Create notification_dedup table
+    op.create_table('notification_dedup',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('event_group', sa.String(), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('alert_id', sa.String(), nullable=True),
+        sa.Column('severity', postgresql.ENUM('MINOR', 'MODERATE', 'SEVERE', 'EXTREME', name='alertseverity', create_type=False), nullable=True),
+        sa.Column('last_sent_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('suppressed', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['alert_id'], ['alerts.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'event_group', 'channel', name='uq_notification_dedup_key')
+    )
+
+def downgrade():
+    # Drop table and column
+    op.drop_table('notification_dedup')
+    op.drop_column('notification_channels', 'digest_minutes')
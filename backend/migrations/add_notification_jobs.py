@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Add durable notification job queue and dead-letter tables
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # Create notification_jobs table
+    op.create_table('notification_jobs',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('idempotency_key', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=True),
+        sa.Column('alert_id', sa.String(), nullable=True),
+        sa.Column('notification_id', sa.String(), nullable=True),
+        sa.Column('channel_id', sa.String(), nullable=True),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('destination', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('message_key', sa.String(), nullable=True),
+        sa.Column('provider_id', sa.String(), nullable=True),
+        sa.Column('priority', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('max_attempts', sa.Integer(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['alert_id'], ['alerts.id'], ),
+        sa.ForeignKeyConstraint(['notification_id'], ['notifications.id'], ),
+        sa.ForeignKeyConstraint(['channel_id'], ['notification_channels.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_jobs_idempotency_key', 'notification_jobs', ['idempotency_key'], unique=True)
+    op.create_index('ix_notification_jobs_status', 'notification_jobs', ['status'])
+    op.create_index('ix_notification_jobs_next_attempt_at', 'notification_jobs', ['next_attempt_at'])
+    op.create_index('ix_notification_jobs_priority', 'notification_jobs', ['priority'])
+    op.create_index('ix_notification_jobs_claim', 'notification_jobs', ['channel', 'status', 'priority', 'next_attempt_at'])
+
+    # Create notification_dead_letters table
+    op.create_table('notification_dead_letters',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('job_id', sa.String(), nullable=True),
+        sa.Column('idempotency_key', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=True),
+        sa.Column('alert_id', sa.String(), nullable=True),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('destination', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('failed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('requeued_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['notification_jobs.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['alert_id'], ['alerts.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_dead_letters_job_id', 'notification_dead_letters', ['job_id'])
+
+def downgrade():
+    # Drop tables
+    op.drop_table('notification_dead_letters')
+    op.drop_table('notification_jobs')
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Store each rendered notification message once and have jobs reference it
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # Create notification_messages table
+    op.create_table('notification_messages',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('alert_id', sa.String(), nullable=True),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['alert_id'], ['alerts.id'], ),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_notification_messages_alert_id', 'notification_messages', ['alert_id'])
+
+    # Jobs of a shared message carry only its key
+    op.alter_column('notification_jobs', 'payload', existing_type=sa.JSON(), nullable=True)
+    op.execute("""
+        INSERT INTO notification_messages (key, alert_id, channel, payload, created_at)
+        SELECT DISTINCT ON (message_key) message_key, alert_id, channel, payload, created_at
+        FROM notification_jobs
+        WHERE message_key IS NOT NULL
+        ORDER BY message_key, created_at
+    """)
+    op.execute("UPDATE notification_jobs SET payload = NULL WHERE message_key IS NOT NULL")
+    op.create_foreign_key(
+        'fk_notification_jobs_message_key', 'notification_jobs', 'notification_messages',
+        ['message_key'], ['key']
+    )
+
+def downgrade():
+    op.drop_constraint('fk_notification_jobs_message_key', 'notification_jobs', type_='foreignkey')
+    op.execute("""
+        UPDATE notification_jobs SET payload = notification_messages.payload
+        FROM notification_messages
+        WHERE notification_jobs.message_key = notification_messages.key
+    """)
+    op.alter_column('notification_jobs', 'payload', existing_type=sa.JSON(), nullable=False)
+    op.drop_index('ix_notification_messages_alert_id', table_name='notification_messages')
+    op.drop_table('notification_messages')
@@ -7,5 +7,5 @@ echo "Starting Hawaii Emergency Hub Backend..."
 echo "Setting up database..."
 python setup_database.py
 
-# Start the application
-exec uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000}
\ No newline at end of file
+# Start the application (permessage-deflate compresses WebSocket alert frames)
+exec uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000} --ws-per-message-deflate true
\ No newline at end of file
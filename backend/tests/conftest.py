@@ -0,0 +1,60 @@
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+import pytest
+
+# Point the app at a throwaway database unless the environment provides one
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from app.core.database import SessionLocal, engine  # noqa: E402
+from app.models.models import (  # noqa: E402
+    Alert,
+    AlertCategory,
+    AlertSeverity,
+    Base,
+    Notification,
+    NotificationDeadLetter,
+    NotificationDedup,
+    NotificationJob,
+    NotificationMessage,
+    User
+)
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.rollback()
+    for model in (NotificationDeadLetter, NotificationJob, NotificationMessage, NotificationDedup, Notification, Alert, User):
+        session.query(model).delete()
+    session.commit()
+    session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def alert(db):
+    alert = Alert(
+        id=str(uuid.uuid4()),
+        title="Flash Flood Warning",
+        description="Heavy rain over windward Oahu",
+        severity=AlertSeverity.SEVERE,
+        category=AlertCategory.FLOOD,
+        effective_time=datetime.utcnow(),
+        source="National Weather Service"
+    )
+    db.add(alert)
+    db.commit()
+    return alert
@@ -0,0 +1,99 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models.models import Alert, AlertCategory, AlertSeverity, NotificationDedup, NotificationJob
+from app.services.notification_dedup import event_group, notification_dedup
+from app.services.notification_queue import NotificationQueue
+
+
+def nws_alert(db, event_id, severity=AlertSeverity.SEVERE):
+    alert = Alert(
+        id=str(uuid.uuid4()),
+        external_id=f"nws_{uuid.uuid4()}",
+        title="Flash Flood Warning",
+        description="Heavy rain",
+        severity=severity,
+        category=AlertCategory.FLOOD,
+        effective_time=datetime.utcnow(),
+        source="National Weather Service",
+        alert_metadata={"event": "Flash Flood Warning", "event_id": event_id}
+    )
+    db.add(alert)
+    db.commit()
+    return alert
+
+
+def sms_job(user, alert):
+    return {
+        "user_id": user.id,
+        "alert_id": alert.id,
+        "channel": "sms",
+        "destination": "+18085550100",
+        "payload": {"body": alert.title},
+        "message_key": f"{alert.id}:en:sms"
+    }
+
+
+def test_separate_warnings_of_one_type_are_separate_events(db):
+    first = nws_alert(db, "vtec:PHFO.FF.W.0012")
+    update = nws_alert(db, "vtec:PHFO.FF.W.0012")
+    other = nws_alert(db, "vtec:PHFO.FF.W.0013")
+
+    assert event_group(first) == event_group(update)
+    assert event_group(first) != event_group(other)
+
+
+def test_updates_are_suppressed_but_new_warnings_go_out(db, user):
+    queue = NotificationQueue()
+    first = nws_alert(db, "vtec:PHFO.FF.W.0012")
+    update = nws_alert(db, "vtec:PHFO.FF.W.0012")
+    other = nws_alert(db, "vtec:PHFO.FF.W.0013")
+
+    assert len(queue.enqueue_many([sms_job(user, first)], first, [60])) == 1
+    assert queue.enqueue_many([sms_job(user, update)], update, [60]) == []
+    assert len(queue.enqueue_many([sms_job(user, other)], other, [60])) == 1
+
+    # Escalation breaks through the window
+    extreme = nws_alert(db, "vtec:PHFO.FF.W.0012", AlertSeverity.EXTREME)
+    assert len(queue.enqueue_many([sms_job(user, extreme)], extreme, [60])) == 1
+
+
+def test_dedup_records_roll_back_with_a_failed_enqueue(db, user, alert, monkeypatch):
+    queue = NotificationQueue()
+
+    def failing_insert(session, by_key):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(NotificationQueue, "_insert", staticmethod(failing_insert))
+    with pytest.raises(RuntimeError):
+        queue.enqueue_many([sms_job(user, alert)], alert, [60])
+    monkeypatch.undo()
+
+    # Nothing was sent, so the user is not marked as notified
+    assert db.query(NotificationDedup).count() == 0
+    assert len(queue.enqueue_many([sms_job(user, alert)], alert, [60])) == 1
+    assert db.query(NotificationDedup).count() == 1
+    assert db.query(NotificationJob).count() == 1
+
+
+def test_records_older_than_the_longest_window_are_pruned(db, user, alert):
+    expired = datetime.utcnow() - timedelta(minutes=settings.NOTIFICATION_DEDUP_MAX_WINDOW_MINUTES + 1)
+    db.add(NotificationDedup(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        event_group="alert:expired",
+        channel="sms",
+        alert_id=alert.id,
+        severity=AlertSeverity.SEVERE,
+        last_sent_at=expired
+    ))
+    db.commit()
+
+    notification_dedup._pruned_at = 0.0
+    NotificationQueue().enqueue_many([sms_job(user, alert)], alert, [60])
+
+    db.expire_all()
+    assert [row.event_group for row in db.query(NotificationDedup)] == [event_group(alert)]
@@ -0,0 +1,48 @@
+import pytest
+
+from app.services.notification_delivery import DeliveryError, DeliveryJob, DeliveryWorkerPool
+
+
+def email_batch(size):
+    return [
+        DeliveryJob(channel="email", destination=f"user{i}@example.com", payload={"subject": "Alert", "html": ""})
+        for i in range(size)
+    ]
+
+
+def pool_answering(monkeypatch, reject):
+    pool = DeliveryWorkerPool()
+    requests = []
+
+    async def request(batch, may_yield=False):
+        requests.append(len(batch))
+        status_code = reject(batch)
+        if status_code:
+            raise DeliveryError(f"HTTP {status_code}", status_code=status_code)
+        return "provider-id"
+
+    monkeypatch.setattr(pool, "_request", request)
+    return pool, requests
+
+
+@pytest.mark.asyncio
+async def test_a_rejected_recipient_is_isolated_by_bisection(monkeypatch):
+    batch = email_batch(8)
+    pool, requests = pool_answering(monkeypatch, lambda jobs: 400 if batch[5] in jobs else None)
+
+    await pool._send(batch)
+
+    assert [job.status for job in batch] == ["sent"] * 5 + ["failed"] + ["sent"] * 2
+    assert len(requests) == 7
+
+
+@pytest.mark.parametrize("status_code", [401, 403, 413])
+@pytest.mark.asyncio
+async def test_request_wide_errors_fail_the_batch_without_bisecting(monkeypatch, status_code):
+    batch = email_batch(1000)
+    pool, requests = pool_answering(monkeypatch, lambda jobs: status_code)
+
+    await pool._send(batch)
+
+    assert requests == [1000]
+    assert all(job.status == "failed" and job.status_code == status_code for job in batch)
@@ -0,0 +1,283 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models.models import (
+    AlertSeverity,
+    Notification,
+    NotificationDeadLetter,
+    NotificationDedup,
+    NotificationJob,
+    NotificationMessage,
+    User
+)
+from app.services import notification_delivery, notification_queue
+from app.services.notification_delivery import LOWEST_LANE, DeliveryJob, DeliveryWorkerPool, LaneQueue
+from app.services.notification_queue import NotificationQueue
+
+
+def job_for(user, alert, channel="email", destination="user@example.com"):
+    return {
+        "user_id": user.id,
+        "alert_id": alert.id,
+        "channel": channel,
+        "destination": destination,
+        "payload": {"subject": "Flash Flood Warning", "html": "<p>Heavy rain</p>"},
+        "message_key": f"{alert.id}:en:{channel}"
+    }
+
+
+def result_of(claimed, status, status_code=None, completed_at=None, invalid_destination=False):
+    return DeliveryJob(
+        channel=claimed.channel,
+        destination=claimed.destination,
+        payload=claimed.payload,
+        job_id=claimed.job_id,
+        status=status,
+        status_code=status_code,
+        error=None if status == "sent" else f"HTTP {status_code}",
+        invalid_destination=invalid_destination,
+        completed_at=completed_at
+    )
+
+
+def job_row(db, job_id):
+    db.expire_all()
+    return db.query(NotificationJob).filter(NotificationJob.id == job_id).one()
+
+
+def test_enqueue_skips_keys_already_queued(db, user, alert):
+    queue = NotificationQueue()
+
+    job_ids = queue.enqueue_many([job_for(user, alert), job_for(user, alert)])
+    assert len(job_ids) == 1
+    assert queue.enqueue_many([job_for(user, alert)]) == []
+
+    # New keys of a partly queued batch still go in
+    job_ids = queue.enqueue_many([job_for(user, alert), job_for(user, alert, "sms", "+18085550100")])
+    assert len(job_ids) == 1
+    assert db.query(NotificationJob).count() == 2
+    assert db.query(Notification).count() == 2
+
+
+def test_recipients_share_one_stored_message(db, user, alert):
+    queue = NotificationQueue()
+    other = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+    db.add(other)
+    db.commit()
+
+    queue.enqueue_many([job_for(user, alert), job_for(other, alert, destination="other@example.com")])
+    assert db.query(NotificationMessage).count() == 1
+    assert db.query(NotificationJob).filter(NotificationJob.payload.isnot(None)).count() == 0
+
+    # Jobs of a later enqueue reuse the stored message
+    queue.enqueue_many([job_for(user, alert, "email", "second@example.com") | {"user_id": other.id}])
+    assert db.query(NotificationMessage).count() == 1
+
+    claimed = queue._claim("email", 0, 10)
+    assert len(claimed) == 2
+    assert all(job.payload == job_for(user, alert)["payload"] for job in claimed)
+
+
+def test_enqueue_recovers_from_a_lost_idempotency_race(db, user, alert, monkeypatch):
+    queue = NotificationQueue()
+    insert = NotificationQueue._insert
+
+    def racing_insert(session, by_key):
+        # Another process queues the email job between the lookup and the insert
+        monkeypatch.setattr(NotificationQueue, "_insert", staticmethod(insert))
+        NotificationQueue().enqueue_many([job_for(user, alert)])
+        return insert(session, by_key)
+
+    monkeypatch.setattr(NotificationQueue, "_insert", staticmethod(racing_insert))
+    job_ids = queue.enqueue_many([job_for(user, alert), job_for(user, alert, "sms", "+18085550100")])
+
+    assert len(job_ids) == 1
+    assert job_row(db, job_ids[0]).channel == "sms"
+    assert db.query(NotificationJob).count() == 2
+
+
+def test_expired_lease_is_reclaimed_by_another_consumer(db, user, alert):
+    first, second = NotificationQueue(), NotificationQueue()
+    [job_id] = first.enqueue_many([job_for(user, alert)])
+
+    [claimed] = first._claim("email", 0, 10)
+    assert claimed.job_id == job_id
+    assert second._claim("email", 0, 10) == []
+
+    # The first consumer stalls past its lease
+    db.query(NotificationJob).filter(NotificationJob.id == job_id).update(
+        {NotificationJob.locked_until: datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+    [reclaimed] = second._claim("email", 0, 10)
+    assert reclaimed.job_id == job_id
+    assert reclaimed.attempts == 1
+    row = job_row(db, job_id)
+    assert row.locked_by == second.consumer_id
+    assert row.attempts == 2
+
+    # A late result from the first consumer does not touch the reclaimed job
+    first._record_results([result_of(claimed, "sent")])
+    row = job_row(db, job_id)
+    assert row.status == "sending"
+    assert row.locked_by == second.consumer_id
+
+
+def test_sent_at_is_when_the_provider_accepted_the_send(db, user, alert):
+    queue = NotificationQueue()
+    [job_id] = queue.enqueue_many([job_for(user, alert)])
+    [claimed] = queue._claim("email", 0, 10)
+
+    accepted_at = datetime.utcnow() - timedelta(seconds=30)
+    queue._record_results([result_of(claimed, "sent", completed_at=accepted_at)])
+
+    row = job_row(db, job_id)
+    notification = db.query(Notification).filter(Notification.id == row.notification_id).one()
+    assert row.status == "sent"
+    assert notification.status == "sent"
+    assert notification.sent_at.replace(tzinfo=None) == accepted_at
+
+
+def test_failures_retry_until_dead_lettered(db, user, alert, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATION_MAX_ATTEMPTS", 2)
+    queue = NotificationQueue()
+    [job_id] = queue.enqueue_many([job_for(user, alert)])
+
+    [claimed] = queue._claim("email", 0, 10)
+    queue._record_results([result_of(claimed, "failed", status_code=503)])
+    row = job_row(db, job_id)
+    assert row.status == "retry"
+    assert row.next_attempt_at.replace(tzinfo=None) > datetime.utcnow()
+
+    # Not due until the backoff passes
+    assert queue._claim("email", 0, 10) == []
+    db.query(NotificationJob).filter(NotificationJob.id == job_id).update(
+        {NotificationJob.next_attempt_at: datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+    [claimed] = queue._claim("email", 0, 10)
+    queue._record_results([result_of(claimed, "failed", status_code=503)])
+
+    row = job_row(db, job_id)
+    assert row.status == "dead"
+    assert row.attempts == 2
+    dead_letter = db.query(NotificationDeadLetter).filter(NotificationDeadLetter.job_id == job_id).one()
+    assert dead_letter.attempts == 2
+    notification = db.query(Notification).filter(Notification.id == row.notification_id).one()
+    assert notification.status == "failed"
+
+
+def test_permanent_failures_are_dead_lettered_at_once(db, user, alert):
+    queue = NotificationQueue()
+    [job_id] = queue.enqueue_many([job_for(user, alert)])
+
+    [claimed] = queue._claim("email", 0, 10)
+    queue._record_results([result_of(claimed, "failed", status_code=400)])
+
+    assert job_row(db, job_id).status == "dead"
+    assert db.query(NotificationDeadLetter).count() == 1
+
+
+def test_requeue_gives_a_dead_letter_fresh_attempts(db, user, alert):
+    queue = NotificationQueue()
+    [job_id] = queue.enqueue_many([job_for(user, alert)])
+    [claimed] = queue._claim("email", 0, 10)
+    queue._record_results([result_of(claimed, "failed", status_code=400)])
+
+    dead_letter = db.query(NotificationDeadLetter).one()
+    assert queue.requeue(db, dead_letter.id) is not None
+    assert queue.requeue(db, dead_letter.id) is None
+
+    row = job_row(db, job_id)
+    assert row.status == "queued"
+    assert row.attempts == 0
+    assert [job.job_id for job in queue._claim("email", 0, 10)] == [job_id]
+
+
+def dedup_row(db, user, alert, channel):
+    db.add(NotificationDedup(
+        id=str(uuid.uuid4()),
+        user_id=user.id,
+        event_group=f"alert:{alert.id}",
+        channel=channel,
+        alert_id=alert.id,
+        severity=AlertSeverity.SEVERE,
+        last_sent_at=datetime.utcnow()
+    ))
+    db.commit()
+
+
+def test_dead_letter_releases_the_dedup_record(db, user, alert):
+    queue = NotificationQueue()
+    dedup_row(db, user, alert, "email")
+    queue.enqueue_many([job_for(user, alert)])
+
+    [claimed] = queue._claim("email", 0, 10)
+    queue._record_results([result_of(claimed, "failed", status_code=400)])
+
+    # The next alert of the group goes out, as this one never arrived
+    db.expire_all()
+    assert db.query(NotificationDedup).count() == 0
+
+
+def test_invalid_device_keeps_the_dedup_record(db, user, alert):
+    queue = NotificationQueue()
+    dedup_row(db, user, alert, "push")
+    queue.enqueue_many([job_for(user, alert, "push", "fcm:expired-token")])
+
+    [claimed] = queue._claim("push", 0, 10)
+    queue._record_results([result_of(claimed, "failed", status_code=404, invalid_destination=True)])
+
+    db.expire_all()
+    assert job_row(db, claimed.job_id).status == "dead"
+    assert db.query(NotificationDedup).count() == 1
+
+
+@pytest.mark.asyncio
+async def test_jobs_in_flight_past_the_tracking_limit_are_not_released_early(db, alert, monkeypatch):
+    # A pool without workers, so every dispatched batch stays queued
+    pool = DeliveryWorkerPool()
+    pool._queues = {channel: LaneQueue(100) for channel in pool.concurrency()}
+    monkeypatch.setattr(pool, "_ensure_started", lambda: None)
+    monkeypatch.setattr(notification_queue, "delivery_pool", pool)
+    monkeypatch.setattr(notification_delivery, "MAX_TRACKED_JOBS", 3)
+
+    users = [User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com") for _ in range(10)]
+    db.add_all(users)
+    db.commit()
+
+    # One batch per job
+    queue = NotificationQueue()
+    queue.enqueue_many([
+        job_for(recipient, alert, destination=recipient.email) | {"message_key": f"{alert.id}:en:email:{i}"}
+        for i, recipient in enumerate(users)
+    ])
+    claimed = queue._claim("email", 0, 20)
+    assert len(claimed) == 10
+    await queue._dispatch("email", claimed)
+    await asyncio.sleep(0.05)
+
+    # More jobs are queued than the pool keeps finished ones for; none frees its slot
+    assert queue._in_flight["email"] == 10
+    assert all(row.status == "sending" for row in db.query(NotificationJob))
+
+    async def send(batch, may_yield=False):
+        for job in batch:
+            job.status = "sent"
+            job.completed_at = datetime.utcnow()
+
+    monkeypatch.setattr(pool, "_send", send)
+    while pool._queues["email"].qsize():
+        await pool._deliver(await pool._queues["email"].get(LOWEST_LANE))
+    await asyncio.gather(*queue._batches)
+
+    assert queue._in_flight["email"] == 0
+    db.expire_all()
+    assert all(row.status == "sent" for row in db.query(NotificationJob))
+    assert len(pool._jobs) == 3
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.core.websocket import ConnectionManager
+
+
+class FakeWebSocket:
+    """Just enough of a Starlette WebSocket for the connection manager"""
+
+    def __init__(self):
+        self.scope = {}
+        self.query_params = {}
+        self.sent = []
+        self.incoming = asyncio.Queue()
+        self.close_code = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, frame):
+        self.sent.append(json.loads(frame))
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+    def reply(self, message):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+
+
+async def connected():
+    manager = ConnectionManager()
+    websocket = FakeWebSocket()
+    connection_id = await manager.connect("user-1", websocket)
+    return manager, websocket, manager.active_connections[connection_id]
+
+
+async def turn_wheel(manager):
+    # One full turn reaches every scheduled check
+    for _ in range(manager._wheel_size):
+        manager._heartbeat_tick()
+    await asyncio.sleep(0.01)
+
+
+def pings(websocket):
+    return [frame for frame in websocket.sent if frame["type"] == "ping"]
+
+
+@pytest.mark.asyncio
+async def test_active_connections_are_not_pinged():
+    manager, websocket, connection = await connected()
+
+    await turn_wheel(manager)
+
+    assert pings(websocket) == []
+    assert connection.connection_id in manager.active_connections
+
+
+@pytest.mark.asyncio
+async def test_idle_connection_answering_the_ping_is_kept():
+    manager, websocket, connection = await connected()
+    connection.last_activity -= settings.WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS
+
+    await turn_wheel(manager)
+    assert len(pings(websocket)) == 1
+
+    websocket.reply({"type": "pong"})
+    assert await manager.receive(websocket, connection.connection_id) == {"type": "pong"}
+    assert connection.ping_sent_at is None
+
+    await turn_wheel(manager)
+    assert connection.connection_id in manager.active_connections
+    assert manager.idle_connections_reaped == 0
+
+
+@pytest.mark.asyncio
+async def test_unanswered_ping_closes_the_connection():
+    manager, websocket, connection = await connected()
+    connection.last_activity -= settings.WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS
+
+    await turn_wheel(manager)
+    assert len(pings(websocket)) == 1
+
+    # No reply within the timeout
+    connection.ping_sent_at -= settings.WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS
+    await turn_wheel(manager)
+
+    assert connection.connection_id not in manager.active_connections
+    assert manager.user_connections == {}
+    assert manager.idle_connections_reaped == 1
+    assert websocket.close_code == 1001
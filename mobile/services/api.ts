@@ -179,6 +179,11 @@ export const createWebSocketConnection = (userId: string, onMessage: (data: any)
   ws.onmessage = (event) => {
     try {
       const data = JSON.parse(event.data);
+      // The server closes connections that leave its heartbeat unanswered
+      if (data.type === 'ping') {
+        ws.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
       onMessage(data);
     } catch (error) {
       console.error('Error parsing WebSocket message:', error);